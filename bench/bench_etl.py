@@ -0,0 +1,232 @@
+"""
+Benchmark da carga sem produção: mock do CVDW (bench.mock_cvdw) + destino
+fake (bench.sink) ou MySQL local. Cenários isolam cada estágio:
+
+    fetch      etl_http.fetch_pages contra o mock (rede, gzip, concorrência)
+    normalize  transform dos runners em páginas já decodificadas
+    upsert     upsert_rows_stats das tabelas já normalizadas no destino
+    e2e        run_paged_load completo (mock -> pipeline -> destino)
+
+    python -m bench.bench_etl [--endpoints reservas,precadastros,visitas]
+                              [--scenarios fetch,normalize,upsert,e2e]
+                              [--pages 20] [--page-size 450] [--latency-ms 50]
+                              [--sink fake|mysql] [--init-schema]
+                              [--out bench/results/<data>.json] [--baseline arquivo.json]
+
+Com --sink mysql a carga vai para o MySQL de MYSQL_HOST/MYSQL_DB: use só um
+banco local de benchmark (--init-schema roda database/CVCRM.sql nele).
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import etl_dimensions
+from bench.mock_cvdw import RUNNERS, MockCVDW, synthetic_page
+from bench.sink import SinkStats, init_mysql, load_schema, sink_factory
+from etl_http import HttpStats, close_session, fetch_pages
+from etl_utils import MySQLPool, upsert_rows_stats
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(RESULTS_DIR))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _result(scenario: str, endpoint: str, seconds: float, records: int, pages: int, **extra: Any) -> Dict[str, Any]:
+    return {
+        "scenario": scenario,
+        "endpoint": endpoint,
+        "seconds": round(seconds, 4),
+        "pages": pages,
+        "records": records,
+        "records_per_s": round(records / seconds, 1) if seconds > 0 else None,
+        **extra,
+    }
+
+
+# -----------------------------------------------------------------------------
+# Cenários
+# -----------------------------------------------------------------------------
+def bench_fetch(runner, endpoint: str, mock: MockCVDW, args: argparse.Namespace) -> Dict[str, Any]:
+    ep = runner.ENDPOINT
+    ep.stats = HttpStats()
+    t0 = time.perf_counter()
+    pages = records = 0
+    gen = fetch_pages(ep, {"registros_por_pagina": args.page_size})
+    try:
+        for _, data in gen:
+            pages += 1
+            records += len(data.get("dados") or [])
+    finally:
+        gen.close()
+    http = ep.stats.snapshot()
+    return _result("fetch", endpoint, time.perf_counter() - t0, records, pages,
+                   http_p95_ms=http["p95_ms"], mb_wire=round(http["bytes_wire"] / 2 ** 20, 2),
+                   concurrency=ep.concurrency)
+
+
+def bench_normalize(runner, endpoint: str, pages: List[List[Dict[str, Any]]],
+                    args: argparse.Namespace) -> Dict[str, Any]:
+    best = float("inf")
+    rows = 0
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        out = [runner.transform(dados) for dados in pages]
+        best = min(best, time.perf_counter() - t0)
+        rows = sum(len(v) for tables in out for v in tables.values())
+    return _result("normalize", endpoint, best, sum(len(p) for p in pages), len(pages), rows=rows,
+                   repeat=args.repeat)
+
+
+def bench_upsert(runner, endpoint: str, pages: List[List[Dict[str, Any]]], pool: MySQLPool,
+                 sink: Optional[SinkStats], args: argparse.Namespace) -> Dict[str, Any]:
+    tables = [runner.transform(dados) for dados in pages]
+    before = sink.snapshot()["statements"] if sink else 0
+    t0 = time.perf_counter()
+    rows = errors = 0
+    for page_tables in tables:
+        for name, page_rows in page_tables.items():
+            spec = runner.SPECS[name]
+            stats = upsert_rows_stats(pool, name, page_rows, list(spec.pk), columns=spec.column_names,
+                                      skip_unchanged=args.row_hash)
+            rows += stats.rows
+            errors += stats.errors
+    elapsed = time.perf_counter() - t0
+    extra = {"rows": rows, "rows_per_s": round(rows / elapsed, 1) if elapsed > 0 else None, "errors": errors}
+    if sink:
+        extra["statements"] = sink.snapshot()["statements"] - before
+    return _result("upsert", endpoint, elapsed, sum(len(p) for p in pages), len(pages), **extra)
+
+
+def bench_e2e(runner, endpoint: str, pool: MySQLPool, args: argparse.Namespace) -> Dict[str, Any]:
+    from etl_pipeline import LoadOptions, run_paged_load
+    t0 = time.perf_counter()
+    totals = run_paged_load(f"bench_{endpoint}", runner.ENDPOINT, {"registros_por_pagina": args.page_size},
+                            runner.transform, runner.SPECS, logger=runner.log, pool=pool,
+                            options=LoadOptions(resume=False, upsert_mode=args.upsert_mode,
+                                                watermark=(next(s.name for s in runner.SPECS.values() if not s.array),
+                                                           runner.WATERMARK_COLUMN),
+                                                dimensions=runner.DIMENSIONS))
+    elapsed = time.perf_counter() - t0
+    http = runner.ENDPOINT.stats.snapshot()
+    return _result("e2e", endpoint, elapsed, http["records"], http["requests"], rows=totals.rows,
+                   rows_per_s=round(totals.rows / elapsed, 1) if elapsed > 0 else None, errors=totals.errors)
+
+
+# -----------------------------------------------------------------------------
+# Baseline
+# -----------------------------------------------------------------------------
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf8") as f:
+        baseline = {(r["scenario"], r["endpoint"]): r for r in json.load(f)["results"]}
+    print(f"\nComparação com {baseline_path} (registros/s, atual / baseline):")
+    for r in results:
+        b = baseline.get((r["scenario"], r["endpoint"]))
+        if not b or not b.get("records_per_s") or not r.get("records_per_s"):
+            print(f"  {r['scenario']:10s} {r['endpoint']:13s} sem baseline")
+            continue
+        ratio = r["records_per_s"] / b["records_per_s"]
+        print(f"  {r['scenario']:10s} {r['endpoint']:13s} {r['records_per_s']:>12.1f} / {b['records_per_s']:>12.1f}"
+              f"  {ratio:5.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", default=",".join(RUNNERS))
+    parser.add_argument("--scenarios", default="fetch,normalize,upsert,e2e")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=450)
+    parser.add_argument("--children", type=int, default=3, help="média de itens por array de campos adicionais")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="latência do mock por página")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--sink", choices=("fake", "mysql"), default="fake")
+    parser.add_argument("--sink-latency-ms", type=float, default=0.5, help="custo por statement/commit no sink fake")
+    parser.add_argument("--init-schema", action="store_true", help="roda database/CVCRM.sql no MySQL antes")
+    parser.add_argument("--upsert-mode", default=None, help="batch/row/bulk (padrão: UPSERT_MODE)")
+    parser.add_argument("--row-hash", action="store_true", help="upsert com filtro de linhas inalteradas")
+    parser.add_argument("--dimensions", action="store_true", help="e2e com o estágio de dimensões (CVCRM_DIMENSIONS)")
+    parser.add_argument("--strip-names", action="store_true", help="com --dimensions, tira os nomes dos fatos")
+    parser.add_argument("--repeat", type=int, default=3, help="rodadas do cenário normalize (melhor de N)")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    runners = {e: importlib.import_module(RUNNERS[e]) for e in endpoints}
+    if not args.verbose:
+        for runner in runners.values():
+            runner.log.setLevel(logging.WARNING)
+        logging.getLogger("etl_http").setLevel(logging.WARNING)
+
+    etl_dimensions.CVCRM_DIMENSIONS = args.dimensions
+    etl_dimensions.DIM_STRIP_NAMES = args.strip_names
+    sink: Optional[SinkStats] = None
+    if args.sink == "fake":
+        sink = SinkStats()
+        pool = MySQLPool(factory=sink_factory(sink, args.sink_latency_ms))
+    else:
+        pool = MySQLPool()
+        if args.init_schema:
+            with pool.connection() as conn:
+                print(f"DDL: {init_mysql(conn)} statement(s) de database/CVCRM.sql")
+
+    results: List[Dict[str, Any]] = []
+    schema = load_schema()
+    with MockCVDW(args.pages, args.latency_ms, args.jitter_ms, args.children) as mock:
+        for endpoint, runner in runners.items():
+            runner.ENDPOINT.url = mock.url(endpoint)
+            runner.ENDPOINT.page_size = args.page_size
+            runner.ENDPOINT.adaptive_page_size = False
+            mock.warm(endpoint, args.page_size)
+            pages = [synthetic_page(endpoint, p, args.page_size, args.children, schema)
+                     for p in range(1, args.pages + 1)] if {"normalize", "upsert"} & set(scenarios) else []
+            runs: Dict[str, Callable[[], Dict[str, Any]]] = {
+                "fetch": lambda: bench_fetch(runner, endpoint, mock, args),
+                "normalize": lambda: bench_normalize(runner, endpoint, pages, args),
+                "upsert": lambda: bench_upsert(runner, endpoint, pages, pool, sink, args),
+                "e2e": lambda: bench_e2e(runner, endpoint, pool, args),
+            }
+            for scenario in scenarios:
+                r = runs[scenario]()
+                results.append(r)
+                print(f"{r['scenario']:10s} {r['endpoint']:13s} {r['seconds']:8.3f}s  {r['records']:>8} registros"
+                      f"  {r['records_per_s'] or 0:>12.1f} reg/s  "
+                      + " ".join(f"{k}={v}" for k, v in r.items() if k not in ("scenario", "endpoint", "seconds",
+                                                                                "records", "records_per_s")))
+    close_session()
+    pool.close()
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "verbose")},
+        "sink": sink.snapshot() if sink else "mysql",
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nResultados em {out}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
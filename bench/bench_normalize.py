@@ -0,0 +1,83 @@
+"""
+Microbenchmark da normalização de cv_reservas: normalize_rows antigo (dict
+por registro) x SPEC_RESERVAS compilado (tuplas na ordem das colunas).
+
+    python -m bench.bench_normalize [--records 10000] [--repeat 5]
+"""
+import argparse
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+from bench import legacy_reservas
+from etl_dates import clear_cache, date_stats
+from run_reservas import SPEC_RESERVAS
+
+
+def synthetic_records(n: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Registros no formato do CVDW (tudo string, alguns vazios/nulos)."""
+    rnd = random.Random(seed)
+    records = []
+    for i in range(1, n + 1):
+        it: Dict[str, Any] = {}
+        for c in SPEC_RESERVAS.columns:
+            r = rnd.random()
+            if r < 0.1:
+                it[c.key] = None
+                continue
+            if r < 0.15:
+                it[c.key] = ""
+                continue
+            if c.type == "datetime":
+                it[c.key] = f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00"
+            elif c.type == "date":
+                it[c.key] = f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+            elif c.type in ("int", "bigint"):
+                it[c.key] = str(rnd.randint(1, 10 ** 6))
+            elif c.type == "decimal":
+                it[c.key] = f"{rnd.uniform(0, 10 ** 6):.2f}"
+            else:
+                it[c.key] = f"{c.name}-{rnd.randint(1, 999)}"
+        it["idreserva"] = i
+        records.append(it)
+    return records
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    dados = synthetic_records(args.records)
+    SPEC_RESERVAS.compile()
+
+    # Mesma saída, só muda a forma (dict x tupla)
+    assert SPEC_RESERVAS.as_dicts(SPEC_RESERVAS.normalize(dados)) == legacy_reservas.normalize_rows(dados)
+
+    def compiled_cold():
+        # Cache de datas vazio a cada rodada: mede o parser, não só os hits
+        clear_cache()
+        SPEC_RESERVAS.normalize(dados)
+
+    legacy = best_of(lambda: legacy_reservas.normalize_rows(dados), args.repeat)
+    compiled = best_of(compiled_cold, args.repeat)
+    n = args.records
+    print(f"registros={n} colunas={len(SPEC_RESERVAS.columns)} (melhor de {args.repeat})")
+    print(f"  normalize_rows (dict):      {legacy * 1000:8.1f} ms  {n / legacy:10.0f} reg/s")
+    print(f"  SPEC_RESERVAS (compilado):  {compiled * 1000:8.1f} ms  {n / compiled:10.0f} reg/s")
+    print(f"  ganho: {legacy / compiled:.2f}x")
+    print(f"  datas: {date_stats()}")
+
+
+if __name__ == "__main__":
+    main()
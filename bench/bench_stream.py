@@ -0,0 +1,74 @@
+"""
+Pico de memória ao processar uma página de reservas: `json.loads` do corpo
+inteiro + normalização x JsonObjectStream normalizando registro a registro.
+
+    python -m bench.bench_stream [--sizes 450,2000,10000]
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from bench.bench_normalize import synthetic_records
+from etl_stream import JsonObjectStream
+from run_reservas import transform
+
+CHUNK = 65536
+
+
+def synthetic_body(n: int) -> bytes:
+    """Página no formato do CVDW, com os arrays de campos adicionais."""
+    rnd = random.Random(n)
+    dados = synthetic_records(n)
+    for it in dados:
+        it["campos_adicionais"] = [
+            {"idcampo_valores": str(rnd.randint(1, 10 ** 6)), "idcampo": "7", "nome": "Campo", "valor": "x" * 40,
+             "tipo": "texto", "referencia_data": "2024-01-02 03:04:05"} for _ in range(rnd.randint(0, 6))]
+        it["campos_adicionais_contrato"] = [
+            {"idreservacontratocampoadicional": str(rnd.randint(1, 10 ** 6)), "nome": "Contrato", "valor": "y" * 40}
+            for _ in range(rnd.randint(0, 3))]
+    return json.dumps({"total_de_paginas": 1, "dados": dados}).encode()
+
+
+def chunks(body: bytes) -> List[bytes]:
+    return [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+
+
+def whole(parts: List[bytes]) -> Dict[str, Any]:
+    data = json.loads(b"".join(parts))
+    return transform(data.get("dados") or [])
+
+
+def streamed(parts: List[bytes]) -> Dict[str, Any]:
+    return transform(JsonObjectStream(iter(parts)))
+
+
+def measure(fn: Callable[[List[bytes]], Dict[str, Any]], parts: List[bytes]) -> Tuple[float, float, int]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(parts)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20, sum(len(v) for v in out.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="450,2000,10000")
+    args = parser.parse_args()
+
+    for n in (int(x) for x in args.sizes.split(",")):
+        parts = chunks(synthetic_body(n))
+        assert whole(parts) == streamed(parts)
+        size = sum(len(p) for p in parts) / 2 ** 20
+        print(f"registros={n} corpo={size:.1f} MiB")
+        for label, fn in (("json.loads + normalize", whole), ("stream + normalize", streamed)):
+            elapsed, peak, rows = measure(fn, parts)
+            print(f"  {label:24s} pico={peak:7.1f} MiB  {elapsed * 1000:8.1f} ms  linhas={rows}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Cópia do normalize_rows de run_reservas.py antes do TableSpec (dict literal
++ helpers to_*_safe por registro), mantida só como referência do benchmark.
+"""
+import logging
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+log = logging.getLogger("bench.legacy_reservas")
+
+
+DATE_PATTERNS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+
+def to_datetime_safe(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    for fmt in DATE_PATTERNS:
+        try:
+            return datetime.strptime(s, fmt)
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def to_date_safe(s: Optional[str]) -> Optional[date]:
+    dt = to_datetime_safe(s)
+    return dt.date() if dt else None
+
+
+def to_int_safe(v: Any) -> Optional[int]:
+    if v is None or v == "":
+        return None
+    try:
+        return int(v)
+    except (ValueError, TypeError):
+        return None
+
+
+def to_bigint_safe(v: Any) -> Optional[int]:
+    return to_int_safe(v)
+
+
+def to_decimal_safe(v: Any) -> Optional[Decimal]:
+    if v is None or v == "":
+        return None
+    try:
+        return Decimal(str(v))
+    except Exception:
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Normalização — base (cv_reservas)
+# -----------------------------------------------------------------------------
+def normalize_rows(dados: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for it in dados or []:
+        idreserva = it.get("idreserva")
+        if not idreserva:
+            log.error("Registro sem idreserva: %s", it)
+            continue
+
+        row: Dict[str, Any] = {
+            # PK
+            "idreserva": idreserva,
+
+            # Campos do schema
+            "referencia": it.get("referencia"),
+            "referencia_data": to_datetime_safe(it.get("referencia_data")),
+            "ativo": (it.get("ativo") or None),
+
+            "codigointerno": it.get("codigointerno"),
+            "numero_venda": it.get("numero_venda"),
+            "aprovada": it.get("aprovada"),
+
+            "data_cad": to_datetime_safe(it.get("data_cad")),
+            "data_venda": to_datetime_safe(it.get("data_venda")),
+            "situacao": it.get("situacao"),
+            "idsituacao": to_int_safe(it.get("idsituacao")),
+            "situacao_comercial": it.get("situacao_comercial"),
+
+            "idempreendimento": to_bigint_safe(it.get("idempreendimento")),
+            "codigointerno_empreendimento": it.get("codigointerno_empreendimento"),
+            "empreendimento": it.get("empreendimento"),
+
+            "data_entrega_chaves_contrato_cliente": to_date_safe(it.get("data_entrega_chaves_contrato_cliente")),
+            "etapa": it.get("etapa"),
+            "bloco": it.get("bloco"),
+            "unidade": it.get("unidade"),
+            "regiao": it.get("regiao"),
+            "venda": it.get("venda"),
+
+            "idcliente": to_bigint_safe(it.get("idcliente")),
+            "documento_cliente": it.get("documento_cliente"),
+            "cliente": it.get("cliente"),
+            "email": it.get("email"),
+            "cidade": it.get("cidade"),
+            "cep_cliente": it.get("cep_cliente"),
+
+            "renda": to_decimal_safe(it.get("renda")),
+            "sexo": it.get("sexo"),
+            "idade": to_int_safe(it.get("idade")),
+            "estado_civil": it.get("estado_civil"),
+
+            "idcorretor": to_bigint_safe(it.get("idcorretor")),
+            "corretor": it.get("corretor"),
+
+            "idimobiliaria": to_bigint_safe(it.get("idimobiliaria")),
+            "imobiliaria": it.get("imobiliaria"),
+
+            "idtime": to_int_safe(it.get("idtime")),
+            "nome_time": it.get("nome_time"),
+
+            "valor_contrato": to_decimal_safe(it.get("valor_contrato")),
+            "vencimento": to_datetime_safe(it.get("vencimento")),
+            "campanha": it.get("campanha"),
+            "cessao": it.get("cessao"),
+            "motivo_cancelamento": it.get("motivo_cancelamento"),
+            "data_cancelamento": to_datetime_safe(it.get("data_cancelamento")),
+            "espacos_complementares": it.get("espacos_complementares"),
+
+            "idlead": it.get("idlead"),
+            "data_ultima_alteracao_situacao": to_datetime_safe(it.get("data_ultima_alteracao_situacao")),
+
+            "idempresa_correspondente": to_bigint_safe(it.get("idempresa_correspondente")),
+            "empresa_correspondente": it.get("empresa_correspondente"),
+
+            "valor_fgts": to_decimal_safe(it.get("valor_fgts")),
+            "valor_financiamento": to_decimal_safe(it.get("valor_financiamento")),
+            "valor_subsidio": to_decimal_safe(it.get("valor_subsidio")),
+
+            "nome_usuario": it.get("nome_usuario"),
+            "idunidade": to_bigint_safe(it.get("idunidade")),
+            "idprecadastro": to_bigint_safe(it.get("idprecadastro")),
+            "idmidia": to_bigint_safe(it.get("idmidia")),
+            "midia": it.get("midia"),
+            "descricao_motivo_cancelamento": it.get("descricao_motivo_cancelamento"),
+
+            "idsituacao_anterior": to_int_safe(it.get("idsituacao_anterior")),
+            "situacao_anterior": it.get("situacao_anterior"),
+
+            "idtabela": to_bigint_safe(it.get("idtabela")),
+            "nometabela": it.get("nometabela"),
+            "codigointernotabela": it.get("codigointernotabela"),
+            "idtipo_tabela": to_int_safe(it.get("idtipo_tabela")),
+            "tipo_tabela": it.get("tipo_tabela"),
+
+            "data_contrato": to_date_safe(it.get("data_contrato")),
+            "valor_proposta": to_decimal_safe(it.get("valor_proposta")),
+            "vpl_reserva": to_decimal_safe(it.get("vpl_reserva")),
+            "vgv_tabela": to_decimal_safe(it.get("vgv_tabela")),
+            "vpl_tabela": to_decimal_safe(it.get("vpl_tabela")),
+
+            "usuario_aprovacao": it.get("usuario_aprovacao"),
+            "data_aprovacao": to_date_safe(it.get("data_aprovacao")),
+            "juros_condicao_aprovada": to_decimal_safe(it.get("juros_condicao_aprovada")),
+            "juros_apos_entrega_condicao_aprovada": to_decimal_safe(it.get("juros_apos_entrega_condicao_aprovada")),
+            "idtabela_condicao_aprovada": to_bigint_safe(it.get("idtabela_condicao_aprovada")),
+            "data_primeira_aprovacao": to_date_safe(it.get("data_primeira_aprovacao")),
+            "aprovacao_absoluto": to_decimal_safe(it.get("aprovacao_absoluto")),
+            "aprovacao_vpl_valor": to_decimal_safe(it.get("aprovacao_vpl_valor")),
+
+            "idtipovenda": to_int_safe(it.get("idtipovenda")),
+            "tipovenda": it.get("tipovenda"),
+            "idgrupo": to_int_safe(it.get("idgrupo")),
+            "grupo": it.get("grupo"),
+
+            "data_modificacao": to_datetime_safe(it.get("data_modificacao")),
+        }
+
+        rows.append(row)
+    return rows
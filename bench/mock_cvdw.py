@@ -0,0 +1,220 @@
+"""
+Servidor local que imita o CVDW para o benchmark: GET/POST em /<endpoint>
+(reservas, precadastros, visitas) com pagina/registros_por_pagina, devolvendo
+páginas sintéticas com as chaves que os TableSpec dos runners leem (e os
+arrays de campos adicionais), latência configurável e gzip.
+
+    python -m bench.mock_cvdw [--port 8099] [--pages 20] [--latency-ms 80]
+
+Aponte URL_RESERVAS/URL_PRECADASTROS/URL_VISITAS para http://127.0.0.1:<port>/<endpoint>.
+"""
+import argparse
+import gzip
+import importlib
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+from bench.sink import load_schema
+from etl_schema import TableSpec
+
+# endpoint -> módulo do runner (SPECS, ENDPOINT, transform)
+RUNNERS = {
+    "reservas": "run_reservas",
+    "precadastros": "run_precadastros",
+    "visitas": "run_visitas",
+}
+
+
+def _length(sql_type: str) -> int:
+    if "(" in sql_type and sql_type.startswith(("VARCHAR", "CHAR")):
+        return int(sql_type[sql_type.index("(") + 1:sql_type.index(")")])
+    return 64
+
+
+def _value(rnd: random.Random, spec: TableSpec, column, sql_types: Dict[str, str], serial: int) -> Any:
+    if column.name in spec.pk:
+        return str(serial)
+    r = rnd.random()
+    if r < 0.08:
+        return None
+    if r < 0.12:
+        return ""
+    t = column.type
+    if t == "datetime":
+        return f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00"
+    if t == "date":
+        return f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+    if t in ("int", "bigint"):
+        return str(rnd.randint(1, 10 ** 6))
+    if t == "decimal":
+        return f"{rnd.uniform(0, 10 ** 6):.2f}"
+    if t == "sn":
+        return rnd.choice(("S", "N"))
+    return f"{column.name}-{rnd.randint(1, 999)}"[:_length(sql_types.get(column.name, ""))]
+
+
+def synthetic_page(endpoint: str, page: int, size: int, children: int = 3,
+                   schema: Optional[Dict[str, Dict[str, str]]] = None, dim_members: int = 200) -> List[Dict[str, Any]]:
+    """
+    Registros da página `page` de `endpoint`: PKs sequenciais (página x
+    tamanho), referencia_data crescente, ids das dimensões entre 1 e
+    `dim_members`, de 0 a 3 leads separados por vírgula nas chaves das
+    pontes (TableSpec.split) e, por registro, até `children`*2 itens em
+    cada array de tabela filha. Determinístico por (endpoint, página, tamanho).
+    """
+    runner = importlib.import_module(RUNNERS[endpoint])
+    specs: Dict[str, TableSpec] = runner.SPECS
+    schema = schema if schema is not None else load_schema()
+    base = next(s for s in specs.values() if not s.array)
+    arrays = [s for s in specs.values() if s.array and not s.split]
+    splits = [s for s in specs.values() if s.split]
+    # Colunas de dimensão: poucos ids, sempre com o mesmo nome (como no CRM)
+    keys = {c.name: c.key for c in base.columns}
+    dims = [(keys[r.id_column], keys[r.name_column], r.dimension.table)
+            for r in getattr(runner, "DIMENSIONS", []) if r.table == base.name]
+    rnd = random.Random(f"{endpoint}:{page}:{size}")
+    first = (page - 1) * size
+    records = []
+    for i in range(size):
+        serial = first + i + 1
+        it = {c.key: _value(rnd, base, c, schema.get(base.name, {}), serial) for c in base.columns}
+        for id_key, name_key, label in dims:
+            member = rnd.randint(1, dim_members)
+            it[id_key], it[name_key] = str(member), f"{label} {member}"
+        for spec in splits:
+            it[spec.array] = spec.split.join(str(rnd.randint(1, 10 ** 5)) for _ in range(rnd.randint(0, 3))) or None
+        # Crescente como no filtro incremental do CVDW (watermark)
+        it["referencia_data"] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1704067200 + serial * 60))
+        for spec in arrays:
+            own = [c for c in spec.columns if not c.parent]
+            it[spec.array] = [{c.key: _value(rnd, spec, c, schema.get(spec.name, {}), serial * 100 + k)
+                               for c in own} for k in range(rnd.randint(0, 2 * children))]
+        records.append(it)
+    return records
+
+
+class MockCVDW:
+    """
+    Servidor HTTP em thread própria. `pages` fixa total_de_paginas;
+    cada resposta espera `latency_ms` (+ até `jitter_ms`) antes de sair.
+    Os corpos (e o gzip) ficam em cache: o servidor não vira o gargalo.
+    """
+
+    def __init__(self, pages: int = 20, latency_ms: float = 0.0, jitter_ms: float = 0.0, children: int = 3,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.pages = pages
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.children = children
+        self.requests = 0
+        self.bytes_sent = 0
+        self._schema = load_schema()
+        self._lock = threading.Lock()
+        self._body = lru_cache(maxsize=512)(self._render)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint}"
+
+    def _render(self, endpoint: str, page: int, size: int, compressed: bool) -> bytes:
+        dados = synthetic_page(endpoint, page, size, self.children, self._schema) if page <= self.pages else []
+        body = json.dumps({"pagina": page, "registros": len(dados), "total_de_paginas": self.pages,
+                           "dados": dados}).encode("utf8")
+        return gzip.compress(body, 6) if compressed else body
+
+    def warm(self, endpoint: str, size: int) -> None:
+        """Renderiza as páginas antes da medição (com e sem gzip)."""
+        for page in range(1, self.pages + 2):
+            for compressed in (False, True):
+                self._body(endpoint, page, size, compressed)
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _params(self) -> Tuple[str, Dict[str, Any]]:
+                url = urlparse(self.path)
+                params: Dict[str, Any] = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    params.update(json.loads(self.rfile.read(length) or b"{}"))
+                return url.path.strip("/").split("/")[-1], params
+
+            def do_GET(self):
+                endpoint, params = self._params()
+                if endpoint not in RUNNERS:
+                    self.send_error(404)
+                    return
+                compressed = "gzip" in (self.headers.get("Accept-Encoding") or "")
+                body = mock._body(endpoint, int(params.get("pagina") or 1),
+                                  int(params.get("registros_por_pagina") or 450), compressed)
+                if mock.latency or mock.jitter:
+                    time.sleep(mock.latency + random.uniform(0, mock.jitter))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if compressed:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with mock._lock:
+                    mock.requests += 1
+                    mock.bytes_sent += len(body)
+
+            do_POST = do_GET
+
+        return Handler
+
+    def start(self) -> "MockCVDW":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-cvdw", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MockCVDW":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--children", type=int, default=3, help="média de itens por array de campos adicionais")
+    args = parser.parse_args()
+
+    mock = MockCVDW(args.pages, args.latency_ms, args.jitter_ms, args.children, port=args.port)
+    print(f"Mock CVDW em {mock.base_url}/<{'|'.join(RUNNERS)}> ({args.pages} páginas, {args.latency_ms} ms)")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
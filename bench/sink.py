@@ -0,0 +1,196 @@
+"""
+Destino das cargas no benchmark: uma conexão DB-API de mentira (`SinkConnection`)
+que valida tabelas/colunas contra database/CVCRM.sql, conta statements, linhas
+e bytes e simula a latência do servidor; ou um MySQL local de verdade,
+inicializado com o mesmo DDL (`init_mysql`).
+
+O sink se comporta como um banco vazio: todo SELECT volta sem linhas (nenhum
+hash gravado, nenhum watermark), então toda linha conta como inserida.
+"""
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pymysql
+from pymysql.converters import escape_item
+
+SCHEMA_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "CVCRM.sql")
+
+_CREATE_RE = re.compile(r"CREATE TABLE IF NOT EXISTS\s+(?:`\w+`\.)?`(\w+)`\s*\((.*?)\)\s*ENGINE", re.S | re.I)
+_COLUMN_RE = re.compile(r"^\s*`(\w+)`\s+([A-Z]+(?:\(\d+(?:,\s*\d+)?\))?)", re.M)
+_INSERT_RE = re.compile(r"^\s*INSERT INTO\s+([\w.`]+)\s*\(([^)]*)\)\s*(VALUES|SELECT)", re.I)
+_STAGING_RE = re.compile(r"^\s*(?:LOAD DATA LOCAL INFILE\s+'([^']*)'.*INTO TABLE\s+(\w+)|DELETE FROM\s+(_stg_\w+))", re.I | re.S)
+
+
+def load_schema(path: str = SCHEMA_SQL) -> Dict[str, Dict[str, str]]:
+    """Tabelas do DDL -> {coluna: tipo SQL} (ex.: "VARCHAR(64)")."""
+    with open(path, encoding="utf8") as f:
+        sql = f.read()
+    return {m.group(1): {c: t.upper() for c, t in _COLUMN_RE.findall(m.group(2))} for m in _CREATE_RE.finditer(sql)}
+
+
+def _bare(table: str) -> str:
+    return table.replace("`", "").split(".")[-1]
+
+
+class SinkStats:
+    """Contadores somados por todas as conexões do sink."""
+
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.bytes = 0
+        self.latency_seconds = 0.0
+        self.rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, table: Optional[str], rows: int, nbytes: int, latency: float) -> None:
+        with self._lock:
+            self.statements += 1
+            self.bytes += nbytes
+            self.latency_seconds += latency
+            if table:
+                self.rows[table] = self.rows.get(table, 0) + rows
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "statements": self.statements,
+                "commits": self.commits,
+                "rollbacks": self.rollbacks,
+                "sql_mb": round(self.bytes / 2 ** 20, 2),
+                "latency_s": round(self.latency_seconds, 3),
+                "rows": dict(self.rows),
+            }
+
+
+class SinkCursor:
+    def __init__(self, conn: "SinkConnection"):
+        self.conn = conn
+        self.rowcount = -1
+        self._rows: List[Tuple[Any, ...]] = []
+        self._result = None
+
+    def __enter__(self) -> "SinkCursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._rows = []
+
+    def mogrify(self, query: str, args: Optional[Sequence[Any]] = None) -> str:
+        if args is None:
+            return query
+        return query % tuple(self.conn.literal(a) for a in args)
+
+    def execute(self, query: str, args: Optional[Sequence[Any]] = None) -> int:
+        sql = self.mogrify(query, args)
+        self._rows, self._result = [], None
+        table, rows = self.conn._apply(sql, args)
+        if sql.lstrip()[:6].upper() == "SELECT" and "@@max_allowed_packet" in sql:
+            self._rows = [(64 * 1024 * 1024,)]
+        if rows:
+            self._result = type("_Result", (), {"message": f"Records: {rows}  Duplicates: 0  Warnings: 0".encode()})()
+        self.conn._wait(table, rows, len(sql))
+        self.rowcount = rows
+        return rows
+
+    def executemany(self, query: str, args: Sequence[Sequence[Any]]) -> int:
+        return sum(self.execute(query, a) for a in args)
+
+    def fetchone(self) -> Optional[Tuple[Any, ...]]:
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self) -> List[Tuple[Any, ...]]:
+        rows, self._rows = self._rows, []
+        return rows
+
+
+class SinkConnection:
+    """
+    Conexão fake com o mínimo que etl_utils/etl_state usam. INSERTs em
+    tabelas do DDL com coluna desconhecida falham como no MySQL; cada
+    statement custa `latency` segundos (ida e volta ao servidor).
+    """
+
+    max_allowed_packet = 64 * 1024 * 1024
+
+    def __init__(self, stats: SinkStats, schema: Dict[str, Dict[str, str]], latency: float = 0.0):
+        self.stats = stats
+        self.schema = schema
+        self.latency = latency
+        self._staging: Dict[str, int] = {}
+
+    def cursor(self) -> SinkCursor:
+        return SinkCursor(self)
+
+    def literal(self, value: Any) -> str:
+        if isinstance(value, (bytes, bytearray)):
+            return "X'" + bytes(value).hex() + "'"
+        return escape_item(value, "utf8mb4")
+
+    def _apply(self, sql: str, args: Optional[Sequence[Any]]) -> Tuple[Optional[str], int]:
+        """(tabela, linhas) de um statement de escrita; (None, 0) para o resto."""
+        m = _INSERT_RE.match(sql)
+        if m:
+            table = _bare(m.group(1))
+            columns = self.schema.get(table)
+            if columns is not None:
+                unknown = [c.strip(" `") for c in m.group(2).split(",") if c.strip(" `") not in columns]
+                if unknown:
+                    raise pymysql.err.ProgrammingError(1054, f"Unknown column {unknown[0]!r} in '{table}'")
+            if m.group(3).upper() == "SELECT":
+                staging = re.search(r"FROM\s+(_stg_\w+)", sql)
+                return table, self._staging.get(staging.group(1), 0) if staging else 0
+            return table, sql.count("),(") + 1
+        m = _STAGING_RE.match(sql)
+        if m and m.group(1):
+            with open(args[0] if args else m.group(1), encoding="utf8") as f:
+                self._staging[m.group(2)] = sum(1 for _ in f)
+        elif m:
+            self._staging[m.group(3)] = 0
+        return None, 0
+
+    def _wait(self, table: Optional[str], rows: int, nbytes: int) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        self.stats.add(table, rows, nbytes, self.latency)
+
+    def commit(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self.stats._lock:
+            self.stats.commits += 1
+
+    def rollback(self) -> None:
+        with self.stats._lock:
+            self.stats.rollbacks += 1
+
+    def ping(self, reconnect: bool = False) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def sink_factory(stats: SinkStats, latency_ms: float = 0.0, schema_path: str = SCHEMA_SQL):
+    """Factory de conexões para `MySQLPool(factory=...)`."""
+    schema = load_schema(schema_path)
+    return lambda: SinkConnection(stats, schema, latency_ms / 1000.0)
+
+
+def init_mysql(connection, schema_path: str = SCHEMA_SQL) -> int:
+    """Roda o DDL de database/CVCRM.sql numa conexão MySQL (banco local de benchmark)."""
+    with open(schema_path, encoding="utf8") as f:
+        sql = re.sub(r"^--.*$", "", f.read(), flags=re.M)
+    statements = [s.strip() for s in sql.split(";") if s.strip()]
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    connection.commit()
+    return len(statements)
@@ -310,3 +310,124 @@ CREATE TABLE IF NOT EXISTS `cv_visitas` (
   KEY `idx_visitas_idtipo`           (`idtipo_visita`),
   KEY `idx_visitas_idemp`            (`idempreendimento`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+-- -----------------------------------------------------
+-- Pontes de lead (opt-in, LOAD_LEADS=1): um (id, idlead) por linha. O idlead das
+-- bases fica como a API manda ("62682,65286"); a carga separa os valores e
+-- mantém a ponte em sincronia com cada lote (lead removido some daqui).
+-- Funil por lead com busca no índice, sem FIND_IN_SET/LIKE:
+--   SELECT ... FROM cv_visitas_lead vl
+--     JOIN cv_precadastros_lead pl ON pl.idlead = vl.idlead
+--     JOIN cv_reservas_lead rl     ON rl.idlead = vl.idlead
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `cv_reservas_lead` (
+  `idreserva`      BIGINT       NOT NULL,
+  `idlead`         VARCHAR(64)  NOT NULL,
+  `created_at`     TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idreserva`, `idlead`),
+  KEY `idx_reservas_lead_idlead`     (`idlead`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `cv_precadastros_lead` (
+  `idprecadastro`  BIGINT       NOT NULL,
+  `idlead`         VARCHAR(64)  NOT NULL,
+  `created_at`     TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idprecadastro`, `idlead`),
+  KEY `idx_pre_lead_idlead`          (`idlead`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `cv_visitas_lead` (
+  `idtarefa`       BIGINT       NOT NULL,
+  `idlead`         VARCHAR(64)  NOT NULL,
+  `created_at`     TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idtarefa`, `idlead`),
+  KEY `idx_visitas_lead_idlead`      (`idlead`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+-- -----------------------------------------------------
+-- Particionamento opcional (etl_partitions / run_partitions.py): cv_reservas
+-- e cv_visitas por mês de data_cad (RANGE COLUMNS), com partições criadas
+-- à frente e as mais antigas que PARTITION_HOT_MONTHS movidas para
+-- <tabela>_arquivo. O MySQL exige a coluna de partição em toda chave única,
+-- então a PK passa a ser (id, data_cad) e data_cad vira NOT NULL: liste a
+-- tabela em PARTITIONED_TABLES para os runners descartarem registro sem
+-- data_cad. Se o CRM corrigir a data_cad de um registro, o upsert grava uma
+-- segunda linha em vez de atualizar a antiga (ver run_partitions.py).
+-- O DDL acima fica como está; a conversão é feita por
+--   python run_partitions.py --enable [--dry-run]
+-- e gera, por exemplo:
+--   ALTER TABLE cv_visitas MODIFY `data_cad` DATETIME NOT NULL,
+--     DROP PRIMARY KEY, ADD PRIMARY KEY (`idtarefa`, `data_cad`)
+--     PARTITION BY RANGE COLUMNS(`data_cad`) (
+--       PARTITION p202410 VALUES LESS THAN ('2024-11-01'),
+--       ...
+--       PARTITION pmax VALUES LESS THAN (MAXVALUE));
+-- -----------------------------------------------------
+
+
+-- -----------------------------------------------------
+-- Dimensões (etl_dimensions, CVCRM_DIMENSIONS=1): último nome de cada id
+-- visto nas cargas. Com DIM_STRIP_NAMES=1 as colunas de nome dos fatos
+-- ficam NULL e o nome sai daqui (JOIN pelo id).
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `dim_empreendimento` (
+  `idempreendimento`  BIGINT  NOT NULL,
+  `nome`              VARCHAR(255) NULL,
+  `updated_at`        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idempreendimento`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `dim_corretor` (
+  `idcorretor`        BIGINT  NOT NULL,
+  `nome`              VARCHAR(255) NULL,
+  `updated_at`        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idcorretor`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `dim_imobiliaria` (
+  `idimobiliaria`     BIGINT  NOT NULL,
+  `nome`              VARCHAR(255) NULL,
+  `updated_at`        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idimobiliaria`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `dim_time` (
+  `idtime`            INT     NOT NULL,
+  `nome`              VARCHAR(255) NULL,
+  `updated_at`        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idtime`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `dim_midia` (
+  `idmidia`           BIGINT  NOT NULL,
+  `nome`              VARCHAR(255) NULL,
+  `updated_at`        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idmidia`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `dim_responsavel` (
+  `idresponsavel`     BIGINT  NOT NULL,
+  `nome`              VARCHAR(255) NULL,
+  `updated_at`        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`idresponsavel`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+--- CONTROLE DO ETL
+
+-- Hash do conteúdo normalizado de cada linha gravada (etl_utils.filter_changed,
+-- ROW_HASH_SKIP=1): linhas com hash igual não são reenviadas ao ON DUPLICATE
+-- KEY UPDATE. Só ligue com as tabelas de destino escritas apenas pelo ETL:
+-- UPDATE/DELETE feito por fora (correção manual, restore, arquivamento) não
+-- muda o hash e a linha não volta a ser gravada. Depois de mexer numa tabela
+-- por fora, ou para forçar uma regravação completa:
+--   DELETE FROM etl_row_hash WHERE tabela = '...'
+CREATE TABLE IF NOT EXISTS `etl_row_hash` (
+  `tabela`      VARCHAR(64)   NOT NULL,
+  `pk`          VARCHAR(191)  NOT NULL,                   -- valores da PK unidos por '|'
+  `row_hash`    BINARY(16)    NOT NULL,                   -- blake2b-128
+  `updated_at`  TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`tabela`, `pk`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
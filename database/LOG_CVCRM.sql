@@ -0,0 +1,132 @@
+-- -----------------------------------------------------
+-- Schema de logs/estado do ETL (LOG_DB, padrão `log_cvcrm`)
+-- As tabelas também são criadas sob demanda por etl_state.ensure_state_tables()
+-- e etl_metrics.ensure_metrics_tables() / etl_indexes.ensure_index_tables()
+-- -----------------------------------------------------
+CREATE SCHEMA IF NOT EXISTS `log_cvcrm` DEFAULT CHARACTER SET utf8mb4 ;
+USE `log_cvcrm` ;
+
+-- Watermark por endpoint: maior `referencia_data` já gravado (sync incremental)
+CREATE TABLE IF NOT EXISTS `etl_watermark` (
+  `endpoint`    VARCHAR(64)  NOT NULL,
+  `coluna`      VARCHAR(64)  NOT NULL,
+  `watermark`   DATETIME     NULL,
+  `updated_at`  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`endpoint`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Uma linha por execução de endpoint; `filters` guarda os parâmetros usados (retomada)
+CREATE TABLE IF NOT EXISTS `etl_run` (
+  `run_id`       CHAR(32)     NOT NULL,
+  `endpoint`     VARCHAR(64)  NOT NULL,
+  `filters`      TEXT         NULL,
+  `status`       VARCHAR(16)  NOT NULL,                 -- running/done/partial/failed
+  `total_pages`  INT          NULL,
+  `started_at`   DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `finished_at`  DATETIME     NULL,
+  PRIMARY KEY (`run_id`),
+  KEY `idx_run_endpoint` (`endpoint`, `started_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Checkpoint por página gravada (ou que falhou) em cada execução
+CREATE TABLE IF NOT EXISTS `etl_checkpoint` (
+  `endpoint`     VARCHAR(64)  NOT NULL,
+  `run_id`       CHAR(32)     NOT NULL,
+  `page`         INT          NOT NULL,
+  `status`       VARCHAR(16)  NOT NULL,                 -- done/failed
+  `rows`         INT          NULL,
+  `watermark`    DATETIME     NULL,                     -- maior valor da coluna de watermark na página
+  `attempts`     INT          NOT NULL DEFAULT 1,
+  `updated_at`   TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`endpoint`, `run_id`, `page`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Ajuste automático de registros_por_pagina por endpoint (entre execuções)
+CREATE TABLE IF NOT EXISTS `etl_tuning` (
+  `endpoint`       VARCHAR(64)  NOT NULL,
+  `page_size`      INT          NOT NULL,                 -- registros_por_pagina da próxima execução
+  `measured_size`  INT          NULL,                     -- tamanho usado na última execução
+  `records_per_s`  DOUBLE       NULL,                     -- vazão medida com measured_size
+  `direction`      TINYINT      NOT NULL DEFAULT 1,
+  `updated_at`     TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`endpoint`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Plano e andamento dos backfills em shards (run_backfill.py); cada shard
+-- roda como o endpoint "<endpoint>#<backfill_id[:8]>.<shard>" em etl_run
+CREATE TABLE IF NOT EXISTS `etl_backfill_shard` (
+  `backfill_id`  CHAR(32)     NOT NULL,
+  `endpoint`     VARCHAR(64)  NOT NULL,
+  `shard`        INT          NOT NULL,
+  `kind`         VARCHAR(8)   NOT NULL,                 -- date/pages
+  `filters`      TEXT         NULL,
+  `first_page`   INT          NULL,
+  `last_page`    INT          NULL,                     -- NULL = até o total de páginas
+  `status`       VARCHAR(16)  NOT NULL,                 -- pending/running/done/failed
+  `records`      INT          NULL,
+  `rows`         INT          NULL,
+  `seconds`      DOUBLE       NULL,
+  `attempts`     INT          NOT NULL DEFAULT 0,
+  `updated_at`   TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`backfill_id`, `shard`),
+  KEY `idx_backfill_endpoint` (`endpoint`, `updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Índices secundários derrubados por uma carga com --defer-indexes e ainda
+-- não recriados (etl_indexes); a definição fica aqui até o ALTER TABLE ... ADD
+CREATE TABLE IF NOT EXISTS `etl_deferred_index` (
+  `tabela`       VARCHAR(64)  NOT NULL,
+  `index_name`   VARCHAR(64)  NOT NULL,
+  `definition`   TEXT         NOT NULL,                 -- cláusula do ADD INDEX
+  `deferred_at`  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`tabela`, `index_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Métricas por execução (cada tentativa/--resume é uma linha; etl_metrics)
+CREATE TABLE IF NOT EXISTS `etl_run_metrics` (
+  `run_id`          CHAR(32)     NOT NULL,
+  `attempt`         CHAR(32)     NOT NULL,                 -- cada --resume grava uma linha nova
+  `endpoint`        VARCHAR(64)  NOT NULL,
+  `status`          VARCHAR(16)  NOT NULL,
+  `started_at`      DATETIME     NOT NULL,
+  `seconds`         DOUBLE       NOT NULL,
+  `pages`           INT          NOT NULL DEFAULT 0,
+  `pages_failed`    INT          NOT NULL DEFAULT 0,
+  `records`         INT          NOT NULL DEFAULT 0,       -- registros recebidos da API
+  `records_per_s`   DOUBLE       NULL,
+  `rows`            INT          NOT NULL DEFAULT 0,
+  `inserted`        INT          NOT NULL DEFAULT 0,
+  `updated`         INT          NOT NULL DEFAULT 0,
+  `unchanged`       INT          NOT NULL DEFAULT 0,
+  `skipped`         INT          NOT NULL DEFAULT 0,
+  `deleted`         INT          NOT NULL DEFAULT 0,
+  `errors`          INT          NOT NULL DEFAULT 0,       -- lotes de upsert com erro
+  `http_requests`   INT          NOT NULL DEFAULT 0,
+  `http_errors`     INT          NOT NULL DEFAULT 0,       -- tentativas com falha (retries + desistências)
+  `http_throttled`  INT          NOT NULL DEFAULT 0,
+  `http_timeouts`   INT          NOT NULL DEFAULT 0,
+  `bytes_wire`      BIGINT       NOT NULL DEFAULT 0,
+  `bytes_decoded`   BIGINT       NOT NULL DEFAULT 0,
+  `http_avg_ms`     DOUBLE       NULL,
+  `http_p95_ms`     DOUBLE       NULL,
+  `normalize_s`     DOUBLE       NULL,
+  `write_s`         DOUBLE       NULL,
+  PRIMARY KEY (`run_id`, `attempt`),
+  KEY `idx_run_metrics_endpoint` (`endpoint`, `started_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Métricas por página: HTTP, normalização e linhas
+CREATE TABLE IF NOT EXISTS `etl_page_metrics` (
+  `endpoint`      VARCHAR(64)  NOT NULL,
+  `run_id`        CHAR(32)     NOT NULL,
+  `page`          INT          NOT NULL,
+  `status`        VARCHAR(16)  NOT NULL,                   -- done/failed
+  `http_ms`       DOUBLE       NULL,
+  `bytes_wire`    INT          NULL,
+  `http_errors`   INT          NOT NULL DEFAULT 0,
+  `records`       INT          NOT NULL DEFAULT 0,
+  `rows`          INT          NOT NULL DEFAULT 0,
+  `normalize_ms`  DOUBLE       NULL,
+  `recorded_at`   DATETIME     NOT NULL,
+  PRIMARY KEY (`endpoint`, `run_id`, `page`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
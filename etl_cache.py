@@ -0,0 +1,209 @@
+import os
+import gzip
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_cache")
+log.setLevel(logging.INFO)
+
+# Cache em disco das respostas do CVDW: reexecuta a carga sem a API
+# (debug de normalização, mudança de schema, corpus de benchmark)
+CVCRM_CACHE = (os.getenv("CVCRM_CACHE") or "0") == "1"
+CVCRM_CACHE_DIR = os.getenv("CVCRM_CACHE_DIR") or ".cache/cvcrm"
+# Limite do diretório; acima dele saem as respostas usadas há mais tempo
+CVCRM_CACHE_MAX_MB = float(os.getenv("CVCRM_CACHE_MAX_MB") or "2048")
+CVCRM_CACHE_LEVEL = int(os.getenv("CVCRM_CACHE_LEVEL") or "6")
+
+_SUFFIX = ".json.gz"
+
+
+def cache_key(endpoint: str, body: Dict[str, Any]) -> str:
+    """Endereço da resposta: hash do endpoint + parâmetros da página (página, tamanho, filtros/since)."""
+    raw = json.dumps({"endpoint": endpoint, "body": body}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf8")).hexdigest()
+
+
+class CacheWriter:
+    """
+    Grava o corpo que passa por ele (iterar = repassar os pedaços) num
+    arquivo temporário; `commit()` lê o que faltou e publica a entrada,
+    `discard()` apaga. Uma resposta incompleta nunca vira entrada.
+    """
+
+    def __init__(self, cache: "ResponseCache", key: str, chunks: Iterable[bytes]):
+        self.cache = cache
+        self.key = key
+        self.path = cache.path(key)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        self._file = gzip.open(self._tmp, "wb", compresslevel=CVCRM_CACHE_LEVEL)
+        self._chunks = iter(chunks)
+        self._gen = self._tee()
+
+    def _tee(self) -> Iterator[bytes]:
+        for chunk in self._chunks:
+            self._file.write(chunk)
+            yield chunk
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self._gen
+
+    def commit(self) -> None:
+        for _ in self._gen:
+            pass
+        self._file.close()
+        os.replace(self._tmp, self.path)
+        self.cache._added(self.path)
+
+    def discard(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+
+class ResponseCache:
+    """
+    Respostas de página do CVDW em disco, uma por arquivo gzip endereçado
+    por `cache_key`. O tamanho total fica abaixo de `max_bytes`: ao passar,
+    saem as entradas lidas/gravadas há mais tempo (mtime).
+
+    Guarda também os filtros da última carga com cache de cada endpoint,
+    para o replay pedir exatamente as mesmas páginas.
+    """
+
+    def __init__(self, root: str = CVCRM_CACHE_DIR, max_mb: float = CVCRM_CACHE_MAX_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + _SUFFIX)
+
+    def _entries(self) -> List[Tuple[str, int, float]]:
+        entries = []
+        for sub in os.scandir(self.root):
+            if not sub.is_dir() or len(sub.name) != 2:
+                continue
+            for e in os.scandir(sub.path):
+                if e.name.endswith(_SUFFIX):
+                    st = e.stat()
+                    entries.append((e.path, st.st_size, st.st_mtime))
+        return entries
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Corpo descomprimido da entrada (arquivo), ou None se não houver."""
+        path = self.path(key)
+        try:
+            f = gzip.open(path, "rb")
+            os.utime(path)  # LRU por mtime
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return f
+
+    def get(self, key: str) -> Optional[bytes]:
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def put(self, key: str, body: bytes) -> None:
+        writer = CacheWriter(self, key, [body])
+        writer.commit()
+
+    def writer(self, key: str, chunks: Iterable[bytes]) -> CacheWriter:
+        return CacheWriter(self, key, chunks)
+
+    def _added(self, path: str) -> None:
+        size = os.path.getsize(path)
+        with self._lock:
+            self.writes += 1
+            self.size += size
+            over = self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove as entradas mais antigas até ficar em 90% do limite."""
+        with self._lock:
+            target = int(self.max_bytes * 0.9)
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            self.size = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if self.size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.size -= size
+                self.evicted += 1
+        log.info(f"Cache: {self.evicted} entrada(s) removidas até agora; {self.size / 2 ** 20:.1f} MiB em uso")
+
+    # -------------------------------------------------------------------------
+    # Filtros por endpoint (replay)
+    # -------------------------------------------------------------------------
+    def _filters_path(self, endpoint: str) -> str:
+        return os.path.join(self.root, "filters", f"{endpoint}.json")
+
+    def save_filters(self, endpoint: str, filters: Dict[str, Any]) -> None:
+        path = self._filters_path(endpoint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(filters, f, default=str)
+
+    def load_filters(self, endpoint: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._filters_path(endpoint), encoding="utf8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "writes": self.writes,
+                "evicted": self.evicted,
+                "size_mb": round(self.size / 2 ** 20, 1),
+            }
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache(replay: bool = False) -> Optional[ResponseCache]:
+    """Cache padrão do processo quando CVCRM_CACHE=1 ou no replay; senão None."""
+    global _default_cache
+    if not (CVCRM_CACHE or replay):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,114 @@
+import os
+import logging
+import threading
+from datetime import datetime, date
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_dates")
+log.setLevel(logging.INFO)
+
+# Strings distintas guardadas no cache (0 desliga). referencia_data, data_cad
+# e os vencimentos se repetem muito entre registros e páginas.
+DATE_CACHE_SIZE = int(os.getenv("DATE_CACHE_SIZE") or "32768")
+
+DATE_PATTERNS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+
+class DateParseStats:
+    """
+    Contadores do parser: quantas strings saíram pelo caminho rápido, quantas
+    precisaram do strptime e quantas não eram data. Contam só misses do
+    cache; os hits vêm de `cache_info()`. Como o cache, valem para o
+    processo inteiro (as cargas do run_all em threads somam aqui); o lock
+    só é tomado nos misses.
+    """
+
+    def __init__(self):
+        self.fast = 0
+        self.fallback = 0
+        self.invalid = 0
+        self._lock = threading.Lock()
+
+    def add(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.fast = self.fallback = self.invalid = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        info = _parse_cached.cache_info()
+        lookups = info.hits + info.misses
+        with self._lock:
+            counts = {"fast": self.fast, "fallback": self.fallback, "invalid": self.invalid}
+        return {
+            "cache_hits": info.hits,
+            "cache_misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 3) if lookups else None,
+            "cache_size": info.currsize,
+            **counts,
+        }
+
+
+stats = DateParseStats()
+
+
+def _parse_slow(s: str) -> Optional[datetime]:
+    """Caminho antigo: tenta os formatos com strptime (aceita mês/dia sem zero etc.)."""
+    for fmt in DATE_PATTERNS:
+        try:
+            dt = datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+        stats.add("fallback")
+        return dt
+    stats.add("invalid")
+    return None
+
+
+def _parse(s: str) -> Optional[datetime]:
+    n = len(s)
+    # Layout fixo do CVDW: "YYYY-MM-DD HH:MM:SS" ou "YYYY-MM-DD"
+    if (n == 19 and s[10] == " " and s[13] == ":" and s[16] == ":") or n == 10:
+        if s[4] == "-" and s[7] == "-":
+            try:
+                dt = datetime.fromisoformat(s)
+            except ValueError:
+                pass
+            else:
+                stats.add("fast")
+                return dt
+    return _parse_slow(s)
+
+
+_parse_cached = lru_cache(maxsize=DATE_CACHE_SIZE or 0)(_parse)
+
+
+def to_datetime_safe(s: Optional[str]) -> Optional[datetime]:
+    if not s or s.__class__ is not str:
+        return None
+    return _parse_cached(s)
+
+
+def to_date_safe(s: Optional[str]) -> Optional[date]:
+    dt = to_datetime_safe(s)
+    return dt.date() if dt else None
+
+
+def date_stats() -> Dict[str, Any]:
+    """Contadores e cache do processo (não só da execução que pergunta)."""
+    return stats.snapshot()
+
+
+def clear_cache() -> None:
+    """Esvazia o cache e zera os contadores."""
+    _parse_cached.cache_clear()
+    stats.reset()
@@ -0,0 +1,227 @@
+import os
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from dotenv import load_dotenv
+
+from etl_schema import TableSpec
+from etl_utils import checkout, upsert_rows_stats
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_dimensions")
+log.setLevel(logging.INFO)
+
+# Grava os pares (id, nome) repetidos nas tabelas de fato (empreendimento,
+# corretor, imobiliária...) em tabelas dim_* pequenas
+CVCRM_DIMENSIONS = (os.getenv("CVCRM_DIMENSIONS") or "0") == "1"
+# Além disso, grava NULL nas colunas de nome das tabelas de fato (o nome fica
+# só na dimensão): linhas mais estreitas, mas quem lê os fatos precisa do JOIN
+DIM_STRIP_NAMES = (os.getenv("DIM_STRIP_NAMES") or "0") == "1"
+# Membros guardados por dimensão no cache do processo (passou disso, esvazia)
+DIM_CACHE_SIZE = int(os.getenv("DIM_CACHE_SIZE") or "200000")
+
+
+@dataclass(frozen=True)
+class Dimension:
+    """Tabela dim_<nome> com a chave da API (`key`) e o nome mais recente."""
+    table: str
+    key: str
+    key_type: str = "BIGINT"
+
+    @property
+    def ddl(self) -> str:
+        return f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+              `{self.key}`  {self.key_type}  NOT NULL,
+              `nome`        VARCHAR(255)     NULL,
+              `updated_at`  TIMESTAMP        NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+              PRIMARY KEY (`{self.key}`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+
+
+@dataclass(frozen=True)
+class DimensionRef:
+    """Colunas (`id_column`, `name_column`) da tabela de fato `table` que alimentam `dimension`."""
+    dimension: Dimension
+    table: str
+    id_column: str
+    name_column: str
+
+
+DIM_EMPREENDIMENTO = Dimension("dim_empreendimento", "idempreendimento")
+DIM_CORRETOR = Dimension("dim_corretor", "idcorretor")
+DIM_IMOBILIARIA = Dimension("dim_imobiliaria", "idimobiliaria")
+DIM_TIME = Dimension("dim_time", "idtime", "INT")
+DIM_MIDIA = Dimension("dim_midia", "idmidia")
+DIM_RESPONSAVEL = Dimension("dim_responsavel", "idresponsavel")
+DIMENSIONS = (DIM_EMPREENDIMENTO, DIM_CORRETOR, DIM_IMOBILIARIA, DIM_TIME, DIM_MIDIA, DIM_RESPONSAVEL)
+
+# Cache do processo: dimensão -> {id: nome já gravado}. Compartilhado entre
+# execuções e runners (run_all em threads): empreendimento vem de três cargas.
+_cache: Dict[str, Dict[Any, str]] = {}
+_cache_lock = threading.Lock()
+_ensured = False
+_ensure_lock = threading.Lock()
+
+
+def ensure_dimension_tables(engine=None) -> None:
+    """Cria (uma vez por processo) as tabelas dim_* no schema das cargas."""
+    global _ensured
+    with _ensure_lock:
+        if _ensured:
+            return
+        with checkout(engine) as conn:
+            with conn.cursor() as cursor:
+                for dim in DIMENSIONS:
+                    cursor.execute(dim.ddl)
+            conn.commit()
+        _ensured = True
+
+
+class DimensionLoader:
+    """
+    Estágio de dimensões de uma execução: para cada página, separa os pares
+    (id, nome) das tabelas de fato, grava só os que o cache ainda não viu
+    (ou cujo nome mudou) e, com `strip`, tira os nomes das linhas de fato.
+
+    Um membro só entra no cache depois que a gravação dele deu certo: com
+    falha, volta na próxima página, e nesta as linhas de fato dele ficam com
+    o nome, mesmo com `strip`. Duas cargas que veem o mesmo membro novo ao
+    mesmo tempo gravam as duas (upsert idempotente).
+    Nomes que não vêm como texto da API são gravados com str().
+    """
+
+    def __init__(self, refs: Sequence[DimensionRef], specs: Dict[str, TableSpec], engine=None,
+                 strip: Optional[bool] = None, cache_size: Optional[int] = None):
+        self.engine = engine
+        self.strip = DIM_STRIP_NAMES if strip is None else strip
+        self.cache_size = DIM_CACHE_SIZE if cache_size is None else cache_size
+        # tabela de fato -> [(dimensão, posição do id, posição do nome)]
+        self.refs: Dict[str, List[Tuple[Dimension, int, int]]] = {}
+        for ref in refs:
+            spec = specs[ref.table]
+            self.refs.setdefault(ref.table, []).append(
+                (ref.dimension, spec.index(ref.id_column), spec.index(ref.name_column)))
+        self._strip_index = {t: {j for _, _, j in items} for t, items in self.refs.items()}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        ensure_dimension_tables(engine)
+
+    def _counter(self, dim: Dimension) -> Dict[str, int]:
+        return self._stats.setdefault(dim.table, {"lookups": 0, "hits": 0, "written": 0, "errors": 0,
+                                                  "bytes_names": 0, "bytes_hits": 0, "bytes_written": 0})
+
+    def apply(self, tables: Dict[str, List[Tuple[Any, ...]]]) -> Dict[str, List[Tuple[Any, ...]]]:
+        """Grava os membros novos da página e devolve `tables` (sem os nomes, com `strip`)."""
+        new: Dict[Dimension, Dict[Any, str]] = {}
+        for table, items in self.refs.items():
+            rows = tables.get(table)
+            if not rows:
+                continue
+            for dim, i, j in items:
+                seen = {row[i]: str(row[j]) for row in rows if row[i] is not None and row[j] is not None}
+                misses = self._misses(dim, seen)
+                if misses:
+                    new.setdefault(dim, {}).update(misses)
+                lookups = hits = nbytes = hit_bytes = 0
+                for row in rows:
+                    if row[i] is None or row[j] is None:
+                        continue
+                    size = len(str(row[j]).encode("utf8"))
+                    lookups += 1
+                    nbytes += size
+                    if row[i] not in misses:
+                        hits += 1
+                        hit_bytes += size
+                with self._lock:
+                    c = self._counter(dim)
+                    c["lookups"] += lookups
+                    c["hits"] += hits
+                    c["bytes_names"] += nbytes
+                    c["bytes_hits"] += hit_bytes
+        failed: Dict[Dimension, Set[Any]] = {}
+        for dim, members in new.items():
+            if not self._write(dim, members):
+                failed[dim] = set(members)
+        if self.strip:
+            tables = {t: self._stripped(t, rows, failed) if t in self._strip_index else rows
+                      for t, rows in tables.items()}
+        return tables
+
+    def _misses(self, dim: Dimension, seen: Dict[Any, str]) -> Dict[Any, str]:
+        """Membros da página que o cache não tem com o mesmo nome."""
+        with _cache_lock:
+            cache = _cache.get(dim.table, {})
+            return {k: v for k, v in seen.items() if cache.get(k) != v}
+
+    def _remember(self, dim: Dimension, members: Dict[Any, str]) -> None:
+        """Guarda no cache membros já gravados na dimensão."""
+        with _cache_lock:
+            cache = _cache.setdefault(dim.table, {})
+            if len(cache) + len(members) > self.cache_size:
+                cache.clear()
+            cache.update(members)
+
+    def _write(self, dim: Dimension, members: Dict[Any, str]) -> bool:
+        """Grava os membros na dimensão e, se der certo, guarda no cache; False se falhar."""
+        rows = [(k, v[:255]) for k, v in members.items()]
+        try:
+            stats = upsert_rows_stats(self.engine, dim.table, rows, [dim.key], columns=(dim.key, "nome"),
+                                      skip_unchanged=False)
+            failed = bool(stats.errors)
+        except Exception as e:
+            log.warning(f"Dimensão {dim.table}: falha ao gravar {len(rows)} membro(s): {e}")
+            failed = True
+        with self._lock:
+            c = self._counter(dim)
+            if failed:
+                c["errors"] += len(rows)
+            else:
+                c["written"] += len(rows)
+                c["bytes_written"] += sum(len(v.encode("utf8")) for _, v in rows)
+        if not failed:
+            self._remember(dim, members)
+        return not failed
+
+    def _stripped(self, table: str, rows: List[Tuple[Any, ...]],
+                  failed: Dict[Dimension, Set[Any]]) -> List[Tuple[Any, ...]]:
+        drop = self._strip_index[table]
+        # Membro que não chegou à dimensão mantém o nome no fato
+        keep = [(i, j, failed[dim]) for dim, i, j in self.refs[table] if dim in failed]
+        if not keep:
+            return [tuple(None if n in drop else v for n, v in enumerate(row)) for row in rows]
+        out = []
+        for row in rows:
+            row_drop = drop - {j for i, j, keys in keep if row[i] in keys}
+            out.append(tuple(None if n in row_drop else v for n, v in enumerate(row)))
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Por dimensão e no total: taxa de acerto do cache e bytes de nomes.
+        bytes_hits são as regravações de dimensão evitadas pelo cache;
+        bytes_fact_saved é o que sai das linhas de fato com `strip`
+        (descontado o que foi para as dimensões).
+        """
+        with self._lock:
+            per_dim = {t: dict(c) for t, c in self._stats.items()}
+        total = {k: sum(c[k] for c in per_dim.values())
+                 for k in ("lookups", "hits", "written", "errors", "bytes_names", "bytes_hits", "bytes_written")}
+        for c in (*per_dim.values(), total):
+            c["hit_rate"] = round(c["hits"] / c["lookups"], 4) if c["lookups"] else None
+        total["bytes_fact_saved"] = total["bytes_names"] - total["bytes_written"] if self.strip else 0
+        return {"total": total, "dimensions": per_dim}
+
+
+def dimension_loader(refs: Optional[Sequence[DimensionRef]], specs: Dict[str, TableSpec],
+                     engine=None) -> Optional[DimensionLoader]:
+    """DimensionLoader da execução, ou None com CVCRM_DIMENSIONS desligado / sem refs."""
+    if not refs or not CVCRM_DIMENSIONS:
+        return None
+    return DimensionLoader(refs, specs, engine)
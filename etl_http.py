@@ -0,0 +1,591 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from etl_cache import ResponseCache, cache_key
+from etl_stream import JsonObjectStream
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_http")
+log.setLevel(logging.INFO)
+
+EMAIL = os.getenv("CVCRM_EMAIL") or ""
+TOKEN = os.getenv("CVCRM_TOKEN") or ""
+
+HEADERS = {
+    "email": EMAIL,
+    "token": TOKEN,
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+# Conexões keep-alive mantidas por host na Session compartilhada
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE") or "16")
+# Tamanho dos pedaços lidos no modo streaming (bytes já descomprimidos)
+HTTP_STREAM_CHUNK = int(os.getenv("HTTP_STREAM_CHUNK") or "65536")
+
+# Backoff exponencial com jitter entre tentativas: base * 2^(n-1), até o teto
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE") or "1")
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX") or "60")
+# Teto para o Retry-After de 429/503 e piso da vazão depois de throttling
+HTTP_RETRY_AFTER_MAX = float(os.getenv("HTTP_RETRY_AFTER_MAX") or "300")
+HTTP_MIN_RATE = float(os.getenv("HTTP_MIN_RATE") or "0.2")
+# Quanto a vazão sobe (req/s) a cada sucesso depois de um 429
+HTTP_RATE_STEP = float(os.getenv("HTTP_RATE_STEP") or "0.1")
+
+# Ajuste de registros_por_pagina entre execuções (ver next_page_size)
+HTTP_TUNE_MIN_REQUESTS = int(os.getenv("HTTP_TUNE_MIN_REQUESTS") or "5")
+# p95 acima desta fração do timeout conta como lento (diminui a página)
+HTTP_TUNE_SLOW_FRACTION = float(os.getenv("HTTP_TUNE_SLOW_FRACTION") or "0.5")
+HTTP_TUNE_STEP = float(os.getenv("HTTP_TUNE_STEP") or "1.25")
+
+
+# -----------------------------------------------------------------------------
+# Session
+# -----------------------------------------------------------------------------
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Session compartilhada por todos os endpoints: reaproveita conexões TLS
+    (keep-alive) e já leva os headers de autenticação e gzip.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            # Retries ficam por conta de fetch_page
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def close_session() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+class HttpStats:
+    """Bytes (no fio x descomprimidos) e latência das requisições de um endpoint."""
+
+    def __init__(self, keep: int = 10000):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.throttled = 0
+        self.records = 0
+        self.bytes_wire = 0
+        self.bytes_decoded = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self._latencies: "deque[float]" = deque(maxlen=keep)
+        # página -> [segundos, bytes no fio, falhas] até o pipeline recolher (pop_page)
+        self._pages: Dict[int, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, bytes_wire: int, bytes_decoded: int, records: int = 0,
+               page: Optional[int] = None) -> None:
+        with self._lock:
+            if page is not None:
+                p = self._pages.setdefault(page, [0.0, 0, 0])
+                p[0] += seconds
+                p[1] += bytes_wire
+            self.requests += 1
+            self.records += records
+            self.bytes_wire += bytes_wire
+            self.bytes_decoded += bytes_decoded
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self._latencies.append(seconds)
+
+    def record_error(self, timeout: bool = False, throttled: bool = False, page: Optional[int] = None) -> None:
+        with self._lock:
+            if page is not None:
+                self._pages.setdefault(page, [0.0, 0, 0])[2] += 1
+            self.errors += 1
+            self.timeouts += timeout
+            self.throttled += throttled
+
+    def pop_page(self, page: int) -> Tuple[float, int, int]:
+        """(segundos, bytes no fio, falhas) das requisições da página."""
+        with self._lock:
+            seconds, wire, failures = self._pages.pop(page, (0.0, 0, 0))
+        return seconds, int(wire), int(failures)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = sorted(self._latencies)
+            n = len(lat)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "throttled": self.throttled,
+                "records": self.records,
+                "records_per_s": round(self.records / self.seconds, 1) if self.seconds else None,
+                "bytes_wire": self.bytes_wire,
+                "bytes_decoded": self.bytes_decoded,
+                "compression_ratio": round(self.bytes_decoded / self.bytes_wire, 2) if self.bytes_wire else None,
+                "avg_ms": round(1000 * self.seconds / self.requests, 1) if self.requests else 0.0,
+                "p50_ms": round(1000 * lat[n // 2], 1) if n else 0.0,
+                "p95_ms": round(1000 * lat[min(n - 1, int(n * 0.95))], 1) if n else 0.0,
+                "max_ms": round(1000 * self.max_seconds, 1),
+            }
+
+
+def _wire_bytes(resp: requests.Response, decoded: int) -> int:
+    """Bytes efetivamente lidos do socket (comprimidos, se veio gzip)."""
+    try:
+        return int(resp.raw.tell())
+    except Exception:
+        return int(resp.headers.get("Content-Length") or decoded)
+
+
+# -----------------------------------------------------------------------------
+# Rate limit
+# -----------------------------------------------------------------------------
+class TokenBucket:
+    """
+    Token bucket thread-safe, compartilhado pelos workers de um endpoint:
+    `rate` requisições/s com rajada de até `burst` (rate 0 = sem limite).
+
+    Também é o freio do endpoint contra throttling do servidor (AIMD): um
+    429/503 chama `throttle`, que para todos os workers pelo Retry-After e
+    corta a vazão pela metade; cada sucesso (`recover`) devolve um pouco,
+    até o `rate` configurado (ou até voltar a ser ilimitado).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, min_rate: float = HTTP_MIN_RATE):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.throttles = 0
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._ceiling = rate  # vazão de antes do primeiro 429 quando sem limite
+        self._recent: "deque[float]" = deque(maxlen=256)  # instantes dos últimos acquires
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.burst if self.burst is not None else self.rate)
+
+    def acquire(self) -> float:
+        """Bloqueia até haver um token; devolve o tempo esperado (s)."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self.rate <= 0:
+                    self._recent.append(now)
+                    return waited
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        self._recent.append(now)
+                        return waited
+                    delay = (1.0 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def _observed_rate(self, now: float) -> float:
+        window = [t for t in self._recent if now - t <= 10.0]
+        return len(window) / 10.0
+
+    def throttle(self, pause: float) -> None:
+        """Servidor pediu calma: pausa geral de `pause` s e metade da vazão."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + pause)
+            if self.rate > 0:
+                current = self.rate
+            else:
+                current = self._ceiling = max(self.min_rate, self._observed_rate(now))
+            self.rate = max(self.min_rate, current / 2)
+            self._tokens = min(self._tokens, 1.0)
+            self._last = now
+            self.throttles += 1
+
+    def recover(self) -> None:
+        """Requisição bem-sucedida: aumento aditivo até o teto configurado."""
+        with self._lock:
+            if self.rate <= 0 or self.rate == self.max_rate:
+                return
+            self.rate += HTTP_RATE_STEP
+            if self.rate >= (self.max_rate if self.max_rate > 0 else self._ceiling):
+                # De volta ao teto; sem limite configurado, volta a ser ilimitado
+                self.rate = self.max_rate
+
+
+def backoff_delay(attempt: int) -> float:
+    """Espera antes da tentativa `attempt + 1`: exponencial com jitter (metade fixa, metade aleatória)."""
+    delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_after(resp: Optional[requests.Response]) -> Optional[float]:
+    """Retry-After em segundos (número ou data HTTP), limitado a HTTP_RETRY_AFTER_MAX."""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(HTTP_RETRY_AFTER_MAX, max(0.0, seconds))
+
+
+# -----------------------------------------------------------------------------
+# Endpoint
+# -----------------------------------------------------------------------------
+@dataclass
+class Endpoint:
+    """Configuração de um endpoint paginado do CVDW."""
+    name: str
+    url: str
+    method: str = "GET"
+    page_size: int = 450
+    timeout: int = 30
+    retries: int = 3
+    # Páginas 2..N buscadas em paralelo por até `concurrency` workers
+    concurrency: int = 4
+    # Requisições por segundo (0 = sem limite, exceto depois de um 429)
+    rate_limit: float = 0.0
+    # Faixa do ajuste automático de registros_por_pagina entre execuções
+    adaptive_page_size: bool = True
+    page_size_min: int = 50
+    page_size_max: int = 1000
+    limiter: Optional[TokenBucket] = field(default=None, repr=False)
+    stats: HttpStats = field(default_factory=HttpStats, repr=False)
+    # Resumo da última execução (RunMetrics.finish); "status" é o de etl_run
+    last_run: Optional[Dict[str, Any]] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self.method = (self.method or "GET").upper()
+        if self.limiter is None:
+            self.limiter = TokenBucket(self.rate_limit)
+
+
+def env_endpoint(prefix: str, name: str, url: str, default_timeout: int = 30) -> Endpoint:
+    """
+    Monta um Endpoint a partir das variáveis de ambiente `<PREFIX>_*`, caindo
+    para as de reservas/CVCRM como os runners já faziam.
+    """
+    def env(key: str) -> Optional[str]:
+        return os.getenv(f"{prefix}_{key}") or os.getenv(f"RESERVAS_{key}") or os.getenv(f"CVCRM_{key}")
+
+    return Endpoint(
+        name=name,
+        url=url,
+        method=env("HTTP_METHOD") or "GET",
+        page_size=int(env("PAGE_SIZE") or "450"),
+        # Timeout próprio do endpoint; RESERVAS_TIMEOUT não vale mais para os outros
+        timeout=int(os.getenv(f"{prefix}_TIMEOUT") or os.getenv("CVCRM_TIMEOUT") or str(default_timeout)),
+        retries=int(env("RETRIES") or "3"),
+        concurrency=int(env("CONCURRENCY") or "4"),
+        rate_limit=float(env("RATE_LIMIT") or "0"),
+        adaptive_page_size=(env("ADAPTIVE_PAGE_SIZE") or "1") == "1",
+        page_size_min=int(env("PAGE_SIZE_MIN") or "50"),
+        page_size_max=int(env("PAGE_SIZE_MAX") or "1000"),
+    )
+
+
+def next_page_size(endpoint: Endpoint, current: int,
+                   previous: Optional[Tuple[Optional[int], Optional[float], int]] = None
+                   ) -> Optional[Tuple[int, float, int]]:
+    """
+    Escolhe o registros_por_pagina da próxima execução a partir do que esta
+    (com `current`) mediu em `endpoint.stats`: subida de encosta em
+    registros/s, com `previous` = (tamanho, registros/s, direção) da anterior.
+
+    Timeout ou p95 acima de HTTP_TUNE_SLOW_FRACTION do timeout cortam a
+    página pela metade; se a vazão piorou em relação ao tamanho anterior, a
+    direção inverte. O tamanho só muda entre execuções: a numeração das
+    páginas de uma execução depende dele.
+
+    Devolve (próximo tamanho, registros/s medido, direção), ou None se a
+    execução teve poucas requisições para servir de medida.
+    """
+    snap = endpoint.stats.snapshot()
+    rps = snap["records_per_s"]
+    if snap["requests"] < HTTP_TUNE_MIN_REQUESTS or not rps:
+        return None
+    direction = previous[2] if previous else 1
+    if snap["timeouts"] or snap["p95_ms"] > 1000 * endpoint.timeout * HTTP_TUNE_SLOW_FRACTION:
+        direction, factor = -1, 0.5
+    else:
+        if previous and previous[0] and previous[0] != current and previous[1] and rps < 0.95 * previous[1]:
+            direction = -direction
+        factor = HTTP_TUNE_STEP if direction > 0 else 1 / HTTP_TUNE_STEP
+    size = int(round(current * factor / 10.0)) * 10
+    return max(endpoint.page_size_min, min(endpoint.page_size_max, size)), rps, direction
+
+
+def total_pages_of(data: Dict[str, Any], default: int = 1) -> int:
+    return int(data.get("total_de_paginas") or data.get("total_pages") or default)
+
+
+# -----------------------------------------------------------------------------
+# API
+# -----------------------------------------------------------------------------
+def _page_body(endpoint: Endpoint, page: int, filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    body: Dict[str, Any] = {
+        "pagina": page,
+        "registros_por_pagina": endpoint.page_size,
+    }
+    body.update({k: v for k, v in (filters or {}).items() if v})
+    return body
+
+
+def _request(endpoint: Endpoint, body: Dict[str, Any], stream: bool = False) -> requests.Response:
+    session = get_session()
+    if endpoint.method == "POST":
+        return session.post(endpoint.url, json=body, timeout=endpoint.timeout, stream=stream)
+    return session.get(endpoint.url, params=body, timeout=endpoint.timeout, stream=stream)
+
+
+def _retry_wait(endpoint: Endpoint, page: int, attempt: int, e: Exception) -> bool:
+    """
+    Registra a falha e espera antes da próxima tentativa (False = desistir).
+    429/503 freiam o endpoint inteiro pelo Retry-After (ou pelo backoff),
+    não só este worker.
+    """
+    resp = getattr(e, "response", None)
+    throttled = resp is not None and resp.status_code in (429, 503)
+    endpoint.stats.record_error(timeout=isinstance(e, requests.Timeout), throttled=throttled, page=page)
+    log.warning(f"[{endpoint.name}] Falha ao chamar API (tentativa {attempt}/{endpoint.retries}) página={page}: {e}")
+    if throttled and endpoint.limiter is not None:
+        pause = retry_after(resp)
+        endpoint.limiter.throttle(backoff_delay(attempt) if pause is None else pause)
+    if attempt == endpoint.retries:
+        return False
+    if not throttled or endpoint.limiter is None:
+        time.sleep(backoff_delay(attempt))
+    return True
+
+
+def fetch_page(endpoint: Endpoint, page: int, filters: Optional[Dict[str, Any]] = None,
+               cache: Optional[ResponseCache] = None, replay: bool = False) -> Dict[str, Any]:
+    """
+    Busca uma página do endpoint com retries e backoff simples.
+    `filters` vai junto dos parâmetros de paginação (ex.: a_partir_data_cad).
+
+    Com `cache`, a resposta sai do disco quando já foi baixada e é guardada
+    quando não; com `replay`, só do disco (sem entrada = página com erro).
+    """
+    body = _page_body(endpoint, page, filters)
+    key = cache_key(endpoint.name, body) if cache else None
+    if cache:
+        try:
+            cached = cache.get(key)
+            if cached is not None:
+                log.debug(f"[{endpoint.name}] página={page} do cache ({len(cached)} B)")
+                return json.loads(cached) or {}
+        except (OSError, EOFError, ValueError) as e:
+            log.warning(f"[{endpoint.name}] Entrada do cache ilegível (página={page}), ignorada: {e}")
+        if replay:
+            log.warning(f"[{endpoint.name}] Replay: página={page} não está no cache")
+            return {}
+    for attempt in range(1, endpoint.retries + 1):
+        if endpoint.limiter is not None:
+            endpoint.limiter.acquire()
+        try:
+            t0 = time.monotonic()
+            resp = _request(endpoint, body)
+            resp.raise_for_status()
+            data = resp.json() or {}
+            elapsed = time.monotonic() - t0
+            wire = _wire_bytes(resp, len(resp.content))
+            endpoint.stats.record(elapsed, wire, len(resp.content), len(data.get("dados") or []), page)
+            if endpoint.limiter is not None:
+                endpoint.limiter.recover()
+            log.debug(f"[{endpoint.name}] página={page} {elapsed * 1000:.0f} ms "
+                      f"{wire} B no fio / {len(resp.content)} B")
+            if cache and data:
+                cache.put(key, resp.content)
+            return data
+        except (requests.RequestException, ValueError) as e:
+            if not _retry_wait(endpoint, page, attempt, e):
+                break
+    return {}
+
+
+def fetch_page_streamed(endpoint: Endpoint, page: int, filters: Optional[Dict[str, Any]] = None,
+                        consume: Callable[[Iterable[Dict[str, Any]]], Any] = list,
+                        cache: Optional[ResponseCache] = None, replay: bool = False) -> Dict[str, Any]:
+    """
+    Como `fetch_page`, mas sem montar a resposta inteira: os registros de
+    `dados` são decodificados conforme chegam e entregues a `consume` (o
+    normalizador), um por vez. Devolve as demais chaves da resposta mais
+    `resultado` (retorno de `consume`) e `registros` (quantos vieram).
+
+    Uma falha no meio do corpo refaz a página inteira, então `consume` não
+    pode ter efeitos colaterais. `cache`/`replay` como em `fetch_page`; o
+    corpo vai para o cache conforme é lido.
+    """
+    body = _page_body(endpoint, page, filters)
+    key = cache_key(endpoint.name, body) if cache else None
+    if cache:
+        try:
+            f = cache.open(key)
+            if f is not None:
+                with f:
+                    parsed = JsonObjectStream(iter(lambda: f.read(HTTP_STREAM_CHUNK), b""))
+                    return _streamed_result(parsed, consume)
+        except (OSError, EOFError, ValueError) as e:
+            log.warning(f"[{endpoint.name}] Entrada do cache ilegível (página={page}), ignorada: {e}")
+        if replay:
+            log.warning(f"[{endpoint.name}] Replay: página={page} não está no cache")
+            return {}
+    for attempt in range(1, endpoint.retries + 1):
+        if endpoint.limiter is not None:
+            endpoint.limiter.acquire()
+        writer = None
+        try:
+            t0 = time.monotonic()
+            with _request(endpoint, body, stream=True) as resp:
+                resp.raise_for_status()
+                chunks = resp.iter_content(HTTP_STREAM_CHUNK)
+                if cache:
+                    chunks = writer = cache.writer(key, chunks)
+                parsed = JsonObjectStream(chunks)
+                data = _streamed_result(parsed, consume)
+                wire = _wire_bytes(resp, parsed.bytes)
+                if writer is not None:
+                    if data:
+                        writer.commit()
+                    else:
+                        writer.discard()
+                    writer = None
+            elapsed = time.monotonic() - t0
+            endpoint.stats.record(elapsed, wire, parsed.bytes, parsed.items, page)
+            if endpoint.limiter is not None:
+                endpoint.limiter.recover()
+            log.debug(f"[{endpoint.name}] página={page} {elapsed * 1000:.0f} ms "
+                      f"{wire} B no fio / {parsed.bytes} B (stream, {parsed.items} registros)")
+            return data
+        except (requests.RequestException, ValueError) as e:
+            if not _retry_wait(endpoint, page, attempt, e):
+                break
+        finally:
+            if writer is not None:
+                writer.discard()  # corpo incompleto não entra no cache
+    return {}
+
+
+def _streamed_result(parsed: JsonObjectStream, consume: Callable[[Iterable[Dict[str, Any]]], Any]) -> Dict[str, Any]:
+    result = consume(parsed)
+    for _ in parsed:
+        pass  # consume parou antes: lê o resto para completar `meta`
+    if not parsed.meta and not parsed.items:
+        return {}
+    data = dict(parsed.meta)
+    data["resultado"] = result
+    data["registros"] = parsed.items
+    return data
+
+
+FetchFn = Callable[[Endpoint, int, Optional[Dict[str, Any]]], Dict[str, Any]]
+
+
+def _fetch_concurrent(endpoint: Endpoint, pages: Iterable[int], filters: Optional[Dict[str, Any]],
+                      ordered: bool, fetch: FetchFn = fetch_page) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    order: List[int] = list(pages)
+    if not order:
+        return
+    workers = max(1, endpoint.concurrency)
+    # Em modo ordenado, limita páginas em voo + prontas aguardando a vez
+    window = 2 * workers
+    pending = iter(order)
+    inflight: Dict[Future, int] = {}
+    ready: Dict[int, Dict[str, Any]] = {}
+    next_idx = 0
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"fetch-{endpoint.name}")
+    try:
+        def submit_more() -> None:
+            while len(inflight) < workers and len(inflight) + len(ready) < window:
+                page = next(pending, None)
+                if page is None:
+                    return
+                inflight[executor.submit(fetch, endpoint, page, filters)] = page
+
+        submit_more()
+        while inflight or ready:
+            if ordered:
+                while next_idx < len(order) and order[next_idx] in ready:
+                    page = order[next_idx]
+                    next_idx += 1
+                    yield page, ready.pop(page)
+                submit_more()
+                if not inflight:
+                    continue
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                page = inflight.pop(fut)
+                if ordered:
+                    ready[page] = fut.result()
+                else:
+                    yield page, fut.result()
+            submit_more()
+    finally:
+        # Consumidor parou antes do fim (erro/break): não busca o resto
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_page_list(endpoint: Endpoint, pages: Iterable[int], filters: Optional[Dict[str, Any]] = None,
+                    ordered: bool = True, fetch: FetchFn = fetch_page) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Busca uma lista conhecida de páginas (retomada/retry) pelo mesmo pool limitado."""
+    yield from _fetch_concurrent(endpoint, pages, filters, ordered, fetch)
+
+
+def fetch_pages(endpoint: Endpoint, filters: Optional[Dict[str, Any]] = None, ordered: bool = True,
+                start_page: int = 1, fetch: FetchFn = fetch_page) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Itera (página, resposta) de todas as páginas do endpoint.
+
+    A primeira página é buscada sozinha para descobrir `total_de_paginas`; as
+    demais vão para um pool limitado a `endpoint.concurrency` workers. Com
+    `ordered=True` as páginas saem na ordem; senão, na ordem em que chegam.
+    Uma página que falhou sai como `{}` e cabe ao consumidor decidir se para.
+    `fetch` troca a busca de cada página (ex.: `fetch_page_streamed`).
+    """
+    first = fetch(endpoint, start_page, filters)
+    yield start_page, first
+    if not first:
+        return
+    total = total_pages_of(first, start_page)
+    yield from _fetch_concurrent(endpoint, range(start_page + 1, total + 1), filters, ordered, fetch)
@@ -0,0 +1,243 @@
+import os
+import re
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from etl_state import LOG_DB
+from etl_utils import checkout
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_indexes")
+log.setLevel(logging.INFO)
+
+# Carga inicial sem índices secundários: derruba antes, recria num ALTER só
+# por tabela no fim (--defer-indexes). Execuções incrementais não mexem neles.
+CVCRM_DEFER_INDEXES = (os.getenv("CVCRM_DEFER_INDEXES") or "0") == "1"
+# DDL de referência para conferir os índices depois da recriação
+SCHEMA_SQL = os.getenv("CVCRM_SCHEMA_SQL") or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "database", "CVCRM.sql")
+
+TABLE_DEFERRED_INDEX = f"{LOG_DB}.etl_deferred_index"
+
+DDL_DEFERRED_INDEX = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_DEFERRED_INDEX} (
+      `tabela`       VARCHAR(64)  NOT NULL,
+      `index_name`   VARCHAR(64)  NOT NULL,
+      `definition`   TEXT         NOT NULL,                 -- cláusula do ADD INDEX
+      `deferred_at`  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (`tabela`, `index_name`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_ensured = False
+_ensure_lock = threading.Lock()
+
+_CREATE_RE = re.compile(r"CREATE TABLE IF NOT EXISTS\s+(?:`\w+`\.)?`(\w+)`\s*\((.*?)\)\s*ENGINE", re.S | re.I)
+_INDEX_RE = re.compile(r"^\s*(UNIQUE\s+|FULLTEXT\s+|SPATIAL\s+)?(?:INDEX|KEY)\s+`(\w+)`\s*\(((?:[^()]|\(\d+\))*)\)",
+                       re.M | re.I)
+_PART_RE = re.compile(r"`(\w+)`\s*(?:\((\d+)\))?\s*(ASC|DESC)?", re.I)
+
+
+@dataclass(frozen=True)
+class IndexDef:
+    """Índice secundário: tipo ("" / UNIQUE / FULLTEXT / SPATIAL) e partes (coluna, prefixo, DESC)."""
+    name: str
+    kind: str
+    parts: Tuple[Tuple[str, Optional[int], bool], ...]
+
+    @property
+    def clause(self) -> str:
+        """Definição para ADD ... (ex.: "INDEX `idx` (`a`, `b`(20) DESC)")."""
+        cols = ", ".join(f"`{c}`" + (f"({n})" if n else "") + (" DESC" if desc else "") for c, n, desc in self.parts)
+        return f"{self.kind + ' ' if self.kind else ''}INDEX `{self.name}` ({cols})"
+
+
+def ensure_index_tables(engine=None) -> None:
+    """Cria (uma vez por processo) etl_deferred_index no schema de logs."""
+    global _ensured
+    with _ensure_lock:
+        if _ensured:
+            return
+        with checkout(engine) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {LOG_DB} DEFAULT CHARACTER SET utf8mb4")
+                cursor.execute(DDL_DEFERRED_INDEX)
+            conn.commit()
+        _ensured = True
+
+
+# -----------------------------------------------------------------------------
+# Leitura (servidor e DDL)
+# -----------------------------------------------------------------------------
+def secondary_indexes(connection, table: str) -> Dict[str, IndexDef]:
+    """
+    Índices secundários atuais da tabela (information_schema). Índices
+    funcionais ficam de fora: não dá para recriá-los a partir das colunas.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME, SUB_PART, COLLATION, INDEX_TYPE
+              FROM information_schema.STATISTICS
+             WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME <> 'PRIMARY'
+             ORDER BY INDEX_NAME, SEQ_IN_INDEX
+            """,
+            (table,))
+        rows = cursor.fetchall()
+    parts: Dict[str, List[Tuple[str, Optional[int], bool]]] = {}
+    kinds: Dict[str, str] = {}
+    functional = set()
+    for name, non_unique, column, sub_part, collation, index_type in rows:
+        if column is None:
+            functional.add(name)
+            continue
+        kinds[name] = index_type if index_type in ("FULLTEXT", "SPATIAL") else ("" if int(non_unique) else "UNIQUE")
+        parts.setdefault(name, []).append((column, int(sub_part) if sub_part else None, collation == "D"))
+    return {name: IndexDef(name, kinds[name], tuple(p)) for name, p in parts.items() if name not in functional}
+
+
+def ddl_indexes(tables: Sequence[str], path: str = SCHEMA_SQL) -> Dict[str, Dict[str, IndexDef]]:
+    """Índices secundários que o DDL (database/CVCRM.sql) declara para `tables`."""
+    with open(path, encoding="utf8") as f:
+        sql = f.read()
+    found: Dict[str, Dict[str, IndexDef]] = {}
+    for m in _CREATE_RE.finditer(sql):
+        if m.group(1) not in tables:
+            continue
+        found[m.group(1)] = {
+            name: IndexDef(name, (kind or "").strip().upper(),
+                           tuple((c, int(n) if n else None, (d or "").upper() == "DESC")
+                                 for c, n, d in _PART_RE.findall(cols)))
+            for kind, name, cols in _INDEX_RE.findall(m.group(2))
+        }
+    return found
+
+
+def deferred_indexes(tables: Sequence[str], engine=None) -> Dict[str, Dict[str, str]]:
+    """Índices derrubados e ainda não recriados: tabela -> {índice: cláusula}."""
+    if not tables:
+        return {}
+    ensure_index_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT tabela, index_name, definition FROM {TABLE_DEFERRED_INDEX} "
+                           f"WHERE tabela IN ({', '.join(['%s'] * len(tables))})", tuple(tables))
+            rows = cursor.fetchall()
+        conn.commit()
+    found: Dict[str, Dict[str, str]] = {}
+    for table, name, definition in rows:
+        found.setdefault(table, {})[name] = definition
+    return found
+
+
+# -----------------------------------------------------------------------------
+# Adiar / recriar
+# -----------------------------------------------------------------------------
+def drop_indexes(tables: Sequence[str], engine=None) -> Dict[str, List[str]]:
+    """
+    Grava a definição dos índices secundários de cada tabela em
+    etl_deferred_index e derruba todos num ALTER TABLE por tabela. A
+    definição é gravada antes do DROP: se a carga morrer no meio,
+    `rebuild_indexes` ainda sabe o que recriar. Devolve tabela -> índices.
+    """
+    ensure_index_tables(engine)
+    dropped: Dict[str, List[str]] = {}
+    with checkout(engine) as conn:
+        for table in tables:
+            current = secondary_indexes(conn, table)
+            if not current:
+                continue
+            with conn.cursor() as cursor:
+                # INSERT IGNORE: numa retomada, a definição original continua valendo
+                cursor.executemany(
+                    f"INSERT IGNORE INTO {TABLE_DEFERRED_INDEX} (tabela, index_name, definition) VALUES (%s, %s, %s)",
+                    [(table, idx.name, idx.clause) for idx in current.values()])
+                conn.commit()
+                cursor.execute(f"ALTER TABLE {table} " + ", ".join(f"DROP INDEX `{name}`" for name in current))
+            dropped[table] = sorted(current)
+    return dropped
+
+
+def rebuild_indexes(tables: Sequence[str], engine=None) -> Dict[str, List[str]]:
+    """
+    Recria os índices adiados de cada tabela num único ALTER TABLE ... ADD
+    INDEX (o InnoDB ordena e monta cada índice de uma vez) e limpa o registro.
+    Índices que já existem de novo são só tirados do registro.
+    """
+    pending = deferred_indexes(tables, engine)
+    rebuilt: Dict[str, List[str]] = {}
+    with checkout(engine) as conn:
+        for table, definitions in pending.items():
+            missing = {name: d for name, d in definitions.items() if name not in secondary_indexes(conn, table)}
+            with conn.cursor() as cursor:
+                if missing:
+                    cursor.execute(f"ALTER TABLE {table} " + ", ".join(f"ADD {d}" for d in missing.values()))
+                cursor.execute(f"DELETE FROM {TABLE_DEFERRED_INDEX} WHERE tabela = %s", (table,))
+            conn.commit()
+            rebuilt[table] = sorted(missing)
+    return rebuilt
+
+
+def verify_indexes(tables: Sequence[str], engine=None, path: str = SCHEMA_SQL) -> List[str]:
+    """Diferenças entre os índices secundários no servidor e os do DDL (lista vazia = confere)."""
+    expected = ddl_indexes(tables, path)
+    problems: List[str] = []
+    with checkout(engine) as conn:
+        for table in tables:
+            if table not in expected:
+                continue
+            current = secondary_indexes(conn, table)
+            for name, idx in expected[table].items():
+                if name not in current:
+                    problems.append(f"{table}: falta o índice {name}")
+                elif current[name] != idx:
+                    problems.append(f"{table}: {name} difere do DDL ({current[name].clause} != {idx.clause})")
+            problems.extend(f"{table}: índice {name} fora do DDL" for name in current if name not in expected[table])
+        conn.commit()
+    return problems
+
+
+def restore_indexes(tables: Sequence[str], engine=None, logger: Optional[logging.Logger] = None,
+                    prefix: str = "") -> List[str]:
+    """
+    Fim da carga com índices adiados: recria e confere contra o DDL. Não
+    levanta exceção (roda em finally); falhas vão para o log e a
+    definição fica em etl_deferred_index para a próxima tentativa.
+    """
+    logger = logger or log
+    t0 = time.monotonic()
+    try:
+        rebuilt = rebuild_indexes(tables, engine)
+        problems = verify_indexes(tables, engine)
+    except Exception as e:
+        logger.error(f"{prefix}Falha ao recriar os índices de {', '.join(tables)}: {e}. As definições continuam em "
+                     f"{TABLE_DEFERRED_INDEX}; rode de novo com --defer-indexes para recriar.")
+        return [str(e)]
+    counts = {t: len(names) for t, names in rebuilt.items()}
+    logger.info(f"{prefix}Índices recriados em {time.monotonic() - t0:.1f}s: {counts or 'nenhum pendente'}"
+                f" | conferência com o DDL: {'ok' if not problems else f'{len(problems)} diferença(s)'}")
+    for problem in problems:
+        logger.error(f"{prefix}Índices x DDL: {problem}")
+    return problems
+
+
+def pending_warning(tables: Sequence[str], engine=None, logger: Optional[logging.Logger] = None,
+                    prefix: str = "") -> Dict[str, Any]:
+    """Avisa se alguma tabela ainda está sem os índices de uma carga com --defer-indexes."""
+    try:
+        pending = deferred_indexes(tables, engine)
+    except Exception as e:
+        (logger or log).warning(f"{prefix}Não foi possível consultar {TABLE_DEFERRED_INDEX}: {e}")
+        return {}
+    for table, definitions in pending.items():
+        (logger or log).warning(f"{prefix}{table}: {len(definitions)} índice(s) adiado(s) ainda não recriado(s) "
+                                f"(backfill em andamento ou interrompido; --defer-indexes recria no fim)")
+    return pending
@@ -0,0 +1,288 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from etl_state import LOG_DB
+from etl_utils import checkout
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_metrics")
+log.setLevel(logging.INFO)
+
+# Métricas por execução e por página em log_cvcrm (tendência de vazão entre
+# as cargas noturnas); "0" desliga a gravação
+CVCRM_METRICS = (os.getenv("CVCRM_METRICS") or "1") == "1"
+# Linhas de etl_page_metrics acumuladas antes de cada INSERT em lote
+METRICS_BATCH_ROWS = int(os.getenv("METRICS_BATCH_ROWS") or "200")
+# Diretório do textfile collector do node_exporter: grava cvcrm_<endpoint>.prom
+METRICS_PROM_DIR = os.getenv("METRICS_PROM_DIR") or None
+
+TABLE_RUN_METRICS = f"{LOG_DB}.etl_run_metrics"
+TABLE_PAGE_METRICS = f"{LOG_DB}.etl_page_metrics"
+
+DDL_RUN_METRICS = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_RUN_METRICS} (
+      `run_id`          CHAR(32)     NOT NULL,
+      `attempt`         CHAR(32)     NOT NULL,                 -- cada --resume grava uma linha nova
+      `endpoint`        VARCHAR(64)  NOT NULL,
+      `status`          VARCHAR(16)  NOT NULL,
+      `started_at`      DATETIME     NOT NULL,
+      `seconds`         DOUBLE       NOT NULL,
+      `pages`           INT          NOT NULL DEFAULT 0,
+      `pages_failed`    INT          NOT NULL DEFAULT 0,
+      `records`         INT          NOT NULL DEFAULT 0,       -- registros recebidos da API
+      `records_per_s`   DOUBLE       NULL,
+      `rows`            INT          NOT NULL DEFAULT 0,
+      `inserted`        INT          NOT NULL DEFAULT 0,
+      `updated`         INT          NOT NULL DEFAULT 0,
+      `unchanged`       INT          NOT NULL DEFAULT 0,
+      `skipped`         INT          NOT NULL DEFAULT 0,
+      `deleted`         INT          NOT NULL DEFAULT 0,
+      `errors`          INT          NOT NULL DEFAULT 0,       -- lotes de upsert com erro
+      `http_requests`   INT          NOT NULL DEFAULT 0,
+      `http_errors`     INT          NOT NULL DEFAULT 0,       -- tentativas com falha (retries + desistências)
+      `http_throttled`  INT          NOT NULL DEFAULT 0,
+      `http_timeouts`   INT          NOT NULL DEFAULT 0,
+      `bytes_wire`      BIGINT       NOT NULL DEFAULT 0,
+      `bytes_decoded`   BIGINT       NOT NULL DEFAULT 0,
+      `http_avg_ms`     DOUBLE       NULL,
+      `http_p95_ms`     DOUBLE       NULL,
+      `normalize_s`     DOUBLE       NULL,
+      `write_s`         DOUBLE       NULL,
+      PRIMARY KEY (`run_id`, `attempt`),
+      KEY `idx_run_metrics_endpoint` (`endpoint`, `started_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+DDL_PAGE_METRICS = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_PAGE_METRICS} (
+      `endpoint`      VARCHAR(64)  NOT NULL,
+      `run_id`        CHAR(32)     NOT NULL,
+      `page`          INT          NOT NULL,
+      `status`        VARCHAR(16)  NOT NULL,                   -- done/failed
+      `http_ms`       DOUBLE       NULL,
+      `bytes_wire`    INT          NULL,
+      `http_errors`   INT          NOT NULL DEFAULT 0,
+      `records`       INT          NOT NULL DEFAULT 0,
+      `rows`          INT          NOT NULL DEFAULT 0,
+      `normalize_ms`  DOUBLE       NULL,
+      `recorded_at`   DATETIME     NOT NULL,
+      PRIMARY KEY (`endpoint`, `run_id`, `page`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_RUN_COLUMNS = ("run_id", "attempt", "endpoint", "status", "started_at", "seconds", "pages", "pages_failed",
+                "records", "records_per_s", "rows", "inserted", "updated", "unchanged", "skipped", "deleted",
+                "errors", "http_requests", "http_errors", "http_throttled", "http_timeouts", "bytes_wire",
+                "bytes_decoded", "http_avg_ms", "http_p95_ms", "normalize_s", "write_s")
+_PAGE_COLUMNS = ("endpoint", "run_id", "page", "status", "http_ms", "bytes_wire", "http_errors", "records",
+                 "rows", "normalize_ms", "recorded_at")
+
+_ensured = False
+_ensure_lock = threading.Lock()
+
+
+def ensure_metrics_tables(engine=None) -> None:
+    """Cria (uma vez por processo) as tabelas de métricas no schema de logs."""
+    global _ensured
+    with _ensure_lock:
+        if _ensured:
+            return
+        with checkout(engine) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {LOG_DB} DEFAULT CHARACTER SET utf8mb4")
+                cursor.execute(DDL_RUN_METRICS)
+                cursor.execute(DDL_PAGE_METRICS)
+            conn.commit()
+        _ensured = True
+
+
+class RunMetrics:
+    """
+    Métricas de uma execução de `run_paged_load`: uma linha por página
+    (HTTP, normalização, linhas) e um resumo no fim. As páginas ficam em
+    memória e vão para etl_page_metrics em lotes de `batch_rows`; o resumo
+    vai para etl_run_metrics e, com METRICS_PROM_DIR, para um .prom.
+
+    Falha ao gravar métricas só gera warning: nunca derruba a carga.
+    """
+
+    def __init__(self, endpoint: str, run_id: str, engine=None, batch_rows: int = METRICS_BATCH_ROWS,
+                 enabled: bool = CVCRM_METRICS, prom_dir: Optional[str] = METRICS_PROM_DIR):
+        self.endpoint = endpoint
+        self.run_id = run_id
+        self.engine = engine
+        self.batch_rows = max(1, batch_rows)
+        self.enabled = enabled
+        self.prom_dir = prom_dir
+        self.started_at = datetime.now()
+        self.pages = 0
+        self.pages_failed = 0
+        self.normalize_seconds = 0.0
+        self.write_seconds = 0.0
+        self._t0 = time.monotonic()
+        self._pending: List[Tuple[Any, ...]] = []
+        self._lock = threading.Lock()
+
+    def page(self, page: int, status: str, http: Tuple[float, int, int] = (0.0, 0, 0), records: int = 0,
+             rows: int = 0, normalize_seconds: float = 0.0) -> None:
+        """Registra a página (`http` = HttpStats.pop_page) e grava o lote se encheu."""
+        seconds, wire, failures = http
+        with self._lock:
+            self.pages += 1
+            self.pages_failed += status != "done"
+            self.normalize_seconds += normalize_seconds
+            if not self.enabled:
+                return
+            self._pending.append((self.endpoint, self.run_id, page, status,
+                                  round(1000 * seconds, 1) if seconds else None, wire or None, failures,
+                                  records, rows, round(1000 * normalize_seconds, 1), datetime.now()))
+            full = len(self._pending) >= self.batch_rows
+        if full:
+            self.flush()
+
+    def add_write_time(self, seconds: float) -> None:
+        with self._lock:
+            self.write_seconds += seconds
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            ensure_metrics_tables(self.engine)
+            cols = ", ".join(f"`{c}`" for c in _PAGE_COLUMNS)
+            updates = ", ".join(f"`{c}` = VALUES(`{c}`)" for c in _PAGE_COLUMNS[3:])
+            with checkout(self.engine) as conn:
+                with conn.cursor() as cursor:
+                    cursor.executemany(
+                        f"INSERT INTO {TABLE_PAGE_METRICS} ({cols}) VALUES ({', '.join(['%s'] * len(_PAGE_COLUMNS))}) "
+                        f"ON DUPLICATE KEY UPDATE {updates}", batch)
+                conn.commit()
+        except Exception as e:
+            log.warning(f"[{self.endpoint}] Falha ao gravar {len(batch)} métrica(s) de página: {e}")
+
+    def finish(self, status: str, records: int, totals: Any, http: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fecha a execução: grava as páginas pendentes e o resumo (`totals` =
+        UpsertStats, `http` = HttpStats.snapshot) e devolve o resumo.
+        """
+        seconds = time.monotonic() - self._t0
+        summary = {
+            "run_id": self.run_id,
+            "attempt": uuid.uuid4().hex,
+            "endpoint": self.endpoint,
+            "status": status,
+            "started_at": self.started_at.replace(microsecond=0),
+            "seconds": round(seconds, 3),
+            "pages": self.pages,
+            "pages_failed": self.pages_failed,
+            "records": records,
+            "records_per_s": round(records / seconds, 1) if seconds > 0 else None,
+            "rows": totals.rows,
+            "inserted": totals.inserted,
+            "updated": totals.updated,
+            "unchanged": totals.unchanged,
+            "skipped": totals.skipped,
+            "deleted": totals.deleted,
+            "errors": totals.errors,
+            "http_requests": http["requests"],
+            "http_errors": http["errors"],
+            "http_throttled": http["throttled"],
+            "http_timeouts": http["timeouts"],
+            "bytes_wire": http["bytes_wire"],
+            "bytes_decoded": http["bytes_decoded"],
+            "http_avg_ms": http["avg_ms"],
+            "http_p95_ms": http["p95_ms"],
+            "normalize_s": round(self.normalize_seconds, 3),
+            "write_s": round(self.write_seconds, 3),
+        }
+        if self.enabled:
+            self.flush()
+            try:
+                ensure_metrics_tables(self.engine)
+                cols = ", ".join(f"`{c}`" for c in _RUN_COLUMNS)
+                with checkout(self.engine) as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"INSERT INTO {TABLE_RUN_METRICS} ({cols}) "
+                                       f"VALUES ({', '.join(['%s'] * len(_RUN_COLUMNS))})",
+                                       tuple(summary[c] for c in _RUN_COLUMNS))
+                    conn.commit()
+            except Exception as e:
+                log.warning(f"[{self.endpoint}] Falha ao gravar métricas da execução {self.run_id}: {e}")
+        if self.prom_dir:
+            write_prometheus(self.prom_dir, summary)
+        return summary
+
+
+# -----------------------------------------------------------------------------
+# Prometheus (formato texto)
+# -----------------------------------------------------------------------------
+# (campo do resumo, métrica, ajuda); tudo gauge, o valor é da última execução
+PROM_METRICS = (
+    ("seconds", "cvcrm_etl_run_seconds", "Duração da última execução"),
+    ("pages", "cvcrm_etl_pages", "Páginas processadas"),
+    ("pages_failed", "cvcrm_etl_pages_failed", "Páginas que ficaram pendentes"),
+    ("records", "cvcrm_etl_records", "Registros recebidos da API"),
+    ("records_per_s", "cvcrm_etl_records_per_second", "Registros da API por segundo"),
+    ("rows", "cvcrm_etl_rows", "Linhas enviadas ao upsert"),
+    ("inserted", "cvcrm_etl_rows_inserted", "Linhas inseridas"),
+    ("updated", "cvcrm_etl_rows_updated", "Linhas atualizadas"),
+    ("unchanged", "cvcrm_etl_rows_unchanged", "Linhas sem mudança"),
+    ("skipped", "cvcrm_etl_rows_skipped", "Linhas ignoradas pelo hash"),
+    ("deleted", "cvcrm_etl_rows_deleted", "Filhas apagadas no sync"),
+    ("errors", "cvcrm_etl_write_errors", "Lotes de upsert com erro"),
+    ("http_requests", "cvcrm_etl_http_requests", "Requisições HTTP bem-sucedidas"),
+    ("http_errors", "cvcrm_etl_http_errors", "Tentativas HTTP com falha"),
+    ("http_throttled", "cvcrm_etl_http_throttled", "Respostas 429/503"),
+    ("http_timeouts", "cvcrm_etl_http_timeouts", "Timeouts HTTP"),
+    ("bytes_wire", "cvcrm_etl_http_bytes_wire", "Bytes recebidos no fio"),
+    ("http_p95_ms", "cvcrm_etl_http_p95_ms", "Latência p95 das páginas (ms)"),
+    ("normalize_s", "cvcrm_etl_normalize_seconds", "Tempo de normalização"),
+    ("write_s", "cvcrm_etl_write_seconds", "Tempo de escrita no MySQL"),
+)
+
+
+def prometheus_text(summary: Dict[str, Any]) -> str:
+    """Resumo de uma execução como gauges Prometheus com label endpoint."""
+    labels = f'endpoint="{summary["endpoint"]}"'
+    lines = []
+    for key, name, help_text in PROM_METRICS:
+        value = summary.get(key)
+        if value is None:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{{{labels}}} {float(value):g}")
+    lines.append("# HELP cvcrm_etl_last_run_success 1 se a última execução terminou done")
+    lines.append("# TYPE cvcrm_etl_last_run_success gauge")
+    lines.append(f'cvcrm_etl_last_run_success{{{labels}}} {int(summary["status"] == "done")}')
+    lines.append("# HELP cvcrm_etl_last_run_timestamp_seconds Início da última execução (epoch)")
+    lines.append("# TYPE cvcrm_etl_last_run_timestamp_seconds gauge")
+    lines.append(f'cvcrm_etl_last_run_timestamp_seconds{{{labels}}} {summary["started_at"].timestamp():.0f}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(directory: str, summary: Dict[str, Any]) -> Optional[str]:
+    """Grava `<directory>/cvcrm_<endpoint>.prom` de forma atômica (textfile collector)."""
+    path = os.path.join(directory, f"cvcrm_{summary['endpoint']}.prom")
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(tmp, "w", encoding="utf8") as f:
+            f.write(prometheus_text(summary))
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning(f"[{summary['endpoint']}] Falha ao gravar {path}: {e}")
+        return None
+    return path
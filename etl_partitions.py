@@ -0,0 +1,294 @@
+import os
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+
+from etl_utils import checkout
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_partitions")
+log.setLevel(logging.INFO)
+
+# Partições mensais criadas à frente do mês corrente (folga para a manutenção)
+PARTITION_FUTURE_MONTHS = int(os.getenv("PARTITION_FUTURE_MONTHS") or "3")
+# Meses que ficam na tabela quente; partições inteiras mais antigas que isso
+# vão para <tabela><PARTITION_ARCHIVE_SUFFIX>
+PARTITION_HOT_MONTHS = int(os.getenv("PARTITION_HOT_MONTHS") or "24")
+PARTITION_ARCHIVE_SUFFIX = os.getenv("PARTITION_ARCHIVE_SUFFIX") or "_arquivo"
+
+# Última partição: recebe o que passar das mensais (manutenção atrasada)
+MAXVALUE_PARTITION = "pmax"
+
+# Tabelas já particionadas (run_partitions --enable). Nelas data_cad é NOT
+# NULL e faz parte da PK, então os runners descartam (com log) o registro sem
+# data_cad válida em vez de mandar NULL para o INSERT
+PARTITIONED_TABLES = {t.strip() for t in (os.getenv("PARTITIONED_TABLES") or "").split(",") if t.strip()}
+
+
+@dataclass(frozen=True)
+class PartitionedTable:
+    """Tabela de fato particionada por mês (RANGE COLUMNS) em `column`; `key` é a PK vinda da API."""
+    table: str
+    key: str
+    column: str = "data_cad"
+
+    @property
+    def archive(self) -> str:
+        return self.table + PARTITION_ARCHIVE_SUFFIX
+
+    @property
+    def swap(self) -> str:
+        """Tabela comum usada no EXCHANGE PARTITION (e que guarda a partição até ela chegar ao arquivo)."""
+        return self.table + "_troca"
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    bound: Optional[date]  # VALUES LESS THAN; None = MAXVALUE
+    rows: int              # estimativa do information_schema
+
+
+# data_cad e não referencia_data: a coluna de partição precisa entrar na PK, e
+# referencia_data muda a cada alteração no CRM (o upsert criaria outra linha
+# em vez de atualizar). data_cad não muda depois do cadastro.
+TABLES: Dict[str, PartitionedTable] = {
+    t.table: t for t in (
+        PartitionedTable("cv_reservas", "idreserva"),
+        PartitionedTable("cv_visitas", "idtarefa"),
+    )
+}
+
+
+def month_start(d: Union[date, datetime]) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _definition(month: date) -> str:
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1).isoformat()}')"
+
+
+def _months(first: date, last: date) -> List[date]:
+    """Meses de `first` a `last`, inclusive."""
+    months, m = [], month_start(first)
+    while m <= last:
+        months.append(m)
+        m = add_months(m, 1)
+    return months
+
+
+# -----------------------------------------------------------------------------
+# Leitura
+# -----------------------------------------------------------------------------
+def partitions(connection, table: str) -> List[Partition]:
+    """Partições da tabela em ordem (lista vazia = tabela não particionada)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+              FROM information_schema.PARTITIONS
+             WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+             ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            (table,))
+        rows = cursor.fetchall()
+    return [Partition(name, None if desc == "MAXVALUE" else date.fromisoformat(desc.strip("'")[:10]), int(n or 0))
+            for name, desc, n in rows]
+
+
+def _columns(connection, table: str) -> str:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION", (table,))
+        return ", ".join(f"`{c}`" for c, in cursor.fetchall())
+
+
+def _table_rows(connection, table: str) -> Optional[int]:
+    """Linhas estimadas da tabela (None = não existe)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+        row = cursor.fetchone()
+    return None if row is None else int(row[0] or 0)
+
+
+def partition_status(pt: PartitionedTable, engine=None) -> Dict[str, Any]:
+    """Partições (linhas estimadas), linhas na pmax e no arquivo."""
+    with checkout(engine) as conn:
+        parts = partitions(conn, pt.table)
+        archived = _table_rows(conn, pt.archive)
+        conn.commit()
+    return {
+        "table": pt.table,
+        "partitioned": bool(parts),
+        "partitions": [(p.name, p.bound.isoformat() if p.bound else "MAXVALUE", p.rows) for p in parts],
+        "hot_rows": sum(p.rows for p in parts),
+        # Linhas além da última partição mensal: falta rodar a manutenção
+        "overflow_rows": sum(p.rows for p in parts if p.bound is None),
+        "archive_rows": archived,
+    }
+
+
+# -----------------------------------------------------------------------------
+# Planejamento (SQL)
+# -----------------------------------------------------------------------------
+def partition_sql(pt: PartitionedTable, first: date, today: date, future: int) -> str:
+    """
+    ALTER TABLE que particiona a tabela: uma partição por mês de `first`
+    até `future` meses depois de `today`, mais a pmax. A coluna de partição
+    vira NOT NULL e entra na PK (exigência do MySQL para toda chave única).
+    """
+    months = _months(first, add_months(month_start(today), future))
+    definitions = [_definition(m) for m in months] + [f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)"]
+    return (f"ALTER TABLE {pt.table} MODIFY `{pt.column}` DATETIME NOT NULL, "
+            f"DROP PRIMARY KEY, ADD PRIMARY KEY (`{pt.key}`, `{pt.column}`) "
+            f"PARTITION BY RANGE COLUMNS(`{pt.column}`) ({', '.join(definitions)})")
+
+
+def future_sql(pt: PartitionedTable, parts: List[Partition], today: date, future: int) -> Optional[str]:
+    """ALTER TABLE que cria as partições mensais que faltam até `future` meses à frente (None = nada a criar)."""
+    bounds = [p.bound for p in parts if p.bound is not None]
+    months = _months(max(bounds) if bounds else today, add_months(month_start(today), future))
+    if not months:
+        return None
+    definitions = ", ".join(_definition(m) for m in months)
+    last = parts[-1]
+    if last.bound is None:
+        # Divide a pmax (vazia no caso normal, então é só metadado)
+        return (f"ALTER TABLE {pt.table} REORGANIZE PARTITION {last.name} INTO "
+                f"({definitions}, PARTITION {last.name} VALUES LESS THAN (MAXVALUE))")
+    return f"ALTER TABLE {pt.table} ADD PARTITION ({definitions})"
+
+
+def archive_candidates(parts: List[Partition], today: date, hot_months: int) -> List[Partition]:
+    """Partições inteiramente anteriores à janela quente (nunca a última que sobra)."""
+    cutoff = add_months(month_start(today), -hot_months)
+    return [p for p in parts[:-1] if p.bound is not None and p.bound <= cutoff]
+
+
+# -----------------------------------------------------------------------------
+# Manutenção
+# -----------------------------------------------------------------------------
+def enable_partitioning(pt: PartitionedTable, engine=None, today: Optional[date] = None,
+                        future: Optional[int] = None, dry_run: bool = False) -> Optional[str]:
+    """
+    Particiona a tabela (ALTER TABLE com cópia: rode fora do horário das
+    cargas). Devolve o SQL, ou None se a tabela já é particionada. Linhas
+    com a coluna de partição NULL impedem a conversão.
+    """
+    today = today or date.today()
+    future = PARTITION_FUTURE_MONTHS if future is None else future
+    with checkout(engine) as conn:
+        if partitions(conn, pt.table):
+            conn.commit()
+            return None
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT SUM(`{pt.column}` IS NULL), MIN(`{pt.column}`) FROM {pt.table}")
+            nulls, first = cursor.fetchone()
+        conn.commit()
+        if int(nulls or 0):
+            raise RuntimeError(f"{pt.table}: {nulls} linha(s) com {pt.column} NULL; a coluna de partição entra na "
+                               f"PK e não aceita NULL. Corrija essas linhas antes de particionar.")
+        sql = partition_sql(pt, month_start(first or today), today, future)
+        if not dry_run:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+            conn.commit()
+    return sql
+
+
+def add_future_partitions(pt: PartitionedTable, engine=None, today: Optional[date] = None,
+                          future: Optional[int] = None, dry_run: bool = False) -> Optional[str]:
+    """Cria as partições dos próximos meses. Devolve o SQL executado (None = já estavam criadas)."""
+    today = today or date.today()
+    future = PARTITION_FUTURE_MONTHS if future is None else future
+    with checkout(engine) as conn:
+        parts = partitions(conn, pt.table)
+        sql = future_sql(pt, parts, today, future) if parts else None
+        if sql and not dry_run:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+        conn.commit()
+    return sql
+
+
+def _flush_swap(connection, pt: PartitionedTable, columns: str) -> int:
+    """Copia o conteúdo da tabela de troca para o arquivo e a esvazia. Devolve as linhas copiadas."""
+    if _table_rows(connection, pt.swap) is None:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {pt.swap}")
+        n = cursor.fetchone()[0]
+        if n:
+            # REPLACE: registro já arquivado que voltou à tabela quente fica com a versão mais nova
+            cursor.execute(f"REPLACE INTO {pt.archive} ({columns}) SELECT {columns} FROM {pt.swap}")
+            connection.commit()
+            cursor.execute(f"TRUNCATE TABLE {pt.swap}")
+    return n
+
+
+def archive_partitions(pt: PartitionedTable, engine=None, today: Optional[date] = None,
+                       hot_months: Optional[int] = None, dry_run: bool = False,
+                       logger: Optional[logging.Logger] = None) -> Dict[str, int]:
+    """
+    Move as partições mais antigas que a janela quente para o arquivo.
+    Cada uma sai da tabela por EXCHANGE PARTITION (só metadado) com a
+    tabela de troca, a partição vazia é derrubada e só então as linhas são
+    copiadas para o arquivo, longe da tabela quente. Se a execução morrer
+    no meio, as linhas ficam na tabela de troca e a próxima as copia antes
+    de tudo. Devolve partição -> linhas arquivadas (estimadas em dry_run).
+
+    Um registro antigo alterado no CRM depois de arquivado volta para a
+    tabela quente (na partição mais antiga) e substitui o do arquivo quando
+    essa partição for arquivada.
+    """
+    today = today or date.today()
+    hot_months = PARTITION_HOT_MONTHS if hot_months is None else hot_months
+    moved: Dict[str, int] = {}
+    with checkout(engine) as conn:
+        old = archive_candidates(partitions(conn, pt.table), today, hot_months)
+        if dry_run:
+            conn.commit()
+            return {p.name: p.rows for p in old}
+        columns = _columns(conn, pt.table)
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {pt.archive} LIKE {pt.table}")
+            if partitions(conn, pt.archive):
+                cursor.execute(f"ALTER TABLE {pt.archive} REMOVE PARTITIONING")
+            leftover = _flush_swap(conn, pt, columns)
+            if leftover:
+                (logger or log).info(f"{pt.table}: {leftover} linha(s) de uma execução interrompida copiadas para {pt.archive}")
+            if not old:
+                cursor.execute(f"DROP TABLE IF EXISTS {pt.swap}")
+                conn.commit()
+                return moved
+            # Recriada a cada execução: o EXCHANGE exige a mesma estrutura da tabela atual
+            cursor.execute(f"DROP TABLE IF EXISTS {pt.swap}")
+            cursor.execute(f"CREATE TABLE {pt.swap} LIKE {pt.table}")
+            cursor.execute(f"ALTER TABLE {pt.swap} REMOVE PARTITIONING")
+            for p in old:
+                cursor.execute(f"ALTER TABLE {pt.table} EXCHANGE PARTITION {p.name} WITH TABLE {pt.swap}")
+                # Upsert que caiu na partição entre o EXCHANGE e o DROP vai junto
+                cursor.execute(f"REPLACE INTO {pt.swap} ({columns}) SELECT {columns} FROM {pt.table} PARTITION ({p.name})")
+                cursor.execute(f"DELETE FROM {pt.table} PARTITION ({p.name})")
+                conn.commit()
+                cursor.execute(f"ALTER TABLE {pt.table} DROP PARTITION {p.name}")
+                moved[p.name] = _flush_swap(conn, pt, columns)
+            cursor.execute(f"DROP TABLE IF EXISTS {pt.swap}")
+        conn.commit()
+    return moved
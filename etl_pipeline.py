@@ -0,0 +1,945 @@
+import os
+import time
+import argparse
+import queue
+import logging
+import threading
+from dataclasses import dataclass, replace
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from etl_cache import get_cache
+from etl_dates import date_stats
+from etl_dimensions import DimensionRef, dimension_loader
+from etl_http import (Endpoint, HttpStats, fetch_page, fetch_page_list, fetch_page_streamed, fetch_pages,
+                      next_page_size, total_pages_of)
+from etl_indexes import CVCRM_DEFER_INDEXES, drop_indexes, pending_warning, restore_indexes
+from etl_metrics import RunMetrics
+from etl_schema import TableSpec
+from etl_state import (WatermarkTracker, advance_watermark, committed_pages, find_resumable_run, format_watermark,
+                       get_tuning, get_watermark, mark_page, max_of, run_lock, save_tuning, start_run, update_run)
+from etl_utils import UPSERT_MODE, UnitOfWork, UpsertStats, get_pool, upsert_rows_stats
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_pipeline")
+log.setLevel(logging.INFO)
+
+# Capacidade das filas entre estágios (backpressure)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE") or "4")
+PIPELINE_LOAD_WORKERS = int(os.getenv("PIPELINE_LOAD_WORKERS") or "1")
+# Intervalo (s) do log periódico de vazão/filas; 0 desliga
+PIPELINE_MONITOR_INTERVAL = float(os.getenv("PIPELINE_MONITOR_INTERVAL") or "30")
+
+# Sync incremental: pede só o que mudou desde o watermark salvo em log_cvcrm
+CVCRM_INCREMENTAL = (os.getenv("CVCRM_INCREMENTAL") or "1") == "1"
+WATERMARK_PARAM = os.getenv("CVCRM_WATERMARK_PARAM") or "a_partir_data_referencia"
+
+# Retomada por checkpoint e rodadas extras para páginas que falharam
+CVCRM_RESUME = (os.getenv("CVCRM_RESUME") or "0") == "1"
+CVCRM_PAGE_RETRY_ROUNDS = int(os.getenv("CVCRM_PAGE_RETRY_ROUNDS") or "2")
+
+# Decodifica `dados` em streaming e normaliza no próprio worker de fetch,
+# sem guardar a resposta inteira nem os dicts dos registros
+CVCRM_STREAM = (os.getenv("CVCRM_STREAM") or "0") == "1"
+
+# Roda a carga só com as respostas do cache em disco (etl_cache), sem rede
+CVCRM_REPLAY = (os.getenv("CVCRM_REPLAY") or "0") == "1"
+
+# Linhas acumuladas por tabela antes do upsert, atravessando páginas da API
+# (0 = grava a cada página). TableSpec.flush_rows e
+# PIPELINE_FLUSH_ROWS_<TABELA> sobrescrevem por tabela.
+PIPELINE_FLUSH_ROWS = int(os.getenv("PIPELINE_FLUSH_ROWS") or "2000")
+# Lote mínimo por tabela no modo bulk (--bulk / UPSERT_MODE=bulk)
+PIPELINE_BULK_FLUSH_ROWS = int(os.getenv("PIPELINE_BULK_FLUSH_ROWS") or "20000")
+# Transação única para pai, filhas e checkpoints de várias páginas, com
+# commit a cada N páginas ou N linhas recebidas (os dois 0 = cada lote de
+# tabela faz o seu próprio commit)
+PIPELINE_COMMIT_PAGES = int(os.getenv("PIPELINE_COMMIT_PAGES") or "10")
+PIPELINE_COMMIT_ROWS = int(os.getenv("PIPELINE_COMMIT_ROWS") or "0")
+# Filhas com TableSpec.sync: apaga as linhas que sumiram do array do pai
+PIPELINE_CHILD_SYNC = (os.getenv("PIPELINE_CHILD_SYNC") or "1") == "1"
+
+_DONE = object()
+_POLL = 0.1
+
+
+class StageStats:
+    """Vazão e tempos de um estágio, e profundidade da fila que o alimenta."""
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wait_in_seconds = 0.0   # esperando item da fila de entrada
+        self.wait_out_seconds = 0.0  # bloqueado pela fila de saída (backpressure)
+        self.queue_max = 0
+        self.queue_samples = 0
+        self.queue_sum = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, busy: float, wait_in: float = 0.0, wait_out: float = 0.0) -> None:
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += busy
+            self.wait_in_seconds += wait_in
+            self.wait_out_seconds += wait_out
+
+    def sample_queue(self, depth: int) -> None:
+        with self._lock:
+            self.queue_max = max(self.queue_max, depth)
+            self.queue_samples += 1
+            self.queue_sum += depth
+
+    def snapshot(self, depth: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.monotonic()
+            elapsed = (end - self.started_at) if self.started_at else 0.0
+            return {
+                "stage": self.name,
+                "items": self.items,
+                "items_per_s": round(self.items / elapsed, 3) if elapsed > 0 else 0.0,
+                "busy_pct": round(100 * self.busy_seconds / (elapsed * self.workers), 1) if elapsed > 0 else 0.0,
+                "busy_s": round(self.busy_seconds, 3),
+                "wait_in_s": round(self.wait_in_seconds, 3),
+                "wait_out_s": round(self.wait_out_seconds, 3),
+                "queue_depth": depth,
+                "queue_max": self.queue_max,
+                "queue_avg": round(self.queue_sum / self.queue_samples, 2) if self.queue_samples else 0.0,
+            }
+
+
+class Pipeline:
+    """
+    Pipeline em estágios com filas limitadas entre eles.
+
+    `source` é iterado numa thread própria; cada estágio é (nome, função,
+    workers) e a saída de um alimenta a fila do próximo. Função que devolve
+    None descarta o item. Filas cheias seguram o estágio anterior
+    (backpressure). Se qualquer estágio falhar, os demais param, o `source`
+    é fechado e `run()` relança o primeiro erro.
+    """
+
+    def __init__(self, name: str, source: Iterable[Any], stages: List[Tuple[str, Callable[[Any], Any], int]],
+                 queue_size: int = PIPELINE_QUEUE_SIZE, monitor_interval: float = PIPELINE_MONITOR_INTERVAL,
+                 logger: Optional[logging.Logger] = None):
+        self.name = name
+        self.source = source
+        self.stages = stages
+        self.monitor_interval = monitor_interval
+        self.log = logger or log
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self.stats = [StageStats("source")] + [StageStats(n, max(1, w)) for n, _, w in stages]
+        self.errors: List[BaseException] = []
+        self._stop = threading.Event()
+        self._remaining = [max(1, w) for _, _, w in stages]
+        self._lock = threading.Lock()
+
+    # -- filas com parada cooperativa ---------------------------------------
+    def _put(self, q: "queue.Queue[Any]", item: Any, stats: StageStats) -> float:
+        t0 = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL)
+                stats.sample_queue(q.qsize())
+                break
+            except queue.Full:
+                continue
+        return time.monotonic() - t0
+
+    def _get(self, q: "queue.Queue[Any]") -> Tuple[Any, float]:
+        t0 = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL), time.monotonic() - t0
+            except queue.Empty:
+                continue
+        return _DONE, time.monotonic() - t0
+
+    def _fail(self, e: BaseException, where: str) -> None:
+        with self._lock:
+            self.errors.append(e)
+        self.log.error(f"[{self.name}] Erro no estágio {where}: {e}")
+        self._stop.set()
+
+    def _finish_stage(self, idx: int) -> None:
+        """Último worker do estágio `idx` avisa o próximo estágio que acabou."""
+        with self._lock:
+            self._remaining[idx] -= 1
+            last = self._remaining[idx] == 0
+        if last:
+            self.stats[idx + 1].finished_at = time.monotonic()
+            if idx + 1 < len(self.stages):
+                for _ in range(self._remaining[idx + 1]):
+                    self._put(self.queues[idx + 1], _DONE, self.stats[idx + 2])
+
+    # -- threads --------------------------------------------------------------
+    def _run_source(self) -> None:
+        stats = self.stats[0]
+        stats.started_at = time.monotonic()
+        it = iter(self.source)
+        try:
+            while not self._stop.is_set():
+                t0 = time.monotonic()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                busy = time.monotonic() - t0
+                stats.record(busy, wait_out=self._put(self.queues[0], item, self.stats[1]))
+        except Exception as e:
+            self._fail(e, "source")
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+            stats.finished_at = time.monotonic()
+            for _ in range(self._remaining[0]):
+                self._put(self.queues[0], _DONE, self.stats[1])
+
+    def _run_stage(self, idx: int) -> None:
+        name, fn, _ = self.stages[idx]
+        stats = self.stats[idx + 1]
+        if stats.started_at is None:
+            stats.started_at = time.monotonic()
+        q_in = self.queues[idx]
+        q_out = self.queues[idx + 1] if idx + 1 < len(self.stages) else None
+        try:
+            while True:
+                item, wait_in = self._get(q_in)
+                if item is _DONE:
+                    break
+                t0 = time.monotonic()
+                out = fn(item)
+                busy = time.monotonic() - t0
+                wait_out = 0.0
+                if q_out is not None and out is not None:
+                    wait_out = self._put(q_out, out, self.stats[idx + 2])
+                stats.record(busy, wait_in, wait_out)
+        except Exception as e:
+            self._fail(e, name)
+        finally:
+            self._finish_stage(idx)
+
+    def _run_monitor(self) -> None:
+        while not self._stop.wait(self.monitor_interval):
+            self.log.info(f"[{self.name}] Pipeline: {self.snapshot()}")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        depths = [None] + [q.qsize() for q in self.queues]
+        return [s.snapshot(d) for s, d in zip(self.stats, depths)]
+
+    def run(self) -> List[Dict[str, Any]]:
+        threads = [threading.Thread(target=self._run_source, name=f"{self.name}-source", daemon=True)]
+        for idx, (name, _, workers) in enumerate(self.stages):
+            for w in range(max(1, workers)):
+                threads.append(threading.Thread(target=self._run_stage, args=(idx,),
+                                                name=f"{self.name}-{name}-{w}", daemon=True))
+        for t in threads:
+            t.start()
+
+        monitor = None
+        if self.monitor_interval > 0:
+            monitor = threading.Thread(target=self._run_monitor, name=f"{self.name}-monitor", daemon=True)
+            monitor.start()
+        try:
+            for t in threads:
+                t.join()
+        finally:
+            self._stop.set()
+            if monitor is not None:
+                monitor.join()
+
+        if self.errors:
+            raise self.errors[0]
+        return self.snapshot()
+
+
+# -----------------------------------------------------------------------------
+# Buffers por tabela (lotes independentes das páginas)
+# -----------------------------------------------------------------------------
+def flush_rows_for(spec: TableSpec) -> int:
+    env = os.getenv(f"PIPELINE_FLUSH_ROWS_{spec.name.upper()}")
+    if env:
+        return int(env)
+    return spec.flush_rows or PIPELINE_FLUSH_ROWS
+
+
+class TableBuffers:
+    """
+    Acumula as linhas normalizadas por tabela e grava cada tabela quando ela
+    junta o seu `flush_rows`, independente das páginas da API: as filhas
+    (poucas linhas por página) saem em lotes grandes em vez de vários upserts
+    pequenos.
+
+    Uma página só conclui (`on_page(página, ok)`) quando todas as tabelas que
+    receberam linhas dela já gravaram; se algum lote com linhas dela falhar,
+    ela conclui com ok=False. Com isso checkpoint e watermark continuam
+    valendo só para o que já está no banco.
+
+    Com `unit` (UnitOfWork), os lotes entram numa transação só, que fecha a
+    cada `commit_pages` páginas ou `commit_rows` linhas: antes do commit as
+    tabelas são esvaziadas e `checkpoint(páginas)` grava os checkpoints na
+    mesma transação, então nenhuma página fica meio gravada entre tabelas.
+    Um erro desfaz a transação e todas as páginas dela concluem com falha.
+    As escritas são serializadas na conexão da unidade.
+
+    `parents` em `add` traz, por tabela filha sincronizada, as chaves dos
+    pais da página; elas acompanham as linhas até o lote (mesmo sem linhas,
+    para apagar as filhas de um pai que ficou sem nenhuma).
+    """
+
+    def __init__(self, specs: Dict[str, TableSpec],
+                 write: Callable[[TableSpec, List[Tuple[Any, ...]], List[Tuple[Any, ...]]], UpsertStats],
+                 on_page: Callable[[int, bool], None], logger: Optional[logging.Logger] = None,
+                 min_rows: int = 0, unit: Optional[UnitOfWork] = None,
+                 commit_pages: int = 0, commit_rows: int = 0,
+                 checkpoint: Optional[Callable[[List[int]], None]] = None):
+        self.specs = specs
+        self.write = write
+        self.on_page = on_page
+        self.logger = logger or log
+        self.thresholds = {name: max(flush_rows_for(spec), min_rows) for name, spec in specs.items()}
+        self.unit = unit
+        self.commit_pages = commit_pages
+        self.commit_rows = commit_rows
+        self.checkpoint = checkpoint
+        self.stats = UpsertStats()
+        self.flushes: Dict[str, int] = {name: 0 for name in specs}
+        self.commits = 0
+        self._rows: Dict[str, List[Tuple[Any, ...]]] = {name: [] for name in specs}
+        self._pages: Dict[str, Set[int]] = {name: set() for name in specs}
+        self._chunks: Dict[str, List[Tuple[int, int]]] = {name: [] for name in specs}  # (página, linhas) em ordem
+        self._parents: Dict[str, Dict[int, List[Tuple[Any, ...]]]] = {name: {} for name in specs}
+        self._open: Dict[int, int] = {}  # página -> tabelas com linhas dela ainda não gravadas
+        self._failed: Set[int] = set()
+        self._lock = threading.Lock()
+        # Transação aberta (só com `unit`)
+        self._tx_lock = threading.RLock()
+        self._tx_stats = UpsertStats()
+        self._tx_pages: Set[int] = set()    # páginas com linhas já enviadas na transação
+        self._tx_written: List[int] = []    # páginas inteiras na transação, aguardando commit
+        self._tx_added_pages = 0
+        self._tx_added_rows = 0
+
+    def _take(self, name: str) -> Tuple[str, List[Tuple[Any, ...]], Set[int], List[Tuple[int, int]]]:
+        batch = (name, self._rows[name], self._pages[name], self._chunks[name])
+        self._rows[name], self._pages[name], self._chunks[name] = [], set(), []
+        return batch
+
+    def _discard(self, rows: List[Tuple[Any, ...]], chunks: List[Tuple[int, int]], failed: Set[int],
+                 finished: Set[int]) -> Tuple[List[Tuple[Any, ...]], List[Tuple[int, int]]]:
+        """Tira de `rows` as linhas das páginas em `failed` (sob o lock); as que fecham vão para `finished`."""
+        kept: List[Tuple[Any, ...]] = []
+        kept_chunks: List[Tuple[int, int]] = []
+        pos = 0
+        for page, n in chunks:
+            if page in failed:
+                self._open[page] -= 1
+                if not self._open[page]:
+                    del self._open[page]
+                    finished.add(page)
+            else:
+                kept.extend(rows[pos:pos + n])
+                kept_chunks.append((page, n))
+            pos += n
+        return kept, kept_chunks
+
+    def _pop_parents(self, name: str, pages: Set[int], keep: Set[int]) -> List[Tuple[Any, ...]]:
+        """Chaves de pai das páginas do lote (sob o lock); as de fora de `keep` são descartadas."""
+        store = self._parents[name]
+        parents: List[Tuple[Any, ...]] = []
+        for page in sorted(pages):
+            keys = store.pop(page, None)
+            if keys and page in keep:
+                parents.extend(keys)
+        return parents
+
+    def _due(self) -> List[str]:
+        return [name for name, rows in self._rows.items()
+                if self._pages[name] and len(rows) >= self.thresholds[name]]
+
+    def add(self, page: int, tables: Dict[str, List[Tuple[Any, ...]]],
+            parents: Optional[Dict[str, List[Tuple[Any, ...]]]] = None) -> None:
+        with self._lock:
+            pending = 0
+            for name, rows in tables.items():
+                keys = parents.get(name) if parents else None
+                if rows or keys:
+                    self._rows[name].extend(rows)
+                    self._pages[name].add(page)
+                    self._chunks[name].append((page, len(rows)))
+                    if keys:
+                        self._parents[name][page] = keys
+                    self._tx_added_rows += len(rows)
+                    pending += 1
+            if pending:
+                self._open[page] = pending
+            elif self.unit:
+                self._tx_written.append(page)
+            self._tx_added_pages += 1
+            batches = [self._take(name) for name in self._due()]
+        if not pending and not self.unit:
+            self.on_page(page, True)
+        for batch in batches:
+            self._write(*batch)
+        if self.unit and self._commit_due():
+            self.commit()
+
+    def _commit_due(self) -> bool:
+        with self._lock:
+            return ((self.commit_pages > 0 and self._tx_added_pages >= self.commit_pages)
+                    or (self.commit_rows > 0 and self._tx_added_rows >= self.commit_rows))
+
+    def _write(self, name: str, rows: List[Tuple[Any, ...]], pages: Set[int],
+               chunks: List[Tuple[int, int]]) -> None:
+        if self.unit:
+            with self._tx_lock:
+                self._write_in_tx(name, rows, pages, chunks)
+            return
+        with self._lock:
+            parents = self._pop_parents(name, pages, pages)
+        stats = self.write(self.specs[name], rows, parents)
+        self.logger.info(f"Lote {name}: {len(rows)} linha(s) de {len(pages)} página(s)"
+                         f"{' com ERRO' if stats.errors else ''}")
+        finished = []
+        with self._lock:
+            self.stats += stats
+            self.flushes[name] += 1
+            for page in pages:
+                if stats.errors:
+                    self._failed.add(page)
+                self._open[page] -= 1
+                if not self._open[page]:
+                    del self._open[page]
+                    finished.append((page, page not in self._failed))
+        for page, ok in sorted(finished):
+            self.on_page(page, ok)
+
+    def _write_in_tx(self, name: str, rows: List[Tuple[Any, ...]], pages: Set[int],
+                     chunks: List[Tuple[int, int]]) -> None:
+        finished: Set[int] = set()
+        with self._lock:
+            # Lote separado antes de um rollback: as páginas desfeitas saem dele
+            kept = pages - self._failed
+            if kept != pages:
+                rows, chunks = self._discard(rows, chunks, self._failed, finished)
+            parents = self._pop_parents(name, pages, kept)
+            pages = kept
+        for page in sorted(finished):
+            self.on_page(page, False)
+        if not pages:
+            return
+        error: Optional[Exception] = None
+        try:
+            stats = self.write(self.specs[name], rows, parents)
+        except Exception as e:
+            error, stats = e, UpsertStats(errors=1)
+        self.logger.info(f"Lote {name}: {len(rows)} linha(s) de {len(pages)} página(s)"
+                         f"{' com ERRO' if error else ''}")
+        with self._lock:
+            self.flushes[name] += 1
+            self._tx_stats += stats
+            self._tx_pages |= pages
+            for page in pages:
+                self._open[page] -= 1
+                if not self._open[page]:
+                    del self._open[page]
+                    self._tx_written.append(page)
+        if error:
+            self._rollback(error)
+
+    def _rollback(self, error: Exception) -> None:
+        """Desfaz a transação: tudo que estava nela (inteiro ou em parte) falha."""
+        self.logger.error(f"Erro na transação, rollback: {error}")
+        try:
+            self.unit.rollback()
+        except Exception as e:
+            self.logger.error(f"Falha no rollback: {e}")
+        with self._lock:
+            failed = self._tx_pages | set(self._tx_written)
+            self._failed |= failed
+            finished = set(self._tx_written)
+            # O que as páginas desfeitas ainda tinham no buffer também sai: nada
+            # delas é gravado pela metade numa transação seguinte
+            for name, chunks in self._chunks.items():
+                if self._pages[name] & failed:
+                    self._rows[name], self._chunks[name] = self._discard(self._rows[name], chunks, failed, finished)
+                    self._pop_parents(name, self._pages[name] & failed, set())
+                    self._pages[name] -= failed
+            self.stats.errors += 1
+            self._reset_tx()
+        for page in sorted(finished):
+            self.on_page(page, False)
+
+    def _reset_tx(self) -> None:
+        self._tx_stats = UpsertStats()
+        self._tx_pages = set()
+        self._tx_written = []
+        self._tx_added_pages = 0
+        self._tx_added_rows = 0
+
+    def commit(self) -> None:
+        """Esvazia todas as tabelas na transação, grava os checkpoints e faz commit."""
+        with self._tx_lock:
+            with self._lock:
+                batches = [self._take(name) for name, pages in self._pages.items() if pages]
+            for batch in batches:
+                self._write_in_tx(*batch)
+            with self._lock:
+                pages = sorted(self._tx_written)
+                if not pages and not self._tx_pages:
+                    return
+                ok = [p for p in pages if p not in self._failed]
+            try:
+                if self.checkpoint and ok:
+                    self.checkpoint(ok)
+                self.unit.commit()
+            except Exception as e:
+                self._rollback(e)
+                return
+            with self._lock:
+                stats, n_rows = self._tx_stats, self._tx_added_rows
+                self.stats += stats
+                self.commits += 1
+                self._reset_tx()
+        self.logger.info(f"Commit: {len(pages)} página(s), {stats.rows} linha(s) gravadas "
+                         f"({n_rows} recebidas)")
+        for page in pages:
+            self.on_page(page, page in ok)
+
+    def flush(self) -> None:
+        """Grava o que sobrou em todas as tabelas (fim da carga)."""
+        if self.unit:
+            self.commit()
+            return
+        with self._lock:
+            batches = [self._take(name) for name, pages in self._pages.items() if pages]
+        for batch in batches:
+            self._write(*batch)
+
+
+# -----------------------------------------------------------------------------
+# Runner padrão: fetch -> transform -> load
+# -----------------------------------------------------------------------------
+@dataclass
+class LoadOptions:
+    """
+    Opções de `run_paged_load`; None fica com o padrão do ambiente.
+
+    `upsert_mode="bulk"` (--bulk) grava com LOAD DATA LOCAL INFILE. Ele não
+    é ligado por `defer_indexes`: a carga inicial pede os dois explicitamente
+    (--bulk --defer-indexes).
+    """
+    ordered: bool = True
+    watermark: Optional[Tuple[str, str]] = None
+    resume: Optional[bool] = None
+    stream: Optional[bool] = None
+    replay: Optional[bool] = None
+    upsert_mode: Optional[str] = None
+    commit_pages: Optional[int] = None
+    commit_rows: Optional[int] = None
+    pages: Optional[Tuple[int, Optional[int]]] = None
+    dimensions: Optional[List[DimensionRef]] = None
+    defer_indexes: Optional[bool] = None
+
+    def resolved(self) -> "LoadOptions":
+        """Cópia com os None trocados pelos padrões do ambiente."""
+        return replace(
+            self,
+            resume=CVCRM_RESUME if self.resume is None else self.resume,
+            stream=CVCRM_STREAM if self.stream is None else self.stream,
+            replay=CVCRM_REPLAY if self.replay is None else self.replay,
+            upsert_mode=(self.upsert_mode or UPSERT_MODE).lower(),
+            commit_pages=PIPELINE_COMMIT_PAGES if self.commit_pages is None else self.commit_pages,
+            commit_rows=PIPELINE_COMMIT_ROWS if self.commit_rows is None else self.commit_rows,
+            defer_indexes=CVCRM_DEFER_INDEXES if self.defer_indexes is None else self.defer_indexes,
+        )
+
+    @property
+    def incremental(self) -> bool:
+        return bool(self.watermark) and CVCRM_INCREMENTAL
+
+
+def _fetcher(transform: Callable, opts: LoadOptions):
+    """(cache, fetch): busca de página normal ou em streaming, com o cache em disco."""
+    cache = get_cache(opts.replay)
+    if opts.stream:
+        return cache, partial(fetch_page_streamed, consume=transform, cache=cache, replay=opts.replay)
+    return cache, partial(fetch_page, cache=cache, replay=opts.replay)
+
+
+def _run_filters(api_name: str, endpoint: Endpoint, filters: Dict[str, Any], opts: LoadOptions, cache, pool,
+                 logger: logging.Logger) -> Tuple[Dict[str, Any], Optional[Tuple[int, int, float]]]:
+    """
+    Filtros de uma execução nova: os gravados no cache (replay), o watermark
+    (incremental) e o registros_por_pagina de etl_tuning (adaptativo).
+    Devolve (filtros, ajuste salvo ou None).
+    """
+    tuning = None
+    if opts.replay:
+        recorded = cache.load_filters(endpoint.name)
+        filters = filters if recorded is None else recorded
+        logger.info(f"[{api_name}] Replay do cache {cache.root} | filtros={filters}")
+    elif opts.incremental:
+        current = get_watermark(endpoint.name, pool)
+        if current:
+            filters = {**filters, WATERMARK_PARAM: format_watermark(current)}
+            logger.info(f"[{api_name}] Incremental a partir de {opts.watermark[1]} >= {format_watermark(current)}")
+        else:
+            logger.info(f"[{api_name}] Sem watermark salvo; carga completa.")
+    if "registros_por_pagina" not in filters:
+        page_size = endpoint.page_size
+        if endpoint.adaptive_page_size and not opts.replay:
+            tuning = get_tuning(endpoint.name, pool)
+            if tuning:
+                page_size = max(endpoint.page_size_min, min(endpoint.page_size_max, tuning[0]))
+                logger.info(f"[{api_name}] registros_por_pagina ajustado: {page_size}")
+        filters = {**filters, "registros_por_pagina": page_size}
+    if cache and not opts.replay:
+        cache.save_filters(endpoint.name, filters)
+    return filters, tuning
+
+
+def _open_run(api_name: str, endpoint: Endpoint, filters: Dict[str, Any], opts: LoadOptions, cache, pool,
+              logger: logging.Logger):
+    """
+    Retoma a última execução incompleta (com `resume`) ou abre uma nova.
+    Devolve (run_id, filtros, total de páginas conhecido, páginas já
+    gravadas -> watermark, ajuste do tamanho de página).
+    """
+    resumed = find_resumable_run(endpoint.name, pool) if opts.resume else None
+    if resumed:
+        run_id, filters, known_total = resumed
+        done_pages = committed_pages(endpoint.name, run_id, pool)
+        logger.info(f"[{api_name}] Retomando execução {run_id}: {len(done_pages)} página(s) já gravadas "
+                    f"de {known_total or '?'} | filtros={filters}")
+        return run_id, filters, known_total or 1, done_pages, None
+    if opts.resume:
+        logger.info(f"[{api_name}] Nada a retomar; nova execução.")
+    filters, tuning = _run_filters(api_name, endpoint, filters, opts, cache, pool, logger)
+    return start_run(endpoint.name, filters, pool), filters, 1, {}, tuning
+
+
+def _retune(api_name: str, endpoint: Endpoint, filters: Dict[str, Any], tuning, pool, logger: logging.Logger) -> None:
+    """Reajusta registros_por_pagina pela vazão medida nesta execução (next_page_size)."""
+    page_size = int(filters.get("registros_por_pagina") or endpoint.page_size)
+    tuned = next_page_size(endpoint, page_size, tuning[1:] if tuning else None)
+    if tuned:
+        save_tuning(endpoint.name, tuned[0], page_size, tuned[1], tuned[2], pool)
+        logger.info(f"[{api_name}] registros_por_pagina: {page_size} -> {tuned[0]} "
+                    f"({tuned[1]} registros/s por requisição)")
+
+
+def run_paged_load(api_name: str, endpoint: Endpoint, filters: Dict[str, Any],
+                   transform: Callable[[Iterable[Dict[str, Any]]], Dict[str, List[Tuple[Any, ...]]]],
+                   specs: Dict[str, TableSpec], logger: Optional[logging.Logger] = None, pool=None,
+                   options: Optional[LoadOptions] = None) -> UpsertStats:
+    """
+    Carga paginada de um endpoint em pipeline: as páginas são buscadas,
+    normalizadas por `transform` (dados -> {tabela: tuplas}) e gravadas por
+    upsert, com os três estágios rodando em paralelo. `specs` dá as colunas e
+    a PK de cada tabela devolvida por `transform`; `options` (LoadOptions)
+    liga os recursos abaixo.
+
+    Com `watermark=(tabela, coluna)` e CVCRM_INCREMENTAL ligado, a busca
+    parte do watermark salvo. Ele só avança quando a execução termina sem
+    nenhuma página pendente (retomadas contam as páginas já gravadas).
+
+    Cada página gravada vira um checkpoint da execução; páginas que falham
+    vão para uma fila de retry em vez de encerrar a carga. Com `resume`, a
+    última execução incompleta do endpoint continua (mesmos filtros) só
+    pelas páginas que ainda não foram gravadas. A carga roda sob o lock do
+    endpoint (run_lock): uma segunda execução simultânea falha em vez de
+    retomar a que está rodando.
+
+    Com `stream` (CVCRM_STREAM), cada página é decodificada registro a
+    registro e passa direto por `transform`, que deve aceitar um iterável.
+
+    As linhas vão para `TableBuffers` e cada tabela grava em lotes do seu
+    `flush_rows`; o checkpoint de uma página sai quando todas as suas linhas
+    estiverem gravadas.
+
+    `upsert_mode="bulk"` (backfill) grava com LOAD DATA LOCAL INFILE em
+    lotes de pelo menos PIPELINE_BULK_FLUSH_ROWS linhas por tabela.
+
+    Com `commit_pages`/`commit_rows` (PIPELINE_COMMIT_PAGES/_ROWS) a carga
+    grava numa UnitOfWork: dados e checkpoints de várias páginas saem num
+    commit só.
+
+    Filhas com `sync` (PIPELINE_CHILD_SYNC) recebem as chaves dos pais de
+    cada página e apagam, no mesmo lote, as linhas que sumiram do array.
+
+    Com CVCRM_CACHE as respostas ficam em disco; com `replay` a carga usa só
+    o cache, com os mesmos filtros da última execução que o preencheu.
+
+    Com `endpoint.adaptive_page_size`, o registros_por_pagina sai de
+    etl_tuning e, no fim, é reajustado pela vazão medida (next_page_size).
+    O tamanho usado vai nos filtros da execução, então a retomada repete.
+
+    Métricas por página e da execução vão para log_cvcrm (RunMetrics); o
+    resumo, com o status final de etl_run (done/partial/failed), fica em
+    `endpoint.last_run`.
+
+    `pages=(primeira, última)` limita a carga a uma faixa de páginas (shard de
+    backfill); com última None, vai até o total informado pela API.
+
+    Com CVCRM_DIMENSIONS, os pares (id, nome) de `dimensions` vão para as
+    tabelas dim_* antes dos fatos, cada membro gravado uma vez por processo
+    (DimensionLoader).
+
+    Com `defer_indexes` (CVCRM_DEFER_INDEXES, carga inicial) os índices
+    secundários das tabelas de `specs` caem antes da carga e voltam num
+    ALTER TABLE por tabela no fim, conferidos contra database/CVCRM.sql.
+    Sem ele, só avisa se houver índices adiados pendentes; False explícito
+    (shards do run_backfill, que adia no coordenador) nem consulta.
+    """
+    logger = logger or log
+    pool = pool or get_pool()
+    options = options or LoadOptions()
+    opts = options.resolved()
+    with run_lock(endpoint.name, pool):
+        if options.defer_indexes is None and not opts.defer_indexes:
+            pending_warning(list(specs), pool, logger, f"[{api_name}] ")
+        if opts.defer_indexes:
+            dropped = {t: len(names) for t, names in drop_indexes(list(specs), pool).items()}
+            logger.info(f"[{api_name}] Índices secundários adiados até o fim da carga: {dropped or 'nenhum'}")
+        try:
+            return _load_pages(api_name, endpoint, filters, transform, specs, logger, pool, opts)
+        finally:
+            if opts.defer_indexes:
+                restore_indexes(list(specs), pool, logger, f"[{api_name}] ")
+
+
+def _load_pages(api_name: str, endpoint: Endpoint, filters: Dict[str, Any], transform: Callable,
+                specs: Dict[str, TableSpec], logger: logging.Logger, pool, opts: LoadOptions) -> UpsertStats:
+    """Corpo de `run_paged_load`, com as opções já resolvidas."""
+    ordered, watermark, pages = opts.ordered, opts.watermark, opts.pages
+    cache, fetch = _fetcher(transform, opts)
+    unit = (UnitOfWork(pool, mode=opts.upsert_mode)
+            if opts.commit_pages > 0 or opts.commit_rows > 0 else None)
+    # Filhas sincronizadas: posição das chaves do pai nas linhas da tabela base
+    base = next((spec for spec in specs.values() if not spec.array), None)
+    sync_index = {name: spec.parent_index(base) for name, spec in specs.items()
+                  if spec.sync and base is not None and PIPELINE_CHILD_SYNC}
+    failed_loads: List[int] = []
+    # página -> (registros API, linhas, watermark, segundos de normalização)
+    page_info: Dict[int, Tuple[int, int, Optional[Any], float]] = {}
+    totals_lock = threading.Lock()
+    # Latência/vazão desta execução (base do ajuste do tamanho de página)
+    endpoint.stats = HttpStats()
+    endpoint.last_run = None
+
+    run_id, filters, known_total, done_pages, tuning = _open_run(api_name, endpoint, filters, opts, cache, pool,
+                                                                 logger)
+    # discover: página que traz o total (fetch_pages); sem ela não dá para seguir
+    state: Dict[str, Any] = {"total_pages": known_total, "registros_api": 0, "aborted": False, "discover": 1}
+    metrics = RunMetrics(endpoint.name, run_id, pool)
+    dims = dimension_loader(opts.dimensions, specs, pool)
+
+    tracker: Optional[WatermarkTracker] = None
+    wm_index = specs[watermark[0]].index(watermark[1]) if watermark else None
+    if opts.incremental:
+        tracker = WatermarkTracker()
+        for page, page_max in done_pages.items():
+            tracker.page_done(page, page_max)
+
+    def first_pass():
+        if pages:
+            first, last = pages
+            last = last or (state["total_pages"] if state["total_pages"] > 1 else None)
+            if last is None:
+                state["discover"] = first
+                return fetch_pages(endpoint, filters, ordered=ordered, start_page=first, fetch=fetch)
+            state["discover"] = None
+            pending = [p for p in range(first, last + 1) if p not in done_pages]
+            return fetch_page_list(endpoint, pending, filters, ordered=ordered, fetch=fetch)
+        # Retomada com total conhecido: só as páginas que faltam
+        if state["total_pages"] > 1:
+            pending = [p for p in range(1, state["total_pages"] + 1) if p not in done_pages]
+            return fetch_page_list(endpoint, pending, filters, ordered=ordered, fetch=fetch)
+        # Página 1 descobre o total; as demais chegam em paralelo (endpoint.concurrency)
+        return fetch_pages(endpoint, filters, ordered=ordered, fetch=fetch)
+
+    def source():
+        failed: List[int] = []
+        pages = first_pass()
+        for round_no in range(0, CVCRM_PAGE_RETRY_ROUNDS + 1):
+            if round_no:
+                if not failed:
+                    break
+                logger.info(f"[{api_name}] Retry {round_no}/{CVCRM_PAGE_RETRY_ROUNDS} de {len(failed)} página(s): {failed}")
+                pages, failed = fetch_page_list(endpoint, failed, filters, ordered=ordered, fetch=fetch), []
+            try:
+                for page, data in pages:
+                    if not data:
+                        if page == state["discover"] and round_no == 0 and state["total_pages"] <= 1:
+                            # Sem a primeira página não há total de páginas: não dá para seguir
+                            logger.error(f"[{api_name}] Página {page}: resposta vazia/erro. Encerrando.")
+                            state["aborted"] = True
+                            return
+                        logger.warning(f"[{api_name}] Página {page}: resposta vazia/erro. Vai para a fila de retry.")
+                        failed.append(page)
+                        continue
+                    if page in done_pages:
+                        continue
+                    total = total_pages_of(data, state["total_pages"])
+                    if total != state["total_pages"] or page == 1:
+                        state["total_pages"] = total
+                        update_run(run_id, total_pages=total, engine=pool)
+                    yield page, data
+            finally:
+                pages.close()
+        for page in failed:
+            mark_page(endpoint.name, run_id, page, "failed", engine=pool)
+            metrics.page(page, "failed", endpoint.stats.pop_page(page))
+        state["failed_fetch"] = failed
+
+    def transform_stage(item):
+        page, data = item
+        logger.info(f"[{api_name}] Processando página {page}/{state['total_pages']} ...")
+        t0 = time.monotonic()
+        if "resultado" in data:
+            # Já normalizada durante o download (stream)
+            tables, n_api = data["resultado"], data["registros"]
+        else:
+            dados_page: List[Dict[str, Any]] = data.get("dados") or []
+            tables, n_api = transform(dados_page), len(dados_page)
+        page_max = max_of(tables.get(watermark[0]), wm_index) if tracker else None
+        return page, n_api, tables, page_max, time.monotonic() - t0
+
+    def write(spec: TableSpec, rows: List[Tuple[Any, ...]], parents: List[Tuple[Any, ...]]) -> UpsertStats:
+        t0 = time.monotonic()
+        try:
+            if unit:
+                return unit.upsert(spec.name, rows, list(spec.pk), columns=spec.column_names,
+                                   parent_columns=spec.parent_columns, parents=parents)
+            return upsert_rows_stats(pool, spec.name, rows, pk_columns=list(spec.pk), columns=spec.column_names,
+                                     mode=opts.upsert_mode, parent_columns=spec.parent_columns, parents=parents)
+        finally:
+            metrics.add_write_time(time.monotonic() - t0)
+
+    def on_page(page: int, ok: bool) -> None:
+        with totals_lock:
+            n_api, n_rows, page_max, seconds = page_info.pop(page)
+        metrics.page(page, "done" if ok else "failed", endpoint.stats.pop_page(page), n_api, n_rows, seconds)
+        if not ok:
+            mark_page(endpoint.name, run_id, page, "failed", n_rows, engine=pool)
+            with totals_lock:
+                failed_loads.append(page)
+            return
+        # Checkpoint só depois do commit da página; o watermark espera o fim da execução
+        if unit is None:
+            mark_page(endpoint.name, run_id, page, "done", n_rows, page_max, engine=pool)
+        if tracker:
+            tracker.page_done(page, page_max)
+        totals = buffers.stats
+        logger.info(f"[{api_name}] Página {page} gravada. Registros API: {n_api} | Upserts acumulados: {totals.rows} "
+                    f"(inseridos={totals.inserted} atualizados={totals.updated} inalterados={totals.unchanged} "
+                    f"ignorados={totals.skipped})")
+
+    def checkpoint(pages: List[int]) -> None:
+        # Na transação da UnitOfWork, antes do commit: o checkpoint entra junto com os dados
+        for page in pages:
+            with totals_lock:
+                _, n_rows, page_max, _ = page_info[page]
+            mark_page(endpoint.name, run_id, page, "done", n_rows, page_max, engine=unit.connection, commit=False)
+
+    buffers = TableBuffers(specs, write, on_page, logger,
+                           min_rows=PIPELINE_BULK_FLUSH_ROWS if opts.upsert_mode == "bulk" else 0,
+                           unit=unit, commit_pages=opts.commit_pages, commit_rows=opts.commit_rows, checkpoint=checkpoint)
+
+    def load_stage(item):
+        page, n_api, tables, page_max, seconds = item
+        with totals_lock:
+            page_info[page] = (n_api, sum(len(rows) for rows in tables.values()), page_max, seconds)
+            state["registros_api"] += n_api
+        if dims:
+            tables = dims.apply(tables)
+        base_rows = (tables.get(base.name) or []) if sync_index else []
+        parents = {name: [tuple(r[i] for i in idx) for r in base_rows]
+                   for name, idx in sync_index.items() if name in tables}
+        buffers.add(page, tables, parents)
+
+    pipeline = Pipeline(api_name, source(), [
+        ("transform", transform_stage, 1),
+        ("load", load_stage, PIPELINE_LOAD_WORKERS),
+    ], logger=logger)
+    if unit:
+        unit.open()
+    try:
+        stage_stats = pipeline.run()
+        # Restos abaixo do limite de cada tabela
+        buffers.flush()
+    except Exception:
+        update_run(run_id, status="failed", engine=pool)
+        endpoint.last_run = metrics.finish("failed", state["registros_api"], buffers.stats, endpoint.stats.snapshot())
+        raise
+    finally:
+        if unit:
+            unit.close()
+    totals = buffers.stats
+
+    failed_pages = sorted(set(state.get("failed_fetch", [])) | set(failed_loads))
+    status = "failed" if state["aborted"] else ("partial" if failed_pages else "done")
+    # Watermark só com todas as páginas gravadas: numa execução parcial, o
+    # máximo das páginas boas pularia registros mais antigos das que faltam
+    if tracker and status == "done" and tracker.value is not None:
+        advance_watermark(endpoint.name, watermark[1], tracker.value, pool)
+    update_run(run_id, status=status, engine=pool)
+    summary = metrics.finish(status, state["registros_api"], totals, endpoint.stats.snapshot())
+    endpoint.last_run = summary
+    if endpoint.adaptive_page_size and not opts.replay and not state["aborted"]:
+        _retune(api_name, endpoint, filters, tuning, pool, logger)
+
+    logger.info(f"[{api_name}] Finalizado. Registros recebidos da API: {state['registros_api']} | Upserts totais: {totals.rows} "
+                f"(inseridos={totals.inserted} atualizados={totals.updated} inalterados={totals.unchanged} "
+                f"ignorados={totals.skipped} filhas apagadas={totals.deleted})")
+    if failed_pages:
+        logger.error(f"[{api_name}] Execução {run_id} parcial; páginas pendentes: {failed_pages}. "
+                     f"Rode com --resume para continuar.")
+    for s in stage_stats:
+        logger.info(f"[{api_name}] Estágio {s['stage']}: {s}")
+    logger.info(f"[{api_name}] Lotes por tabela: {buffers.flushes} (limites {buffers.thresholds}) | "
+                f"commits: {buffers.commits if unit else sum(buffers.flushes.values())}")
+    logger.info(f"[{api_name}] HTTP: {endpoint.stats.snapshot()}")
+    logger.info(f"[{api_name}] Tempos: total={summary['seconds']}s normalização={summary['normalize_s']}s "
+                f"escrita={summary['write_s']}s | {summary['records_per_s']} registros/s")
+    if endpoint.limiter.throttles:
+        rate = endpoint.limiter.rate
+        logger.info(f"[{api_name}] Limitador: {endpoint.limiter.throttles} redução(ões) por 429/503; "
+                    f"taxa final: {f'{rate:.1f} req/s' if rate else 'sem limite'}")
+    if cache:
+        logger.info(f"[{api_name}] Cache: {cache.stats()}")
+    if dims:
+        logger.info(f"[{api_name}] Dimensões: {dims.stats()}")
+    logger.info(f"[{api_name}] Datas (acumulado do processo): {date_stats()}")
+    logger.info(f"[{api_name}] Pool MySQL: {pool.stats()}")
+    return totals
+
+
+def add_common_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Opções de carga comuns aos runners e ao run_all."""
+    parser.add_argument("--resume", action="store_true", default=CVCRM_RESUME,
+                        help="continua a última execução incompleta pelas páginas não gravadas")
+    parser.add_argument("--bulk", action="store_true", default=UPSERT_MODE == "bulk",
+                        help="carga inicial via LOAD DATA LOCAL INFILE + staging (requer MYSQL_LOCAL_INFILE=1)")
+    parser.add_argument("--replay", action="store_true", default=CVCRM_REPLAY,
+                        help="roda só com as respostas do cache em disco (CVCRM_CACHE_DIR), sem chamar a API")
+    parser.add_argument("--defer-indexes", action="store_true", default=None,
+                        help="carga inicial: derruba os índices secundários e recria no fim (CVCRM_DEFER_INDEXES); "
+                             "combine com --bulk")
+    return parser
+
+
+def parse_args(api_name: str, argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Argumentos de linha de comando comuns aos runners."""
+    parser = argparse.ArgumentParser(description=f"Carga do CVDW para {api_name}")
+    return add_common_args(parser).parse_args(argv)
@@ -0,0 +1,244 @@
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from etl_dates import to_date_safe, to_datetime_safe
+
+# Configuração de log
+log = logging.getLogger("etl_schema")
+log.setLevel(logging.INFO)
+
+
+# -----------------------------------------------------------------------------
+# Conversores
+# -----------------------------------------------------------------------------
+def to_int_safe(v: Any) -> Optional[int]:
+    if v is None or v == "":
+        return None
+    try:
+        return int(v)
+    except (ValueError, TypeError):
+        return None
+
+
+def to_decimal_safe(v: Any) -> Optional[Decimal]:
+    if v is None or v == "":
+        return None
+    try:
+        return Decimal(v) if v.__class__ is str else Decimal(str(v))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def to_blank_none(v: Any) -> Any:
+    return v or None
+
+
+def to_text(v: Any) -> Optional[str]:
+    return str(v) if v is not None else None
+
+
+def to_upper(v: Any) -> Optional[str]:
+    return str(v).strip().upper() if v else None
+
+
+def to_char_sn(v: Any) -> Optional[str]:
+    """Normaliza flags 'S'/'N' (ou None)."""
+    if v is None or v == "":
+        return None
+    v = str(v).strip().upper()
+    return v if v in ("S", "N") else v[:1]  # mantém 'S'/'N' se vier correto
+
+
+def split_values(v: Any, sep: str = ",") -> List[str]:
+    """"62682, 65286" -> ["62682", "65286"], sem vazios nem repetidos (cada um vira uma linha com PK própria)."""
+    if v is None or v == "":
+        return []
+    parts = v if isinstance(v, (list, tuple)) else str(v).split(sep)
+    return list(dict.fromkeys(p for p in (str(x).strip() for x in parts) if p))
+
+
+# Tipo da coluna -> conversor (None = valor como veio da API)
+CONVERTERS: Dict[str, Optional[Callable[[Any], Any]]] = {
+    "raw": None,
+    "blank": to_blank_none,    # "" -> None
+    "text": to_text,           # str(v), preservando None
+    "upper": to_upper,
+    "sn": to_char_sn,
+    "int": to_int_safe,
+    "bigint": to_int_safe,
+    "decimal": to_decimal_safe,
+    "datetime": to_datetime_safe,
+    "date": to_date_safe,
+}
+
+
+# -----------------------------------------------------------------------------
+# Especificação declarativa de tabela
+# -----------------------------------------------------------------------------
+@dataclass(frozen=True)
+class Column:
+    """Coluna de destino: nome, chave de origem no JSON, tipo e nulidade."""
+    name: str
+    type: str = "raw"
+    source: Optional[str] = None
+    # Coluna obrigatória: registro sem valor é descartado (com log)
+    nullable: bool = True
+    # Em tabelas filhas, lê do registro pai em vez do item do array
+    parent: bool = False
+
+    @property
+    def key(self) -> str:
+        return self.source or self.name
+
+
+@dataclass
+class TableSpec:
+    """
+    Tabela de destino descrita por colunas; `normalize` é compilado uma vez
+    numa função Python gerada que devolve tuplas na ordem de `columns`.
+    Para várias tabelas da mesma página, use `SpecGroup`.
+
+    Com `array`, a tabela é filha: cada item de `registro[array]` vira uma
+    linha e as colunas `parent=True` vêm do registro pai. Com `sync`, as
+    linhas de cada pai substituem as gravadas: o que sumiu do array é apagado.
+    Com `split`, `registro[array]` é um texto com valores separados por
+    `split` ("62682,65286"): cada valor vira uma linha e a única coluna que
+    não é `parent` recebe o valor (tabela ponte, ver cv_*_lead em
+    database/CVCRM.sql).
+    """
+    name: str
+    columns: Sequence[Column]
+    pk: Sequence[str]
+    array: Optional[str] = None
+    # Linhas por lote de upsert (0 = PIPELINE_FLUSH_ROWS)
+    flush_rows: int = 0
+    sync: bool = False
+    split: Optional[str] = None
+    _fn: Optional[Callable[[Any], List[Tuple[Any, ...]]]] = field(default=None, init=False, repr=False)
+    source: str = field(default="", init=False, repr=False)
+
+    def __post_init__(self):
+        for c in self.columns:
+            if c.type not in CONVERTERS:
+                raise ValueError(f"{self.name}.{c.name}: tipo desconhecido {c.type!r}")
+        if self.split and (not self.array or sum(1 for c in self.columns if not c.parent) != 1):
+            raise ValueError(f"{self.name}: split exige array e exatamente uma coluna que não seja parent")
+
+    @property
+    def column_names(self) -> Tuple[str, ...]:
+        return tuple(c.name for c in self.columns)
+
+    def index(self, column: str) -> int:
+        return self.column_names.index(column)
+
+    @property
+    def parent_columns(self) -> Tuple[str, ...]:
+        return tuple(c.name for c in self.columns if c.parent)
+
+    def parent_index(self, base: "TableSpec") -> Tuple[int, ...]:
+        """Posições, nas linhas de `base`, dos valores das colunas parent=True (mesma chave de origem)."""
+        keys = [c.key for c in base.columns]
+        missing = [c.key for c in self.columns if c.parent and c.key not in keys]
+        if missing:
+            raise ValueError(f"{self.name}: {base.name} não tem as colunas do pai {missing}")
+        return tuple(keys.index(c.key) for c in self.columns if c.parent)
+
+    def _emit(self, n: int) -> List[str]:
+        """Corpo do laço por registro (`it`/`pg`) que acrescenta as linhas em `a{n}`."""
+        item = "ca" if self.array else "it"
+        indent = "        "
+        lines: List[str] = []
+        if self.split:
+            lines.append(f"{indent}for ca in _split(pg({self.array!r}), {self.split!r}):")
+            indent += "    "
+        elif self.array:
+            lines.append(f"{indent}for ca in pg({self.array!r}) or ():")
+            indent += "    "
+            lines.append(f"{indent}g = ca.get")
+        else:
+            lines.append(f"{indent}g = pg")
+
+        exprs, required = [], []
+        for i, c in enumerate(self.columns):
+            if self.split and not c.parent:
+                expr = "ca"
+            else:
+                expr = f"{'pg' if c.parent else 'g'}({c.key!r})"
+            if CONVERTERS[c.type] is not None:
+                expr = f"_c_{c.type}({expr})"
+            if not c.nullable:
+                lines.append(f"{indent}v{i} = {expr}")
+                required.append((f"v{i}", c.key))
+                expr = f"v{i}"
+            exprs.append(expr)
+
+        append = f"a{n}(({', '.join(exprs)},))"
+        if not required:
+            lines.append(f"{indent}{append}")
+            return lines
+        # Registro sem coluna obrigatória só some desta tabela (as filhas seguem como antes)
+        for j, (var, key) in enumerate(required):
+            lines.append(f"{indent}{'if' if j == 0 else 'elif'} not {var}:")
+            lines.append(f"{indent}    _log.error({('Registro sem ' + key + ': %s')!r}, {item})")
+        lines.append(f"{indent}else:")
+        lines.append(f"{indent}    {append}")
+        return lines
+
+    def compile(self) -> Callable[[Any], List[Tuple[Any, ...]]]:
+        if self._fn is None:
+            fn, self.source = _compile_specs([self], f"<normalize {self.name}>")
+            self._fn = lambda dados: fn(dados)[0]
+        return self._fn
+
+    def normalize(self, dados: Optional[List[Dict[str, Any]]]) -> List[Tuple[Any, ...]]:
+        """Registros da API -> tuplas na ordem de `column_names`, prontas para o upsert."""
+        return self.compile()(dados)
+
+    def as_dicts(self, rows: List[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+        names = self.column_names
+        return [dict(zip(names, r)) for r in rows]
+
+
+def _compile_specs(specs: Sequence[TableSpec], filename: str) -> Tuple[Callable[[Any], Tuple[List[Tuple[Any, ...]], ...]], str]:
+    """Gera uma função que percorre os registros uma vez e preenche uma lista por spec."""
+    lines = ["def normalize(dados):"]
+    for n in range(len(specs)):
+        lines.append(f"    r{n} = []")
+        lines.append(f"    a{n} = r{n}.append")
+    lines.append("    for it in dados or ():")
+    lines.append("        pg = it.get")
+    for n, spec in enumerate(specs):
+        lines.extend(spec._emit(n))
+    lines.append(f"    return ({''.join(f'r{n}, ' for n in range(len(specs)))})")
+    source = "\n".join(lines) + "\n"
+
+    namespace: Dict[str, Any] = {f"_c_{t}": fn for t, fn in CONVERTERS.items() if fn is not None}
+    namespace["_log"] = log
+    namespace["_split"] = split_values
+    exec(compile(source, filename, "exec"), namespace)
+    return namespace["normalize"], source
+
+
+class SpecGroup:
+    """
+    Normalizador de passada única para várias tabelas: cada registro é lido
+    uma vez e gera a linha da base e as das filhas juntas. Aceita qualquer
+    iterável de registros, inclusive o stream de `etl_stream`.
+    """
+
+    def __init__(self, specs: Sequence[TableSpec]):
+        self.specs = list(specs)
+        self._fn: Optional[Callable[[Any], Tuple[List[Tuple[Any, ...]], ...]]] = None
+        self.source = ""
+
+    def compile(self) -> Callable[[Any], Tuple[List[Tuple[Any, ...]], ...]]:
+        if self._fn is None:
+            names = "+".join(s.name for s in self.specs)
+            self._fn, self.source = _compile_specs(self.specs, f"<normalize {names}>")
+        return self._fn
+
+    def normalize(self, dados: Optional[Iterable[Dict[str, Any]]]) -> Dict[str, List[Tuple[Any, ...]]]:
+        """Registros da API -> {tabela: tuplas}, na ordem de `specs`."""
+        return dict(zip((s.name for s in self.specs), self.compile()(dados)))
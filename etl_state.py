@@ -0,0 +1,412 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from etl_utils import MySQLPool, checkout, get_pool
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configuração de log
+log = logging.getLogger("etl_state")
+log.setLevel(logging.INFO)
+
+# Estado do ETL fica no schema de logs (o mesmo de mysql_connection_log)
+LOG_DB = os.getenv("LOG_DB", "log_cvcrm")
+TABLE_WATERMARK = f"{LOG_DB}.etl_watermark"
+TABLE_RUN = f"{LOG_DB}.etl_run"
+TABLE_CHECKPOINT = f"{LOG_DB}.etl_checkpoint"
+TABLE_TUNING = f"{LOG_DB}.etl_tuning"
+TABLE_BACKFILL = f"{LOG_DB}.etl_backfill_shard"
+
+# Espera (s) pelo lock do endpoint quando outra execução dele está rodando
+CVCRM_RUN_LOCK_TIMEOUT = int(os.getenv("CVCRM_RUN_LOCK_TIMEOUT") or "0")
+
+DDL_WATERMARK = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_WATERMARK} (
+      `endpoint`    VARCHAR(64)  NOT NULL,
+      `coluna`      VARCHAR(64)  NOT NULL,
+      `watermark`   DATETIME     NULL,
+      `updated_at`  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      PRIMARY KEY (`endpoint`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+DDL_RUN = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_RUN} (
+      `run_id`       CHAR(32)     NOT NULL,
+      `endpoint`     VARCHAR(64)  NOT NULL,
+      `filters`      TEXT         NULL,
+      `status`       VARCHAR(16)  NOT NULL,                 -- running/done/partial/failed
+      `total_pages`  INT          NULL,
+      `started_at`   DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      `finished_at`  DATETIME     NULL,
+      PRIMARY KEY (`run_id`),
+      KEY `idx_run_endpoint` (`endpoint`, `started_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+DDL_CHECKPOINT = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_CHECKPOINT} (
+      `endpoint`     VARCHAR(64)  NOT NULL,
+      `run_id`       CHAR(32)     NOT NULL,
+      `page`         INT          NOT NULL,
+      `status`       VARCHAR(16)  NOT NULL,                 -- done/failed
+      `rows`         INT          NULL,
+      `watermark`    DATETIME     NULL,                     -- maior valor da coluna de watermark na página
+      `attempts`     INT          NOT NULL DEFAULT 1,
+      `updated_at`   TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      PRIMARY KEY (`endpoint`, `run_id`, `page`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+DDL_TUNING = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_TUNING} (
+      `endpoint`       VARCHAR(64)  NOT NULL,
+      `page_size`      INT          NOT NULL,                 -- registros_por_pagina da próxima execução
+      `measured_size`  INT          NULL,                     -- tamanho usado na última execução
+      `records_per_s`  DOUBLE       NULL,                     -- vazão medida com measured_size
+      `direction`      TINYINT      NOT NULL DEFAULT 1,
+      `updated_at`     TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      PRIMARY KEY (`endpoint`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+DDL_BACKFILL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_BACKFILL} (
+      `backfill_id`  CHAR(32)     NOT NULL,
+      `endpoint`     VARCHAR(64)  NOT NULL,
+      `shard`        INT          NOT NULL,
+      `kind`         VARCHAR(8)   NOT NULL,                 -- date/pages
+      `filters`      TEXT         NULL,
+      `first_page`   INT          NULL,
+      `last_page`    INT          NULL,                     -- NULL = até o total de páginas
+      `status`       VARCHAR(16)  NOT NULL,                 -- pending/running/done/failed
+      `records`      INT          NULL,
+      `rows`         INT          NULL,
+      `seconds`      DOUBLE       NULL,
+      `attempts`     INT          NOT NULL DEFAULT 0,
+      `updated_at`   TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      PRIMARY KEY (`backfill_id`, `shard`),
+      KEY `idx_backfill_endpoint` (`endpoint`, `updated_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_ensured = False
+_ensure_lock = threading.Lock()
+
+
+def ensure_state_tables(engine=None) -> None:
+    """Cria (uma vez por processo) as tabelas de estado no schema de logs."""
+    global _ensured
+    with _ensure_lock:
+        if _ensured:
+            return
+        with checkout(engine) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {LOG_DB} DEFAULT CHARACTER SET utf8mb4")
+                cursor.execute(DDL_WATERMARK)
+                cursor.execute(DDL_RUN)
+                cursor.execute(DDL_CHECKPOINT)
+                cursor.execute(DDL_TUNING)
+                cursor.execute(DDL_BACKFILL)
+            conn.commit()
+        _ensured = True
+
+
+# -----------------------------------------------------------------------------
+# Watermark (sync incremental)
+# -----------------------------------------------------------------------------
+def get_watermark(endpoint: str, engine=None) -> Optional[datetime]:
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT watermark FROM {TABLE_WATERMARK} WHERE endpoint = %s", (endpoint,))
+            row = cursor.fetchone()
+        conn.commit()
+    return row[0] if row else None
+
+
+def advance_watermark(endpoint: str, column: str, value: datetime, engine=None) -> None:
+    """
+    Avança o watermark do endpoint para `value` num único statement; nunca
+    retrocede (GREATEST), então páginas concluídas fora de ordem são seguras.
+    """
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {TABLE_WATERMARK} (endpoint, coluna, watermark)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    coluna = VALUES(coluna),
+                    watermark = GREATEST(COALESCE(watermark, VALUES(watermark)), VALUES(watermark))
+                """,
+                (endpoint, column, value),
+            )
+        conn.commit()
+
+
+class WatermarkTracker:
+    """
+    Acompanha o maior valor gravado na execução. O watermark só avança no
+    fim, com a execução inteira gravada (`value`): nada garante que o CVDW
+    pagina em ordem de referência, então um registro recém-alterado numa
+    página inicial não pode pular os das páginas que ainda faltam.
+    """
+
+    def __init__(self):
+        self._value: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def page_done(self, page: int, max_value: Optional[datetime]) -> None:
+        """Registra o maior valor de uma página gravada (inclusive as de uma execução retomada)."""
+        if max_value is None:
+            return
+        with self._lock:
+            if self._value is None or max_value > self._value:
+                self._value = max_value
+
+    @property
+    def value(self) -> Optional[datetime]:
+        with self._lock:
+            return self._value
+
+
+# -----------------------------------------------------------------------------
+# Execuções e checkpoints por página (retomada após falha)
+# -----------------------------------------------------------------------------
+def _execute(sql: str, args: Tuple[Any, ...], engine=None, commit: bool = True) -> None:
+    """
+    Com `commit=False` o statement entra na transação já aberta em `engine`
+    (a conexão de uma UnitOfWork) e só vale quando ela fizer commit.
+    """
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, args)
+        if commit:
+            conn.commit()
+
+
+def start_run(endpoint: str, filters: Dict[str, Any], engine=None) -> str:
+    run_id = uuid.uuid4().hex
+    _execute(f"INSERT INTO {TABLE_RUN} (run_id, endpoint, filters, status) VALUES (%s, %s, %s, 'running')",
+             (run_id, endpoint, json.dumps(filters, default=str)), engine)
+    return run_id
+
+
+def update_run(run_id: str, status: Optional[str] = None, total_pages: Optional[int] = None,
+               engine=None) -> None:
+    finished = status is not None and status != "running"
+    _execute(
+        f"""
+        UPDATE {TABLE_RUN}
+           SET status = COALESCE(%s, status),
+               total_pages = COALESCE(%s, total_pages),
+               finished_at = IF(%s, NOW(), finished_at)
+         WHERE run_id = %s
+        """,
+        (status, total_pages, finished, run_id), engine)
+
+
+@contextmanager
+def run_lock(endpoint: str, engine=None, timeout: Optional[int] = None) -> Iterator[None]:
+    """
+    Lock do endpoint (GET_LOCK) durante uma execução: cron sobreposto ou
+    run_all não rodam nem retomam a mesma carga em dois processos. O lock
+    fica numa conexão própria, fora do pool, e cai junto com ela se o
+    processo morrer. Sem o lock em `timeout` s (CVCRM_RUN_LOCK_TIMEOUT),
+    levanta RuntimeError.
+    """
+    timeout = CVCRM_RUN_LOCK_TIMEOUT if timeout is None else timeout
+    if engine is None:
+        engine = get_pool()
+    conn = engine.factory() if isinstance(engine, MySQLPool) else engine
+    name = f"cvcrm_etl:{endpoint}"[:64]
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (name, timeout))
+            row = cursor.fetchone()
+        if row is not None and row[0] != 1:
+            raise RuntimeError(f"Outra execução de {endpoint} está em andamento (lock {name})")
+        try:
+            yield
+        finally:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                cursor.fetchone()
+    finally:
+        if conn is not engine:
+            conn.close()
+
+
+def find_resumable_run(endpoint: str, engine=None) -> Optional[Tuple[str, Dict[str, Any], Optional[int]]]:
+    """
+    Última execução do endpoint que não terminou 'done': (run_id, filtros,
+    total de páginas). Chamar sob `run_lock`: com o lock na mão, uma
+    execução ainda 'running' é de um processo que morreu.
+    """
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT run_id, filters, total_pages, status FROM {TABLE_RUN}
+                 WHERE endpoint = %s
+                 ORDER BY started_at DESC
+                 LIMIT 1
+                """,
+                (endpoint,))
+            row = cursor.fetchone()
+        conn.commit()
+    if not row or row[3] == "done":
+        return None
+    return row[0], json.loads(row[1] or "{}"), row[2]
+
+
+def committed_pages(endpoint: str, run_id: str, engine=None) -> Dict[int, Optional[datetime]]:
+    """Páginas já gravadas na execução, com o watermark de cada uma."""
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT page, watermark FROM {TABLE_CHECKPOINT} "
+                           f"WHERE endpoint = %s AND run_id = %s AND status = 'done'",
+                           (endpoint, run_id))
+            rows = cursor.fetchall()
+        conn.commit()
+    return {r[0]: r[1] for r in rows}
+
+
+def mark_page(endpoint: str, run_id: str, page: int, status: str, rows: int = 0,
+              watermark: Optional[datetime] = None, engine=None, commit: bool = True) -> None:
+    _execute(
+        f"""
+        INSERT INTO {TABLE_CHECKPOINT} (endpoint, run_id, page, status, `rows`, watermark)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE status = VALUES(status), `rows` = VALUES(`rows`),
+                                watermark = VALUES(watermark), attempts = attempts + 1
+        """,
+        (endpoint, run_id, page, status, rows, watermark), engine, commit)
+
+
+# -----------------------------------------------------------------------------
+# Ajuste de registros_por_pagina por endpoint (entre execuções)
+# -----------------------------------------------------------------------------
+def get_tuning(endpoint: str, engine=None) -> Optional[Tuple[int, Optional[int], Optional[float], int]]:
+    """(page_size, measured_size, records_per_s, direction) salvos para o endpoint."""
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT page_size, measured_size, records_per_s, direction FROM {TABLE_TUNING} "
+                           f"WHERE endpoint = %s", (endpoint,))
+            row = cursor.fetchone()
+        conn.commit()
+    return tuple(row) if row else None
+
+
+def save_tuning(endpoint: str, page_size: int, measured_size: int, records_per_s: float, direction: int,
+                engine=None) -> None:
+    _execute(
+        f"""
+        INSERT INTO {TABLE_TUNING} (endpoint, page_size, measured_size, records_per_s, direction)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE page_size = VALUES(page_size), measured_size = VALUES(measured_size),
+                                records_per_s = VALUES(records_per_s), direction = VALUES(direction)
+        """,
+        (endpoint, page_size, measured_size, records_per_s, direction), engine)
+
+
+# -----------------------------------------------------------------------------
+# Backfill em shards (run_backfill.py)
+# -----------------------------------------------------------------------------
+_SHARD_COLUMNS = ("shard", "kind", "filters", "first_page", "last_page", "status", "records", "rows", "seconds",
+                  "attempts")
+
+
+def shard_endpoint(endpoint: str, backfill_id: str, shard: int) -> str:
+    """Nome do endpoint de cada shard em etl_run/etl_checkpoint: a retomada do shard é a dele."""
+    return f"{endpoint}#{backfill_id[:8]}.{shard}"
+
+
+def create_backfill(endpoint: str, shards: List[Dict[str, Any]], engine=None) -> str:
+    """Grava o plano (shards com kind, filters, first_page, last_page) e devolve o backfill_id."""
+    backfill_id = uuid.uuid4().hex
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLE_BACKFILL} (backfill_id, endpoint, shard, kind, filters, first_page, last_page, "
+                f"status) VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending')",
+                [(backfill_id, endpoint, s["shard"], s["kind"], json.dumps(s["filters"], default=str),
+                  s.get("first_page"), s.get("last_page")) for s in shards])
+        conn.commit()
+    return backfill_id
+
+
+def backfill_shards(backfill_id: str, engine=None) -> List[Dict[str, Any]]:
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(f'`{c}`' for c in _SHARD_COLUMNS)} FROM {TABLE_BACKFILL} "
+                           f"WHERE backfill_id = %s ORDER BY shard", (backfill_id,))
+            rows = cursor.fetchall()
+        conn.commit()
+    shards = [dict(zip(_SHARD_COLUMNS, row)) for row in rows]
+    for s in shards:
+        s["filters"] = json.loads(s["filters"] or "{}")
+    return shards
+
+
+def find_resumable_backfill(endpoint: str, engine=None) -> Optional[str]:
+    """Último backfill do endpoint com algum shard ainda não 'done'."""
+    ensure_state_tables(engine)
+    with checkout(engine) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT backfill_id, SUM(status <> 'done') FROM {TABLE_BACKFILL}
+                 WHERE endpoint = %s
+                 GROUP BY backfill_id
+                 ORDER BY MAX(updated_at) DESC
+                 LIMIT 1
+                """,
+                (endpoint,))
+            row = cursor.fetchone()
+        conn.commit()
+    return row[0] if row and row[1] else None
+
+
+def mark_shard(backfill_id: str, shard: int, status: str, records: Optional[int] = None,
+               rows: Optional[int] = None, seconds: Optional[float] = None, engine=None) -> None:
+    """Cada passagem para 'running' conta uma tentativa."""
+    _execute(
+        f"""
+        UPDATE {TABLE_BACKFILL}
+           SET status = %s,
+               records = COALESCE(%s, records),
+               `rows` = COALESCE(%s, `rows`),
+               seconds = COALESCE(%s, seconds),
+               attempts = attempts + IF(%s = 'running', 1, 0)
+         WHERE backfill_id = %s AND shard = %s
+        """,
+        (status, records, rows, seconds, status, backfill_id, shard), engine)
+
+
+def max_of(rows: Any, key: Any) -> Optional[datetime]:
+    """Maior valor não nulo de `key` (nome em dicts, posição em tuplas)."""
+    values = [r[key] for r in rows or []]
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+
+def format_watermark(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
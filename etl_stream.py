@@ -0,0 +1,115 @@
+import json
+import codecs
+import logging
+from typing import Any, Dict, Iterable, Iterator
+
+# Configuração de log
+log = logging.getLogger("etl_stream")
+log.setLevel(logging.INFO)
+
+_DECODER = json.JSONDecoder()
+_WS = " \t\n\r"
+_DELIMS = ",:]}" + _WS
+
+
+class JsonObjectStream:
+    """
+    Lê um objeto JSON que chega em pedaços (ex.: `resp.iter_content`) e
+    devolve, um a um, os itens do array `array_key` sem montar o documento
+    inteiro. As demais chaves do objeto (total_de_paginas etc.) ficam em
+    `meta`, completas só depois que a iteração termina.
+
+    Cada item é decodificado com `JSONDecoder.raw_decode` assim que está
+    inteiro no buffer; o texto já consumido é descartado a cada leitura,
+    então a memória fica em ~um pedaço + um registro.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], array_key: str = "dados", encoding: str = "utf-8"):
+        self.array_key = array_key
+        self.meta: Dict[str, Any] = {}
+        self.items = 0
+        self.bytes = 0
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._items = self._parse()
+
+    def _fill(self) -> None:
+        text = ""
+        for chunk in self._chunks:
+            if chunk:
+                self.bytes += len(chunk)
+                text = self._decoder.decode(chunk)
+                if text:
+                    break
+        else:
+            text = self._decoder.decode(b"", final=True)
+            self._eof = True
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+
+    def _peek(self) -> str:
+        """Próximo caractere que não é espaço (sem consumir)."""
+        while True:
+            buf, pos, n = self._buf, self._pos, len(self._buf)
+            while pos < n and buf[pos] in _WS:
+                pos += 1
+            self._pos = pos
+            if pos < n:
+                return buf[pos]
+            if self._eof:
+                raise ValueError("JSON truncado")
+            self._fill()
+
+    def _take(self, expected: str) -> str:
+        c = self._peek()
+        if c not in expected:
+            raise ValueError(f"JSON inválido: esperado {expected!r}, veio {c!r}")
+        self._pos += 1
+        return c
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            else:
+                # Número/literal pode ter sido cortado no fim do pedaço ("1." de "1.5"):
+                # só aceita quando o que vem depois é um delimitador
+                if self._eof or (end < len(self._buf) and self._buf[end] in _DELIMS):
+                    self._pos = end
+                    return obj
+            self._fill()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Um único gerador: iterar de novo continua de onde parou
+        return self._items
+
+    def _parse(self) -> Iterator[Dict[str, Any]]:
+        self._take("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._take(":")
+            if key == self.array_key and self._peek() == "[":
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        item = self._value()
+                        self.items += 1
+                        yield item
+                        if self._take(",]") == "]":
+                            break
+            else:
+                self.meta[key] = self._value()
+            if self._take(",}") == "}":
+                return
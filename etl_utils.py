@@ -1,8 +1,19 @@
 import os  # Adicionando a importação do módulo 'os'
+import re
+import time
+import hashlib
+import queue
+import tempfile
+import threading
 import pymysql
+from pymysql.constants import CR, ER
 import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional, Sequence, Tuple
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -11,13 +22,41 @@ load_dotenv()
 log = logging.getLogger("etl_utils")
 log.setLevel(logging.DEBUG)
 
+# Upsert em lote: "batch" (multi-row VALUES), "row" (um execute por registro)
+# ou "bulk" (LOAD DATA LOCAL INFILE em staging + INSERT ... SELECT)
+UPSERT_MODE = (os.getenv("UPSERT_MODE") or "batch").lower()
+UPSERT_BATCH_ROWS = int(os.getenv("UPSERT_BATCH_ROWS") or "500")
+# Limite de bytes por statement; 0 = usa @@max_allowed_packet do servidor
+UPSERT_MAX_PACKET = int(os.getenv("UPSERT_MAX_PACKET") or "0")
+
+# Bulk: lotes menores que isso seguem no modo batch; o spool TSV vai para
+# BULK_SPOOL_DIR (padrão: diretório temporário do sistema). Exige
+# MYSQL_LOCAL_INFILE=1 aqui e local_infile=ON no servidor.
+UPSERT_BULK_MIN_ROWS = int(os.getenv("UPSERT_BULK_MIN_ROWS") or "5000")
+BULK_SPOOL_DIR = os.getenv("BULK_SPOOL_DIR") or None
+MYSQL_LOCAL_INFILE = (os.getenv("MYSQL_LOCAL_INFILE") or "0") == "1"
+
+# Pool de conexões compartilhado entre páginas, tabelas e runners
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE") or "4")
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT") or "60")
+# Conexões ociosas há mais que isso (s) passam por ping antes de reutilizar
+MYSQL_POOL_PING_AFTER = float(os.getenv("MYSQL_POOL_PING_AFTER") or "30")
+
+# Pula linhas cujo hash de conteúdo não mudou desde a última gravação.
+# Opt-in: só vale se as tabelas de destino forem escritas apenas pelo ETL;
+# uma linha alterada ou apagada por fora não é regravada enquanto a API
+# mandar o mesmo conteúdo (limpe os hashes da tabela em etl_row_hash)
+ROW_HASH_SKIP = (os.getenv("ROW_HASH_SKIP") or "0") == "1"
+TABLE_ROW_HASH = "etl_row_hash"
+
 # Função para conectar ao MySQL usando PyMySQL
 def mysql_connection():
     return pymysql.connect(
         host=os.getenv('MYSQL_HOST', 'localhost'),
         user=os.getenv('MYSQL_USER', 'root'),
         password=os.getenv('MYSQL_PASSWORD', ''),
-        database=os.getenv('MYSQL_DB', 'CVCRM')
+        database=os.getenv('MYSQL_DB', 'CVCRM'),
+        local_infile=MYSQL_LOCAL_INFILE
     )
 
 # Função para conectar ao MySQL usando PyMySQL para o schema de logs
@@ -30,37 +69,730 @@ def mysql_connection_log():
     )
 
 
+# -----------------------------------------------------------------------------
+# Pool de conexões
+# -----------------------------------------------------------------------------
+class MySQLPool:
+    """
+    Pool de conexões PyMySQL persistentes, com checkout via context manager.
 
-# Função para upsert usando PyMySQL
-def upsert_rows(engine, table_name: str, rows: List[Dict[str, Any]], pk_columns: List[str]) -> int:
-    if not rows:
-        return 0
-    
-    # Conectar ao banco MySQL
-    connection = mysql_connection()
-    
+    Conexões ociosas por mais de `ping_after` segundos são testadas com ping
+    e recriadas se o servidor tiver derrubado a sessão. Os contadores de
+    espera e reconexão ajudam a dimensionar `size`.
+    """
+
+    def __init__(self, size: int = MYSQL_POOL_SIZE, factory: Callable[[], Any] = mysql_connection,
+                 timeout: float = MYSQL_POOL_TIMEOUT, ping_after: float = MYSQL_POOL_PING_AFTER):
+        self.size = max(1, size)
+        self.factory = factory
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle: "queue.LifoQueue[Tuple[Any, float]]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._closed = False
+
+        # Contadores
+        self.checkouts = 0
+        self.created = 0
+        self.reconnects = 0
+        self.discarded = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _new_connection(self):
+        conn = self.factory()
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _discard(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self.discarded += 1
+
+    def _healthy(self, conn, idle_since: float) -> Any:
+        """Devolve uma conexão utilizável: a mesma ou uma nova, se o ping falhar."""
+        if time.monotonic() - idle_since < self.ping_after:
+            return conn
+        try:
+            conn.ping(reconnect=False)
+            return conn
+        except Exception as e:
+            log.warning(f"Conexão do pool inválida ({e}); reconectando.")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self.reconnects += 1
+            return self._new_connection()
+
+    def acquire(self):
+        if self._closed:
+            raise RuntimeError("MySQLPool já foi fechado")
+        t0 = time.monotonic()
+        fresh = False
+        try:
+            conn, idle_since = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                can_open = self._open < self.size
+                if can_open:
+                    self._open += 1
+            if can_open:
+                try:
+                    conn = self._new_connection()
+                    fresh = True
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                try:
+                    conn, idle_since = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"Nenhuma conexão livre no pool após {self.timeout}s (size={self.size})")
+
+        if not fresh:
+            try:
+                conn = self._healthy(conn, idle_since)
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        waited = time.monotonic() - t0
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return conn
+
+    def release(self, conn, broken: bool = False) -> None:
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            # Transação pendente não pode voltar para o pool
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "created": self.created,
+                "reconnects": self.reconnects,
+                "discarded": self.discarded,
+                "wait_seconds": round(self.wait_seconds, 4),
+                "max_wait_seconds": round(self.max_wait_seconds, 4),
+                "avg_wait_ms": round(1000 * self.wait_seconds / self.checkouts, 3) if self.checkouts else 0.0,
+            }
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_default_pool: Optional[MySQLPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool() -> MySQLPool:
+    """Pool padrão do processo, criado sob demanda e compartilhado pelos runners."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None or _default_pool._closed:
+            _default_pool = MySQLPool()
+        return _default_pool
+
+
+@contextmanager
+def checkout(engine=None) -> Iterator[Any]:
+    """
+    Resolve o parâmetro `engine` dos helpers de escrita: um MySQLPool, uma
+    conexão já aberta (usada como está) ou None (pool padrão).
+    """
+    if engine is None:
+        engine = get_pool()
+    if isinstance(engine, MySQLPool):
+        with engine.connection() as conn:
+            yield conn
+    else:
+        yield engine
+
+
+# -----------------------------------------------------------------------------
+# Upsert
+# -----------------------------------------------------------------------------
+@dataclass
+class UpsertStats:
+    """Contagens reais de um upsert, derivadas do affected-rows do MySQL."""
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    # Linhas que nem foram enviadas: hash igual ao da última gravação
+    skipped: int = 0
+    # Linhas filhas que sumiram do pai (sincronização por conjunto)
+    deleted: int = 0
+    statements: int = 0
+    # Lotes que falharam e sofreram rollback
+    errors: int = 0
+
+    def __iadd__(self, other: "UpsertStats") -> "UpsertStats":
+        self.rows += other.rows
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.skipped += other.skipped
+        self.deleted += other.deleted
+        self.statements += other.statements
+        self.errors += other.errors
+        return self
+
+
+# Mensagem de info do MySQL em INSERT multi-row: "Records: 3  Duplicates: 1  Warnings: 0"
+_INFO_RE = re.compile(rb"Records:\s*(\d+)\s+Duplicates:\s*(\d+)")
+
+
+@lru_cache(maxsize=256)
+def _compile_upsert(table_name: str, columns: Tuple[str, ...], pk_columns: Tuple[str, ...]) -> Tuple[str, str, str]:
+    """
+    Monta (uma única vez por tabela/conjunto de colunas) as partes do
+    INSERT ... ON DUPLICATE KEY UPDATE: prefixo, template de uma linha e sufixo.
+    """
+    update_cols = [c for c in columns if c not in pk_columns] or list(columns)
+    prefix = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES "
+    row_tpl = f"({', '.join(['%s'] * len(columns))})"
+    suffix = " ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = VALUES({c})" for c in update_cols)
+    return prefix, row_tpl, suffix
+
+
+def _count_affected(n_rows: int, affected: int, info: Optional[bytes]) -> UpsertStats:
+    """
+    Converte o affected-rows do MySQL em inseridos/atualizados/inalterados.
+
+    Com ON DUPLICATE KEY UPDATE cada linha vale 1 (inserida), 2 (atualizada)
+    ou 0 (já tinha os mesmos valores). Em statements multi-row o servidor
+    também informa "Duplicates": sem CLIENT_FOUND_ROWS (padrão do PyMySQL)
+    ele conta só as duplicadas que mudaram, então as inalteradas são o que
+    sobra das linhas.
+    """
+    stats = UpsertStats(rows=n_rows, statements=1)
+    m = _INFO_RE.search(info or b"")
+    if m:
+        stats.updated = int(m.group(2))
+        stats.inserted = max(0, affected - 2 * stats.updated)
+        stats.unchanged = max(0, n_rows - stats.inserted - stats.updated)
+    elif n_rows == 1:
+        stats.inserted = 1 if affected == 1 else 0
+        stats.updated = 1 if affected == 2 else 0
+        stats.unchanged = 1 if affected == 0 else 0
+    else:
+        # Sem info do servidor: assume que não houve linhas inalteradas
+        stats.updated = min(n_rows, max(0, affected - n_rows))
+        stats.inserted = n_rows - stats.updated
+    return stats
+
+
+def _max_statement_bytes(connection) -> int:
+    if UPSERT_MAX_PACKET > 0:
+        return UPSERT_MAX_PACKET
+    cached = getattr(connection, "_etl_max_packet", None)
+    if cached:
+        return cached
     try:
         with connection.cursor() as cursor:
-            for row in rows:
-                # Construir a query de upsert
-                sql = f"""
-                    INSERT INTO {table_name} ({', '.join(row.keys())})
-                    VALUES ({', '.join(['%s'] * len(row))})
-                    ON DUPLICATE KEY UPDATE
-                    {', '.join([f"{k} = VALUES({k})" for k in row.keys()])}
-                """
-                # Executar a query
-                cursor.execute(sql, tuple(row.values()))
-                
-            # Commit para salvar no banco
-            connection.commit()
-        
-        return len(rows)  # Número de registros afetados (inseridos ou atualizados)
-    
+            cursor.execute("SELECT @@max_allowed_packet")
+            server_max = int(cursor.fetchone()[0])
     except Exception as e:
-        log.error(f"Erro no upsert: {e}")
-        connection.rollback()
-        return 0
-    
+        log.warning(f"Não foi possível ler max_allowed_packet: {e}")
+        server_max = 4 * 1024 * 1024
+    # Margem para cabeçalho do pacote e diferenças de encoding
+    limit = int(min(server_max, connection.max_allowed_packet) * 0.9)
+    connection._etl_max_packet = limit
+    return limit
+
+
+def _upsert_per_row(cursor, table_name: str, columns: Tuple[str, ...], pk_columns: Tuple[str, ...],
+                    values: Sequence[Sequence[Any]]) -> UpsertStats:
+    prefix, row_tpl, suffix = _compile_upsert(table_name, columns, pk_columns)
+    sql = prefix + row_tpl + suffix
+    stats = UpsertStats()
+    for row in values:
+        affected = cursor.execute(sql, tuple(row))
+        stats += _count_affected(1, affected, None)
+    return stats
+
+
+def _upsert_batched(cursor, table_name: str, columns: Tuple[str, ...], pk_columns: Tuple[str, ...],
+                    values: Sequence[Sequence[Any]], max_bytes: int) -> UpsertStats:
+    prefix, row_tpl, suffix = _compile_upsert(table_name, columns, pk_columns)
+    base_len = len(prefix.encode("utf8")) + len(suffix.encode("utf8"))
+    stats = UpsertStats()
+
+    def flush(start: int, chunk: List[str]) -> None:
+        nonlocal stats
+        try:
+            affected = cursor.execute(prefix + ",".join(chunk) + suffix)
+        except pymysql.err.OperationalError as e:
+            # Só pacote grande demais volta linha a linha: deadlock/lock wait
+            # já desfizeram a transação e conexão perdida não tem retry aqui,
+            # então sobem para o chamador (rollback da unidade inteira)
+            if e.args[0] != ER.NET_PACKET_TOO_LARGE:
+                raise
+            log.warning(f"Upsert em lote falhou em {table_name} ({e}); repetindo {len(chunk)} linhas uma a uma.")
+            stats += _upsert_per_row(cursor, table_name, columns, pk_columns, values[start:start + len(chunk)])
+            return
+        info = getattr(getattr(cursor, "_result", None), "message", None)
+        stats += _count_affected(len(chunk), affected, info)
+
+    chunk: List[str] = []
+    chunk_len = base_len
+    start = 0
+    for i, row in enumerate(values):
+        literal = cursor.mogrify(row_tpl, tuple(row))
+        size = len(literal.encode("utf8")) + 1
+        if chunk and (len(chunk) >= UPSERT_BATCH_ROWS or chunk_len + size > max_bytes):
+            flush(start, chunk)
+            chunk, chunk_len, start = [], base_len, i
+        chunk.append(literal)
+        chunk_len += size
+    if chunk:
+        flush(start, chunk)
+    return stats
+
+
+# -----------------------------------------------------------------------------
+# Bulk: LOAD DATA LOCAL INFILE em staging + merge
+# -----------------------------------------------------------------------------
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+_bulk_disabled = False
+# Recusas de LOAD DATA LOCAL (local_infile desligado no servidor ou no
+# cliente; 3948 = ER_CLIENT_LOCAL_FILES_DISABLED, MySQL 8). Só elas desligam
+# o bulk; os demais erros sobem e falham o lote.
+_LOCAL_INFILE_REFUSED = (ER.NOT_ALLOWED_COMMAND, CR.CR_LOAD_DATA_LOCAL_INFILE_REJECTED, 3948)
+
+
+def _tsv_field(v: Any) -> str:
+    """Valor no formato de LOAD DATA (FIELDS ESCAPED BY '\\'): None vira \\N."""
+    if v is None:
+        return "\\N"
+    if v.__class__ is str:
+        return v.translate(_TSV_ESCAPES)
+    if v is True or v is False:
+        return "1" if v else "0"
+    if isinstance(v, datetime):
+        return v.isoformat(" ")
+    if isinstance(v, date):
+        return v.isoformat()
+    return str(v).translate(_TSV_ESCAPES)
+
+
+def _spool_tsv(values: Sequence[Sequence[Any]]) -> str:
+    """Grava as linhas num arquivo TSV temporário e devolve o caminho."""
+    fd, path = tempfile.mkstemp(prefix="etl_bulk_", suffix=".tsv", dir=BULK_SPOOL_DIR)
+    with os.fdopen(fd, "w", encoding="utf8", newline="\n") as f:
+        for row in values:
+            f.write("\t".join([_tsv_field(v) for v in row]))
+            f.write("\n")
+    return path
+
+
+@lru_cache(maxsize=256)
+def _compile_bulk(table_name: str, columns: Tuple[str, ...],
+                  pk_columns: Tuple[str, ...]) -> Tuple[str, str, str, str]:
+    """(nome da staging, CREATE da staging, LOAD DATA, INSERT ... SELECT ... ON DUPLICATE KEY UPDATE) de uma tabela."""
+    cols = ", ".join(columns)
+    # Uma staging por conjunto de colunas: ela só tem as colunas carregadas
+    staging = f"_stg_{table_name.replace('.', '_')}_{hashlib.md5(cols.encode('utf8')).hexdigest()[:8]}"
+    # CREATE ... SELECT em vez de LIKE: tabela temporária não pode ser
+    # particionada (cv_visitas/cv_reservas com etl_partitions). A PK da spec
+    # continua lá para o REPLACE do LOAD DATA.
+    create = (f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (PRIMARY KEY ({', '.join(pk_columns)})) "
+              f"SELECT {cols} FROM {table_name} LIMIT 0")
+    load = (f"LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE {staging} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({cols})")
+    _, _, suffix = _compile_upsert(table_name, columns, pk_columns)
+    merge = f"INSERT INTO {table_name} ({cols}) SELECT {cols} FROM {staging}{suffix}"
+    return staging, create, load, merge
+
+
+def _upsert_bulk(cursor, table_name: str, columns: Tuple[str, ...], pk_columns: Tuple[str, ...],
+                 values: Sequence[Sequence[Any]]) -> Optional[UpsertStats]:
+    """
+    Carrega as linhas num TSV, faz LOAD DATA LOCAL INFILE numa tabela
+    temporária com as colunas da de destino (CREATE TEMPORARY TABLE ...
+    SELECT ... LIMIT 0, com a PK da spec) e junta tudo com um único INSERT
+    ... SELECT ... ON DUPLICATE KEY UPDATE. A staging é por conexão e não
+    faz commit implícito, então tudo fica na transação do chamador.
+
+    Devolve None se o servidor/cliente recusar LOAD DATA LOCAL
+    (_LOCAL_INFILE_REFUSED); nesse caso o chamador segue no modo batch.
+    """
+    global _bulk_disabled
+    staging, create, load, merge = _compile_bulk(table_name, columns, pk_columns)
+    cursor.execute(create)
+    cursor.execute(f"DELETE FROM {staging}")
+
+    path = _spool_tsv(values)
+    try:
+        t0 = time.monotonic()
+        # REPLACE: PK repetida no lote fica com a última, como no multi-row VALUES
+        cursor.execute(load, (path,))
+        t_load = time.monotonic() - t0
+    except (pymysql.err.OperationalError, pymysql.err.InternalError, pymysql.err.ProgrammingError,
+            pymysql.err.NotSupportedError) as e:
+        if not e.args or e.args[0] not in _LOCAL_INFILE_REFUSED:
+            raise
+        _bulk_disabled = True
+        log.warning(f"LOAD DATA LOCAL indisponível ({e}); usando upsert em lote. "
+                    f"Verifique MYSQL_LOCAL_INFILE=1 e local_infile=ON no servidor.")
+        return None
     finally:
-        connection.close()
+        os.unlink(path)
+
+    t0 = time.monotonic()
+    affected = cursor.execute(merge)
+    info = getattr(getattr(cursor, "_result", None), "message", None)
+    # PKs repetidas no lote viraram uma linha só na staging: contam como inalteradas
+    m = _INFO_RE.search(info or b"")
+    merged = int(m.group(1)) if m else len(values)
+    stats = _count_affected(merged, affected, info)
+    stats.rows = len(values)
+    stats.unchanged += len(values) - merged
+    stats.statements = 2
+    log.debug(f"Bulk {table_name}: {len(values)} linhas, LOAD {t_load:.2f}s, merge {time.monotonic() - t0:.2f}s")
+    return stats
+
+
+def execute_upsert(connection, table_name: str, columns: Sequence[str], values: Sequence[Sequence[Any]],
+                   pk_columns: Sequence[str] = (), mode: Optional[str] = None) -> UpsertStats:
+    """
+    Executa o upsert na conexão informada, sem commit.
+
+    `values` são sequências na mesma ordem de `columns`. No modo "batch" as
+    linhas vão em statements multi-row limitados por UPSERT_BATCH_ROWS e pelo
+    max_allowed_packet; o modo "row" mantém o caminho antigo, um execute por linha.
+    O modo "bulk" usa LOAD DATA LOCAL INFILE para lotes a partir de
+    UPSERT_BULK_MIN_ROWS (cargas iniciais).
+    """
+    if not values:
+        return UpsertStats()
+    columns = tuple(columns)
+    pk_columns = tuple(pk_columns)
+    mode = (mode or UPSERT_MODE).lower()
+
+    with connection.cursor() as cursor:
+        if mode == "row":
+            return _upsert_per_row(cursor, table_name, columns, pk_columns, values)
+        if mode == "bulk" and not _bulk_disabled and len(values) >= UPSERT_BULK_MIN_ROWS:
+            stats = _upsert_bulk(cursor, table_name, columns, pk_columns, values)
+            if stats is not None:
+                return stats
+        return _upsert_batched(cursor, table_name, columns, pk_columns, values,
+                               _max_statement_bytes(connection))
+
+
+# -----------------------------------------------------------------------------
+# Hash de linha (detecção de mudança)
+# -----------------------------------------------------------------------------
+DDL_ROW_HASH = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_ROW_HASH} (
+      `tabela`      VARCHAR(64)   NOT NULL,
+      `pk`          VARCHAR(191)  NOT NULL,
+      `row_hash`    BINARY(16)    NOT NULL,
+      `updated_at`  TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      PRIMARY KEY (`tabela`, `pk`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_row_hash_ready = False
+_ROW_HASH_LOOKUP_CHUNK = 1000
+
+
+def row_hash(columns: Tuple[str, ...], values: Sequence[Any]) -> bytes:
+    """Fingerprint de 16 bytes da linha normalizada (colunas entram no hash)."""
+    return hashlib.blake2b(repr((columns, tuple(values))).encode("utf8"), digest_size=16).digest()
+
+
+def _pk_key(columns: Tuple[str, ...], values: Sequence[Any], pk_columns: Tuple[str, ...]) -> str:
+    return "|".join(str(values[columns.index(c)]) for c in pk_columns)
+
+
+def ensure_row_hash_table(connection) -> None:
+    """Cria etl_row_hash uma vez por processo; chamar fora de transação (DDL faz commit implícito)."""
+    global _row_hash_ready
+    if not _row_hash_ready:
+        with connection.cursor() as cursor:
+            cursor.execute(DDL_ROW_HASH)
+        _row_hash_ready = True
+
+
+def filter_changed(connection, table_name: str, columns: Tuple[str, ...], values: Sequence[Sequence[Any]],
+                   pk_columns: Tuple[str, ...]) -> Tuple[List[Sequence[Any]], List[Tuple[str, str, bytes]]]:
+    """
+    Compara os hashes das linhas com os gravados em etl_row_hash (uma
+    consulta por bloco de chaves) e devolve só as linhas novas ou alteradas,
+    junto das linhas de hash a gravar na mesma transação.
+    """
+    keyed: Dict[str, Tuple[Sequence[Any], bytes]] = {}
+    for row in values:
+        keyed[_pk_key(columns, row, pk_columns)] = (row, row_hash(columns, row))
+
+    stored: Dict[str, bytes] = {}
+    keys = list(keyed)
+    with connection.cursor() as cursor:
+        for i in range(0, len(keys), _ROW_HASH_LOOKUP_CHUNK):
+            chunk = keys[i:i + _ROW_HASH_LOOKUP_CHUNK]
+            cursor.execute(
+                f"SELECT pk, row_hash FROM {TABLE_ROW_HASH} WHERE tabela = %s AND pk IN ({', '.join(['%s'] * len(chunk))})",
+                (table_name, *chunk))
+            stored.update({pk: bytes(h) for pk, h in cursor.fetchall()})
+
+    changed: List[Sequence[Any]] = []
+    hashes: List[Tuple[str, str, bytes]] = []
+    for pk, (row, h) in keyed.items():
+        if stored.get(pk) != h:
+            changed.append(row)
+            hashes.append((table_name, pk, h))
+    return changed, hashes
+
+
+def _group_by_columns(rows: List[Dict[str, Any]]) -> Dict[Tuple[str, ...], List[Tuple[Any, ...]]]:
+    groups: Dict[Tuple[str, ...], List[Tuple[Any, ...]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
+    return groups
+
+
+# -----------------------------------------------------------------------------
+# Sincronização de tabelas filhas por pai (conjunto substituído)
+# -----------------------------------------------------------------------------
+def _in_clause(columns: Sequence[str], n: int) -> str:
+    """`col IN (%s, ...)` ou `(a, b) IN ((%s, %s), ...)` para `n` chaves."""
+    if len(columns) == 1:
+        return f"{columns[0]} IN ({', '.join(['%s'] * n)})"
+    row = f"({', '.join(['%s'] * len(columns))})"
+    return f"({', '.join(columns)}) IN ({', '.join([row] * n)})"
+
+
+def delete_stale_children(connection, table_name: str, groups: Dict[Tuple[str, ...], Sequence[Sequence[Any]]],
+                          pk_columns: Sequence[str], parent_columns: Sequence[str],
+                          parents: Sequence[Sequence[Any]], skip_unchanged: bool) -> UpsertStats:
+    """
+    Apaga, sem commit, as linhas gravadas dos `parents` cuja PK não veio em
+    `groups` (campo adicional removido no CVCRM). Uma leitura das PKs por
+    bloco de pais e um DELETE por bloco de chaves, não um por pai; os hashes
+    das linhas apagadas saem junto, senão a linha que voltasse igual seria
+    ignorada pelo filtro de inalteradas.
+    """
+    stats = UpsertStats()
+    pk_columns, parent_columns = tuple(pk_columns), tuple(parent_columns)
+    parents = list(dict.fromkeys(tuple(p) for p in parents))
+    if not parents:
+        return stats
+    incoming = {_pk_key(cols, row, pk_columns) for cols, values in groups.items() for row in values}
+
+    stale: List[Tuple[Any, ...]] = []
+    with connection.cursor() as cursor:
+        for i in range(0, len(parents), _ROW_HASH_LOOKUP_CHUNK):
+            chunk = parents[i:i + _ROW_HASH_LOOKUP_CHUNK]
+            cursor.execute(f"SELECT {', '.join(pk_columns)} FROM {table_name} "
+                           f"WHERE {_in_clause(parent_columns, len(chunk))}",
+                           [v for p in chunk for v in p])
+            stale.extend(r for r in cursor.fetchall() if _pk_key(pk_columns, r, pk_columns) not in incoming)
+        stats.statements += -(-len(parents) // _ROW_HASH_LOOKUP_CHUNK)
+
+        for i in range(0, len(stale), _ROW_HASH_LOOKUP_CHUNK):
+            chunk = stale[i:i + _ROW_HASH_LOOKUP_CHUNK]
+            stats.deleted += cursor.execute(f"DELETE FROM {table_name} WHERE {_in_clause(pk_columns, len(chunk))}",
+                                            [v for r in chunk for v in r])
+            stats.statements += 1
+            if skip_unchanged:
+                keys = [_pk_key(pk_columns, r, pk_columns) for r in chunk]
+                cursor.execute(f"DELETE FROM {TABLE_ROW_HASH} WHERE tabela = %s AND {_in_clause(('pk',), len(keys))}",
+                               (table_name, *keys))
+                stats.statements += 1
+    return stats
+
+
+def _upsert_groups(connection, table_name: str, groups: Dict[Tuple[str, ...], Sequence[Sequence[Any]]],
+                   pk_columns: List[str], mode: Optional[str], skip_unchanged: bool,
+                   parent_columns: Optional[Sequence[str]] = None,
+                   parents: Optional[Sequence[Sequence[Any]]] = None) -> UpsertStats:
+    """Grava os grupos na transação aberta em `connection`, sem commit."""
+    stats = UpsertStats()
+    if parent_columns and parents:
+        stats += delete_stale_children(connection, table_name, groups, pk_columns, parent_columns, parents,
+                                       skip_unchanged)
+    # Um statement compilado por conjunto de colunas
+    for cols, values in groups.items():
+        if skip_unchanged and pk_columns:
+            changed, hashes = filter_changed(connection, table_name, cols, values, tuple(pk_columns))
+            stats.skipped += len(values) - len(changed)
+            stats.rows += len(values) - len(changed)
+            values = changed
+            # Hash vai na mesma transação da linha: nunca fica "à frente" do dado
+            # (BINARY não passa pelo TSV do bulk: hashes sempre em lote)
+            execute_upsert(connection, TABLE_ROW_HASH, ("tabela", "pk", "row_hash"), hashes,
+                           ("tabela", "pk"), "row" if mode == "row" else "batch")
+        stats += execute_upsert(connection, table_name, cols, values, pk_columns, mode)
+    return stats
+
+
+# Função para upsert usando PyMySQL, com contagens detalhadas
+def upsert_rows_stats(engine, table_name: str, rows: Sequence[Any], pk_columns: List[str],
+                      mode: Optional[str] = None, skip_unchanged: Optional[bool] = None,
+                      columns: Optional[Sequence[str]] = None, parent_columns: Optional[Sequence[str]] = None,
+                      parents: Optional[Sequence[Sequence[Any]]] = None) -> UpsertStats:
+    """
+    Upsert com contagens detalhadas. `rows` são dicts, ou tuplas na ordem de
+    `columns` quando ele é informado (saída de TableSpec.normalize).
+
+    Com `parent_columns` e `parents` (valores dessas colunas), `rows` passa a
+    ser o conjunto completo de linhas desses pais: as gravadas que não vieram
+    são apagadas na mesma transação (`delete_stale_children`).
+    """
+    if not rows and not parents:
+        return UpsertStats()
+    skip_unchanged = ROW_HASH_SKIP if skip_unchanged is None else skip_unchanged
+    groups = {tuple(columns): rows} if columns is not None else _group_by_columns(rows)
+
+    try:
+        # Conexão do pool (ou a conexão/pool informado em `engine`)
+        with checkout(engine) as connection:
+            if skip_unchanged:
+                ensure_row_hash_table(connection)
+            try:
+                stats = _upsert_groups(connection, table_name, groups, pk_columns, mode, skip_unchanged,
+                                       parent_columns, parents)
+                # Commit para salvar no banco
+                connection.commit()
+                return stats
+            except Exception:
+                connection.rollback()
+                raise
+
+    except Exception as e:
+        log.error(f"Erro no upsert: {e}")
+        return UpsertStats(errors=1)
+
+
+class UnitOfWork:
+    """
+    Uma transação para vários upserts (tabelas e páginas diferentes) numa
+    única conexão do pool: nada fica visível até `commit()`, que pode vir
+    depois de N páginas. Reduz commits/fsync e garante que pai e filhas de
+    uma página entram (ou não) juntos.
+
+    Uso: `with UnitOfWork(pool) as uow: uow.upsert(...)` (commit na saída,
+    rollback em exceção) ou `open()`/`commit()`/`close()` explícitos. Não é
+    thread-safe: quem compartilha a unidade serializa as chamadas.
+    """
+
+    def __init__(self, engine=None, mode: Optional[str] = None, skip_unchanged: Optional[bool] = None):
+        self.engine = engine
+        self.mode = mode
+        self.skip_unchanged = ROW_HASH_SKIP if skip_unchanged is None else skip_unchanged
+        self.connection = None
+        self.pending_rows = 0  # linhas enviadas desde o último commit
+        self.commits = 0
+        self.rollbacks = 0
+        self._cm = None
+
+    def open(self) -> "UnitOfWork":
+        self._cm = checkout(self.engine)
+        self.connection = self._cm.__enter__()
+        if self.skip_unchanged:
+            # DDL faz commit implícito: só antes da primeira escrita
+            ensure_row_hash_table(self.connection)
+        return self
+
+    def upsert(self, table_name: str, rows: Sequence[Any], pk_columns: List[str],
+               columns: Optional[Sequence[str]] = None, parent_columns: Optional[Sequence[str]] = None,
+               parents: Optional[Sequence[Sequence[Any]]] = None) -> UpsertStats:
+        """
+        Grava na transação aberta; exceções sobem (quem chama decide o
+        rollback). `parent_columns`/`parents` como em upsert_rows_stats.
+        """
+        if not rows and not parents:
+            return UpsertStats()
+        groups = {tuple(columns): rows} if columns is not None else _group_by_columns(rows)
+        stats = _upsert_groups(self.connection, table_name, groups, pk_columns, self.mode, self.skip_unchanged,
+                               parent_columns, parents)
+        self.pending_rows += stats.rows - stats.skipped
+        return stats
+
+    def execute(self, sql: str, args: Optional[Sequence[Any]] = None) -> int:
+        with self.connection.cursor() as cursor:
+            return cursor.execute(sql, args)
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self.pending_rows = 0
+        self.commits += 1
+
+    def rollback(self) -> None:
+        self.connection.rollback()
+        self.pending_rows = 0
+        self.rollbacks += 1
+
+    def close(self) -> None:
+        """Devolve a conexão; o que não teve commit é descartado."""
+        if self._cm is None:
+            return
+        cm, self._cm = self._cm, None
+        try:
+            self.connection.rollback()
+        except Exception as e:
+            # Conexão quebrada: o pool descarta ao ver a exceção
+            cm.__exit__(type(e), e, e.__traceback__)
+        else:
+            cm.__exit__(None, None, None)
+        finally:
+            self.connection = None
+
+    def __enter__(self) -> "UnitOfWork":
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.close()
+
+
+# Função para upsert usando PyMySQL
+def upsert_rows(engine, table_name: str, rows: List[Dict[str, Any]], pk_columns: List[str]) -> int:
+    # Número de registros afetados (inseridos ou atualizados)
+    return upsert_rows_stats(engine, table_name, rows, pk_columns).rows
@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import importlib
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from etl_http import close_session
+from etl_pipeline import PIPELINE_LOAD_WORKERS, add_common_args
+from etl_utils import MYSQL_POOL_SIZE, MySQLPool
+
+# -----------------------------------------------------------------------------
+# Config
+# -----------------------------------------------------------------------------
+load_dotenv()
+
+log = logging.getLogger("run_all")
+log.setLevel(logging.INFO)
+_console = logging.StreamHandler()
+_console.setLevel(logging.INFO)
+_console.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s"))
+log.addHandler(_console)
+
+# Cargas conhecidas: nome -> (módulo do runner, api_name)
+LOADERS: Dict[str, Tuple[str, str]] = {
+    "reservas": ("run_reservas", "cv_reservas"),
+    "precadastros": ("run_precadastros", "cv_precadastros"),
+    "visitas": ("run_visitas", "cv_visitas"),
+}
+# Ordem obrigatória entre cargas: nome -> cargas que precisam terminar antes.
+# Hoje são independentes; RUN_ALL_AFTER="visitas:reservas,..." ou --after acrescentam.
+DEPENDS: Dict[str, List[str]] = {}
+
+# "thread": um processo, pool MySQL e session HTTP compartilhados;
+# "process": um processo por carga (cada um com seus pools)
+RUN_ALL_MODE = (os.getenv("RUN_ALL_MODE") or "thread").lower()
+# Cargas rodando ao mesmo tempo
+RUN_ALL_CONCURRENCY = int(os.getenv("RUN_ALL_CONCURRENCY") or str(len(LOADERS)))
+# Requisições HTTP simultâneas somando todas as cargas (0 = cada endpoint usa
+# o seu *_CONCURRENCY); o orçamento é dividido entre as cargas em paralelo
+RUN_ALL_HTTP_BUDGET = int(os.getenv("RUN_ALL_HTTP_BUDGET") or "0")
+RUN_ALL_AFTER = os.getenv("RUN_ALL_AFTER") or ""
+
+
+def parse_after(specs: List[str]) -> Dict[str, List[str]]:
+    """"visitas:reservas" -> {"visitas": ["reservas"]} (aceita vírgulas)."""
+    depends: Dict[str, List[str]] = {name: list(deps) for name, deps in DEPENDS.items()}
+    for item in (x.strip() for spec in specs for x in spec.split(",")):
+        if not item:
+            continue
+        name, _, before = item.partition(":")
+        for n in (name, before):
+            if n not in LOADERS:
+                raise SystemExit(f"Carga desconhecida em --after: {n!r} (conhecidas: {', '.join(LOADERS)})")
+        depends.setdefault(name, []).append(before)
+    return depends
+
+
+# -----------------------------------------------------------------------------
+# Execução
+# -----------------------------------------------------------------------------
+def _skipped(name: str, reason: str) -> Dict[str, Any]:
+    return {"carga": name, "status": "pulada", "segundos": 0.0, "registros": 0, "linhas": 0, "erros": 0, "erro": reason}
+
+
+def run_loader(name: str, resume: Optional[bool] = None, bulk: bool = False, replay: bool = False,
+               http_share: int = 0, pool=None, defer_indexes: Optional[bool] = None) -> Dict[str, Any]:
+    """Roda uma carga e devolve o resumo (dict simples: volta de outro processo)."""
+    module_name, api_name = LOADERS[name]
+    result: Dict[str, Any] = {"carga": name, "status": "ok", "segundos": 0.0,
+                              "registros": 0, "linhas": 0, "erros": 0, "erro": None}
+    t0 = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+        if http_share:
+            module.ENDPOINT.concurrency = max(1, min(module.ENDPOINT.concurrency, http_share))
+        totals = module.run(api_name, resume=resume, bulk=bulk, replay=replay, pool=pool, defer_indexes=defer_indexes)
+    except Exception as e:
+        log.exception(f"[{name}] Falha na carga: {e}")
+        result.update(status="erro", erro=str(e))
+    else:
+        # Abortada (sem a página 1) ou com páginas pendentes também devolve totals
+        run_status = (module.ENDPOINT.last_run or {}).get("status")
+        if run_status == "failed":
+            result.update(status="erro", erro="execução abortada (ver etl_run)")
+        elif run_status == "partial" or totals.errors:
+            result.update(status="parcial")
+        result.update(linhas=totals.rows, erros=totals.errors, registros=module.ENDPOINT.stats.snapshot()["records"])
+    result["segundos"] = round(time.perf_counter() - t0, 2)
+    return result
+
+
+def run_all(names: List[str], mode: str = RUN_ALL_MODE, concurrency: int = RUN_ALL_CONCURRENCY,
+            depends: Optional[Dict[str, List[str]]] = None, resume: Optional[bool] = None,
+            bulk: bool = False, replay: bool = False, defer_indexes: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """
+    Roda as cargas `names` em paralelo (até `concurrency` por vez), cada uma
+    só depois das suas dependências em `depends`. Se uma dependência falhar,
+    a dependente é pulada. Devolve os resumos na ordem de `names`.
+
+    No modo "thread" todas usam o mesmo MySQLPool (dimensionado para as
+    cargas simultâneas) e a session HTTP do processo.
+    """
+    depends = {n: [d for d in (depends or {}).get(n, []) if d in names] for n in names}
+    concurrency = max(1, min(concurrency, len(names)))
+    http_share = RUN_ALL_HTTP_BUDGET // concurrency if RUN_ALL_HTTP_BUDGET else 0
+    pool = None
+    if mode == "thread":
+        # Cada carga segura uma conexão na UnitOfWork + workers de load + escritas de estado
+        pool = MySQLPool(size=max(MYSQL_POOL_SIZE, concurrency * (PIPELINE_LOAD_WORKERS + 2)))
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="run_all")
+    elif mode == "process":
+        executor = ProcessPoolExecutor(max_workers=concurrency)
+    else:
+        raise ValueError(f"RUN_ALL_MODE inválido: {mode!r} (use thread ou process)")
+
+    order = {n: d for n, d in depends.items() if d}
+    log.info(f"Cargas: {', '.join(names)} | modo={mode} simultâneas={concurrency} "
+             f"http_por_carga={http_share or 'padrão'} dependências={order or '-'}")
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = list(names)
+    running: Dict[Future, str] = {}
+    try:
+        with executor:
+            while pending or running:
+                for name in list(pending):
+                    deps = depends[name]
+                    failed = [d for d in deps if d in results and results[d]["status"] in ("erro", "pulada")]
+                    if failed:
+                        log.warning(f"[{name}] Pulada: dependência com erro ({', '.join(failed)})")
+                        results[name] = _skipped(name, f"dependência: {', '.join(failed)}")
+                        pending.remove(name)
+                    elif all(d in results for d in deps):
+                        running[executor.submit(run_loader, name, resume, bulk, replay, http_share, pool,
+                                                defer_indexes)] = name
+                        pending.remove(name)
+                if not running:
+                    # Sobrou algo e nada roda: dependência circular
+                    for name in pending:
+                        log.error(f"[{name}] Pulada: dependência circular ({depends[name]})")
+                        results[name] = _skipped(name, "dependência circular")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+    finally:
+        if pool is not None:
+            log.info(f"Pool MySQL compartilhado: {pool.stats()}")
+            pool.close()
+        close_session()
+    return [results[n] for n in names]
+
+
+def print_summary(results: List[Dict[str, Any]], elapsed: float) -> None:
+    log.info("=" * 78)
+    log.info(f"{'carga':<14}{'status':<9}{'tempo (s)':>10}{'registros':>11}{'reg/s':>9}{'linhas':>10}{'erros':>7}")
+    for r in results:
+        rate = r["registros"] / r["segundos"] if r["segundos"] else 0.0
+        log.info(f"{r['carga']:<14}{r['status']:<9}{r['segundos']:>10.1f}{r['registros']:>11}"
+                 f"{rate:>9.0f}{r['linhas']:>10}{r['erros']:>7}" + (f"  {r['erro']}" if r["erro"] else ""))
+    records = sum(r["registros"] for r in results)
+    serial = sum(r["segundos"] for r in results)
+    log.info(f"{'total':<14}{'':<9}{elapsed:>10.1f}{records:>11}{records / elapsed if elapsed else 0:>9.0f}"
+             f"{sum(r['linhas'] for r in results):>10}{sum(r['erros'] for r in results):>7}"
+             f"  (soma das cargas: {serial:.1f}s)")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Cargas do CVDW em paralelo, com resumo consolidado")
+    parser.add_argument("loaders", nargs="*", metavar="carga",
+                        help=f"cargas a rodar (padrão: todas): {', '.join(LOADERS)}")
+    parser.add_argument("--mode", choices=("thread", "process"), default=RUN_ALL_MODE,
+                        help="threads com pools compartilhados ou um processo por carga")
+    parser.add_argument("--concurrency", type=int, default=RUN_ALL_CONCURRENCY,
+                        help="cargas rodando ao mesmo tempo")
+    parser.add_argument("--after", action="append", default=[RUN_ALL_AFTER], metavar="CARGA:ANTES",
+                        help="só roda CARGA depois de ANTES terminar (repetível)")
+    return add_common_args(parser).parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    names = args.loaders or list(LOADERS)
+    unknown = [n for n in names if n not in LOADERS]
+    if unknown:
+        raise SystemExit(f"Carga desconhecida: {', '.join(unknown)} (conhecidas: {', '.join(LOADERS)})")
+    t0 = time.perf_counter()
+    results = run_all(names, mode=args.mode, concurrency=args.concurrency, depends=parse_after(args.after),
+                      resume=args.resume, bulk=args.bulk, replay=args.replay, defer_indexes=args.defer_indexes)
+    print_summary(results, time.perf_counter() - t0)
+    sys.exit(0 if all(r["status"] == "ok" for r in results) else 1)
@@ -0,0 +1,280 @@
+import os
+import sys
+import math
+import time
+import logging
+import argparse
+import importlib
+import multiprocessing
+from dataclasses import replace
+from datetime import datetime, timedelta
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from etl_http import HttpStats, close_session, fetch_page, total_pages_of
+from etl_indexes import CVCRM_DEFER_INDEXES, drop_indexes, pending_warning, restore_indexes
+from etl_pipeline import LoadOptions, run_paged_load
+from etl_state import (backfill_shards, create_backfill, find_resumable_backfill, find_resumable_run,
+                       format_watermark, mark_shard, shard_endpoint)
+from etl_utils import UPSERT_MODE, get_pool
+from run_all import LOADERS
+
+# -----------------------------------------------------------------------------
+# Config
+# -----------------------------------------------------------------------------
+load_dotenv()
+
+log = logging.getLogger("run_backfill")
+log.setLevel(logging.INFO)
+_console = logging.StreamHandler()
+_console.setLevel(logging.INFO)
+_console.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s"))
+log.addHandler(_console)
+
+# "date": janelas de a_partir_data_cad/BACKFILL_UNTIL_PARAM (estáveis: data_cad
+# não muda); "pages": faixas de páginas de uma só consulta (deslocam se entrar
+# registro novo no meio do backfill)
+BACKFILL_MODE = (os.getenv("BACKFILL_MODE") or "date").lower()
+BACKFILL_SINCE_PARAM = os.getenv("BACKFILL_SINCE_PARAM") or "a_partir_data_cad"
+BACKFILL_UNTIL_PARAM = os.getenv("BACKFILL_UNTIL_PARAM") or "ate_data_cad"
+BACKFILL_WINDOW_DAYS = int(os.getenv("BACKFILL_WINDOW_DAYS") or "30")
+# Processos de carga; cada um tem session HTTP e pool MySQL próprios
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS") or str(os.cpu_count() or 2))
+# Shards por worker no modo "pages" (shards menores equilibram melhor o fim)
+BACKFILL_SHARDS_PER_WORKER = int(os.getenv("BACKFILL_SHARDS_PER_WORKER") or "4")
+# Requisições simultâneas por shard (0 = *_CONCURRENCY do endpoint)
+BACKFILL_HTTP_CONCURRENCY = int(os.getenv("BACKFILL_HTTP_CONCURRENCY") or "0")
+# Novas tentativas de um shard que falhou, na mesma execução (retoma pelas páginas pendentes)
+BACKFILL_SHARD_RETRIES = int(os.getenv("BACKFILL_SHARD_RETRIES") or "1")
+
+
+# -----------------------------------------------------------------------------
+# Plano
+# -----------------------------------------------------------------------------
+def date_windows(since: datetime, until: datetime, days: int) -> List[Tuple[datetime, Optional[datetime]]]:
+    """
+    Janelas [início, fim] consecutivas de `days` dias entre `since` e `until`,
+    sem sobreposição (o fim é 1s antes do próximo início). A última fica sem
+    fim, para pegar o que for cadastrado durante o backfill.
+    """
+    step = timedelta(days=max(1, days))
+    starts = [since]
+    while starts[-1] + step < until:
+        starts.append(starts[-1] + step)
+    return [(start, nxt - timedelta(seconds=1)) for start, nxt in zip(starts, starts[1:])] + [(starts[-1], None)]
+
+
+def page_ranges(total: int, shards: int) -> List[Tuple[int, Optional[int]]]:
+    """Faixas contíguas de páginas 1..total; a última vai até o total da hora em que rodar."""
+    size = max(1, math.ceil(total / max(1, shards)))
+    firsts = list(range(1, total + 1, size)) or [1]
+    return [(first, first + size - 1) for first in firsts[:-1]] + [(firsts[-1], None)]
+
+
+def plan_shards(endpoint, mode: str, since: datetime, until: datetime, window_days: int, page_size: int,
+                shards: int) -> List[Dict[str, Any]]:
+    """
+    Shards do backfill. No modo "date", confere antes se a API respeita o fim
+    da janela (a primeira janela tem que ter menos páginas que a consulta
+    aberta); se não respeitar, cai para "pages".
+    """
+    base = {BACKFILL_SINCE_PARAM: format_watermark(since), "registros_por_pagina": page_size}
+    probe = fetch_page(endpoint, 1, base)
+    if not probe:
+        raise RuntimeError(f"{endpoint.name}: sem resposta da página 1 para planejar o backfill")
+    total = total_pages_of(probe)
+    if mode == "date":
+        windows = date_windows(since, until, window_days)
+        if len(windows) > 1:
+            first = fetch_page(endpoint, 1, {**base, BACKFILL_UNTIL_PARAM: format_watermark(windows[0][1])})
+            if total > 1 and first and total_pages_of(first) >= total:
+                log.warning(f"[{endpoint.name}] A API ignorou {BACKFILL_UNTIL_PARAM} (a 1ª janela tem as mesmas "
+                            f"{total} páginas da consulta aberta); usando faixas de páginas.")
+                mode = "pages"
+        if mode == "date":
+            return [{"shard": i, "kind": "date",
+                     "filters": {**base, BACKFILL_SINCE_PARAM: format_watermark(start),
+                                 **({BACKFILL_UNTIL_PARAM: format_watermark(end)} if end else {})}}
+                    for i, (start, end) in enumerate(windows)]
+    return [{"shard": i, "kind": "pages", "filters": base, "first_page": first, "last_page": last}
+            for i, (first, last) in enumerate(page_ranges(total, shards))]
+
+
+# -----------------------------------------------------------------------------
+# Execução
+# -----------------------------------------------------------------------------
+def run_shard(name: str, backfill_id: str, shard: Dict[str, Any], bulk: bool = False,
+              http_concurrency: int = 0) -> Dict[str, Any]:
+    """
+    Roda um shard no processo atual (worker). O endpoint do shard tem nome
+    próprio em etl_run/etl_checkpoint, então uma nova tentativa retoma só as
+    páginas que faltaram. O watermark incremental não é tocado: as janelas
+    terminam fora de ordem.
+    """
+    module_name, api_name = LOADERS[name]
+    result: Dict[str, Any] = {"shard": shard["shard"], "status": "done", "segundos": 0.0,
+                              "registros": 0, "linhas": 0, "erro": None}
+    t0 = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+        endpoint = replace(module.ENDPOINT, name=shard_endpoint(module.ENDPOINT.name, backfill_id, shard["shard"]),
+                           adaptive_page_size=False, limiter=None, stats=HttpStats())
+        if http_concurrency:
+            endpoint.concurrency = http_concurrency
+        pages = (shard["first_page"], shard["last_page"]) if shard["kind"] == "pages" else None
+        pool = get_pool()
+        totals = run_paged_load(f"{api_name}#{shard['shard']}", endpoint, shard["filters"], module.transform,
+                                module.SPECS, logger=module.log, pool=pool,
+                                options=LoadOptions(ordered=False, resume=True, upsert_mode="bulk" if bulk else None,
+                                                    pages=pages, dimensions=module.DIMENSIONS, defer_indexes=False))
+        result.update(linhas=totals.rows, registros=endpoint.stats.snapshot()["records"])
+        if find_resumable_run(endpoint.name, pool):
+            result.update(status="failed", erro="páginas pendentes")
+    except Exception as e:
+        module_log = logging.getLogger(module_name)
+        module_log.exception(f"[{api_name}#{shard['shard']}] Falha no shard: {e}")
+        result.update(status="failed", erro=str(e))
+    finally:
+        close_session()
+    result["segundos"] = round(time.perf_counter() - t0, 2)
+    return result
+
+
+def backfill(name: str, mode: str = BACKFILL_MODE, since: Optional[datetime] = None,
+             until: Optional[datetime] = None, window_days: int = BACKFILL_WINDOW_DAYS,
+             workers: int = BACKFILL_WORKERS, shards: Optional[int] = None, resume: bool = False,
+             bulk: bool = False, http_concurrency: int = BACKFILL_HTTP_CONCURRENCY,
+             defer_indexes: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """
+    Backfill de uma carga em shards rodando em `workers` processos. O plano e
+    o andamento ficam em etl_backfill_shard; com `resume`, continua o último
+    backfill incompleto da carga pelos shards que não terminaram.
+
+    Com `defer_indexes` o coordenador derruba os índices secundários antes
+    do primeiro shard e os recria depois do último (mesmo com falha).
+    """
+    module_name, _ = LOADERS[name]
+    module = importlib.import_module(module_name)
+    endpoint = module.ENDPOINT
+    pool = get_pool()
+
+    backfill_id = find_resumable_backfill(endpoint.name, pool) if resume else None
+    if backfill_id:
+        plan = backfill_shards(backfill_id, pool)
+        log.info(f"[{name}] Retomando backfill {backfill_id}: "
+                 f"{sum(s['status'] == 'done' for s in plan)}/{len(plan)} shard(s) prontos")
+    else:
+        if resume:
+            log.info(f"[{name}] Nada a retomar; novo backfill.")
+        if since is None:
+            raise SystemExit("Informe --since (ou CVCRM_SINCE) para planejar o backfill")
+        shards = shards or workers * BACKFILL_SHARDS_PER_WORKER
+        plan = plan_shards(endpoint, mode, since, until or datetime.now(), window_days, endpoint.page_size, shards)
+        close_session()
+        backfill_id = create_backfill(endpoint.name, plan, pool)
+        for s in plan:
+            s.update(status="pending", attempts=0)
+        log.info(f"[{name}] Backfill {backfill_id}: {len(plan)} shard(s) por {plan[0]['kind']} "
+                 f"desde {format_watermark(since)}")
+
+    todo = [s for s in plan if s["status"] != "done"]
+    tables = list(module.SPECS)
+    defer_indexes = CVCRM_DEFER_INDEXES if defer_indexes is None else defer_indexes
+    if defer_indexes and todo:
+        dropped = {t: len(names) for t, names in drop_indexes(tables, pool).items()}
+        log.info(f"[{name}] Índices secundários adiados até o fim do backfill: {dropped or 'nenhum'}")
+    elif todo:
+        pending_warning(tables, pool, log, f"[{name}] ")
+    workers = max(1, min(workers, len(todo) or 1))
+    log.info(f"[{name}] {len(todo)} shard(s) a rodar em {workers} processo(s) | "
+             f"http por shard={http_concurrency or endpoint.concurrency}")
+    results: Dict[int, Dict[str, Any]] = {}
+    tries: Dict[int, int] = {}
+    earlier: Dict[int, Dict[str, Any]] = {}
+    # spawn: cada worker abre a própria session HTTP e as próprias conexões
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    running: Dict[Future, Dict[str, Any]] = {}
+
+    def submit(shard: Dict[str, Any]) -> None:
+        tries[shard["shard"]] = tries.get(shard["shard"], 0) + 1
+        mark_shard(backfill_id, shard["shard"], "running", engine=pool)
+        running[executor.submit(run_shard, name, backfill_id, shard, bulk, http_concurrency)] = shard
+
+    try:
+        with executor:
+            for shard in todo:
+                submit(shard)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard = running.pop(future)
+                    r = future.result()
+                    # Tentativas anteriores do shard nesta execução somam no resumo
+                    for key in ("segundos", "registros", "linhas"):
+                        r[key] += earlier.get(shard["shard"], {}).get(key, 0)
+                    earlier[shard["shard"]] = r
+                    mark_shard(backfill_id, shard["shard"], r["status"], r["registros"], r["linhas"], r["segundos"],
+                               engine=pool)
+                    if r["status"] != "done" and tries[shard["shard"]] <= BACKFILL_SHARD_RETRIES:
+                        log.warning(f"[{name}] Shard {shard['shard']} falhou ({r['erro']}); nova tentativa.")
+                        submit(shard)
+                        continue
+                    results[shard["shard"]] = r
+                    log.info(f"[{name}] Shard {shard['shard']} {r['status']}: {r['registros']} registros, "
+                             f"{r['linhas']} linhas em {r['segundos']}s ({len(results)}/{len(todo)})")
+    finally:
+        if defer_indexes and todo:
+            restore_indexes(tables, pool, log, f"[{name}] ")
+    return [results[s["shard"]] for s in todo]
+
+
+def print_summary(name: str, results: List[Dict[str, Any]], elapsed: float) -> None:
+    records = sum(r["registros"] for r in results)
+    failed = [r["shard"] for r in results if r["status"] != "done"]
+    serial = sum(r["segundos"] for r in results)
+    log.info(f"[{name}] Backfill: {len(results)} shard(s) em {elapsed:.1f}s (soma dos shards: {serial:.1f}s) | "
+             f"{records} registros ({records / elapsed if elapsed else 0:.0f}/s) | "
+             f"{sum(r['linhas'] for r in results)} linhas")
+    if failed:
+        log.error(f"[{name}] Shards pendentes: {failed}. Rode de novo com --resume.")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    def date(value: str) -> datetime:
+        return datetime.fromisoformat(value)
+
+    parser = argparse.ArgumentParser(description="Backfill de uma carga do CVDW em shards por processo")
+    parser.add_argument("loader", metavar="carga", choices=list(LOADERS), help=", ".join(LOADERS))
+    parser.add_argument("--mode", choices=("date", "pages"), default=BACKFILL_MODE,
+                        help="janelas de data de cadastro ou faixas de páginas")
+    parser.add_argument("--since", type=date, default=os.getenv("CVCRM_SINCE"),
+                        help="início do backfill (padrão: CVCRM_SINCE)")
+    parser.add_argument("--until", type=date, default=None, help="fim da última janela fechada (padrão: agora)")
+    parser.add_argument("--window-days", type=int, default=BACKFILL_WINDOW_DAYS)
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--shards", type=int, default=None,
+                        help="shards no modo pages (padrão: workers x BACKFILL_SHARDS_PER_WORKER)")
+    parser.add_argument("--http-concurrency", type=int, default=BACKFILL_HTTP_CONCURRENCY)
+    parser.add_argument("--resume", action="store_true", help="continua o último backfill incompleto da carga")
+    parser.add_argument("--bulk", action="store_true", default=UPSERT_MODE == "bulk",
+                        help="grava via LOAD DATA LOCAL INFILE + staging (requer MYSQL_LOCAL_INFILE=1)")
+    parser.add_argument("--defer-indexes", action="store_true", default=None,
+                        help="derruba os índices secundários antes dos shards e recria no fim (CVCRM_DEFER_INDEXES); "
+                             "combine com --bulk")
+    args = parser.parse_args(argv)
+    if isinstance(args.since, str):
+        args.since = date(args.since)
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    t0 = time.perf_counter()
+    results = backfill(args.loader, mode=args.mode, since=args.since, until=args.until,
+                       window_days=args.window_days, workers=args.workers, shards=args.shards,
+                       resume=args.resume, bulk=args.bulk, http_concurrency=args.http_concurrency,
+                       defer_indexes=args.defer_indexes)
+    print_summary(args.loader, results, time.perf_counter() - t0)
+    sys.exit(0 if all(r["status"] == "done" for r in results) else 1)
@@ -0,0 +1,118 @@
+import sys
+import logging
+import argparse
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from etl_partitions import (PARTITION_FUTURE_MONTHS, PARTITION_HOT_MONTHS, PARTITIONED_TABLES, TABLES,
+                            add_future_partitions, archive_partitions, enable_partitioning, partition_status)
+from etl_utils import get_pool
+
+# -----------------------------------------------------------------------------
+# Config
+# -----------------------------------------------------------------------------
+load_dotenv()
+
+log = logging.getLogger("run_partitions")
+log.setLevel(logging.INFO)
+_console = logging.StreamHandler()
+_console.setLevel(logging.INFO)
+_console.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s"))
+log.addHandler(_console)
+
+
+# -----------------------------------------------------------------------------
+# Manutenção (agendar uma vez por mês, fora do horário das cargas)
+# -----------------------------------------------------------------------------
+# Particionada, a PK vira (id, data_cad) e o upsert casa pelos dois: se o CRM
+# corrigir a data_cad de um registro, a carga grava uma segunda linha (a
+# antiga fica na partição do mês anterior) em vez de atualizar a existente.
+# Consultas por id devem pegar a de data_cad mais recente; a duplicata só
+# sai apagando a linha antiga à mão.
+def maintain(table: str, enable: bool = False, future: Optional[int] = None, hot_months: Optional[int] = None,
+             archive: bool = True, dry_run: bool = False, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Particiona a tabela (com `enable`), cria as partições dos próximos meses
+    e move as partições fora da janela quente para o arquivo. Com `dry_run`
+    só registra o que faria.
+    """
+    pt = TABLES[table]
+    pool = get_pool()
+    prefix = f"[{table}] " + ("(dry-run) " if dry_run else "")
+    result: Dict[str, Any] = {"table": table, "status": "ok", "archived": {}}
+
+    if not partition_status(pt, pool)["partitioned"]:
+        if not enable:
+            log.warning(f"{prefix}Tabela não particionada; rode com --enable para particionar por {pt.column}")
+            result["status"] = "not_partitioned"
+            return result
+        log.info(f"{prefix}Particionando por mês em {pt.column} (PK passa a ser {pt.key}, {pt.column})...")
+        sql = enable_partitioning(pt, pool, today, future, dry_run)
+        log.info(f"{prefix}{sql}")
+        if dry_run:
+            # Sem as partições criadas não há o que planejar adiante
+            return result
+    if table not in PARTITIONED_TABLES:
+        log.warning(f"{prefix}Inclua {table} em PARTITIONED_TABLES no .env do runner: com {pt.column} NOT NULL "
+                    f"na PK, registro sem {pt.column} precisa ser descartado na normalização")
+
+    sql = add_future_partitions(pt, pool, today, future, dry_run)
+    log.info(f"{prefix}{sql if sql else 'Partições futuras já criadas'}")
+
+    if archive:
+        result["archived"] = archive_partitions(pt, pool, today, hot_months, dry_run, log)
+        for name, rows in result["archived"].items():
+            log.info(f"{prefix}Partição {name} -> {pt.archive}: {rows} linha(s)")
+
+    status = partition_status(pt, pool)
+    if status["overflow_rows"]:
+        log.warning(f"{prefix}{status['overflow_rows']} linha(s) na partição MAXVALUE (data além das partições "
+                    f"mensais); elas não se beneficiam do pruning até a tabela ser reorganizada")
+    result.update(status)
+    return result
+
+
+def print_summary(results: List[Dict[str, Any]]) -> None:
+    log.info("-" * 60)
+    for r in results:
+        if r["status"] != "ok" or "partitions" not in r:
+            log.info(f"{r['table']:<12} {r['status']}")
+            continue
+        parts = r["partitions"]
+        span = f"{parts[0][0]}..{parts[-1][0]}" if parts else "-"
+        log.info(f"{r['table']:<12} {len(parts)} partições ({span}) | quente ~{r['hot_rows']} linha(s) | "
+                 f"arquivo ~{r['archive_rows'] or 0} linha(s) | arquivadas agora: {len(r['archived'])}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Partições mensais e arquivamento de cv_visitas/cv_reservas")
+    parser.add_argument("tables", metavar="tabela", nargs="*", default=list(TABLES), help=", ".join(TABLES))
+    parser.add_argument("--enable", action="store_true",
+                        help="particiona as tabelas que ainda não são particionadas (ALTER TABLE com cópia)")
+    parser.add_argument("--future", type=int, default=PARTITION_FUTURE_MONTHS,
+                        help="meses de partições criadas à frente (PARTITION_FUTURE_MONTHS)")
+    parser.add_argument("--hot-months", type=int, default=PARTITION_HOT_MONTHS,
+                        help="meses mantidos na tabela quente (PARTITION_HOT_MONTHS)")
+    parser.add_argument("--no-archive", action="store_true", help="só cria as partições futuras")
+    parser.add_argument("--dry-run", action="store_true", help="mostra o SQL/as partições sem alterar nada")
+    args = parser.parse_args(argv)
+    unknown = [t for t in args.tables if t not in TABLES]
+    if unknown:
+        parser.error(f"tabela(s) sem particionamento gerenciado: {', '.join(unknown)}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = []
+    for table in args.tables:
+        try:
+            results.append(maintain(table, enable=args.enable, future=args.future, hot_months=args.hot_months,
+                                    archive=not args.no_archive, dry_run=args.dry_run))
+        except Exception as e:
+            log.exception(f"[{table}] Falha na manutenção das partições: {e}")
+            results.append({"table": table, "status": "failed"})
+    print_summary(results)
+    sys.exit(0 if all(r["status"] != "failed" for r in results) else 1)
@@ -1,13 +1,15 @@
 import os
 import logging
-import time
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from dotenv import load_dotenv
-import requests
 
-from etl_utils import upsert_rows  # usa a função existente (abre a própria conexão)
+from etl_dimensions import DIM_EMPREENDIMENTO, DIM_RESPONSAVEL, DimensionRef
+from etl_http import env_endpoint
+from etl_partitions import PARTITIONED_TABLES
+from etl_pipeline import LoadOptions, parse_args, run_paged_load
+from etl_schema import Column, SpecGroup, TableSpec
+from etl_utils import UpsertStats
 
 # -----------------------------------------------------------------------------
 # Config
@@ -22,23 +24,18 @@ _console.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] %(message
 log.addHandler(_console)
 
 URL_VISITAS = os.getenv("URL_VISITAS", "https://frjr.cvcrm.com.br/api/v1/cvdw/visitas")
-EMAIL = os.getenv("CVCRM_EMAIL") or ""
-TOKEN = os.getenv("CVCRM_TOKEN") or ""
 
-HTTP_METHOD = (os.getenv("VISITAS_HTTP_METHOD")
-               or os.getenv("RESERVAS_HTTP_METHOD")
-               or "GET").upper()
-
-PAGE_SIZE = int(os.getenv("RESERVAS_PAGE_SIZE") or os.getenv("CVCRM_PAGE_SIZE") or "450")
-TIMEOUT = int(os.getenv("RESERVAS_TIMEOUT") or "30")
-RETRIES = int(os.getenv("RESERVAS_RETRIES") or "3")
+# Método, paginação, timeout, retries, concorrência e rate limit (VISITAS_* / RESERVAS_* / CVCRM_*)
+ENDPOINT = env_endpoint("VISITAS", "visitas", URL_VISITAS, default_timeout=30)
+# Páginas 2..N chegam em paralelo; "0" processa na ordem de chegada
+FETCH_ORDERED = (os.getenv("CVCRM_FETCH_ORDERED") or "1") == "1"
 SINCE = os.getenv("CVCRM_SINCE")  # ex: "2023-01-01 00:00:00"
+# Coluna que alimenta o watermark do sync incremental (log_cvcrm.etl_watermark)
+WATERMARK_COLUMN = "referencia_data"
+# Tabela ponte (id, idlead): idlead pode vir como "62682,65286". Opt-in:
+# crie antes as tabelas *_lead de database/CVCRM.sql
+LOAD_LEADS = (os.getenv("LOAD_LEADS") or "0") == "1"
 
-HEADERS = {
-    "email": EMAIL,
-    "token": TOKEN,
-    "Accept": "application/json",
-}
 
 # Proxy (opcional): respeita ENABLE_PROXY e limpa variáveis quando desabilitado
 if (os.getenv("ENABLE_PROXY") or "0") == "1":
@@ -49,162 +46,91 @@ else:
         os.environ.pop(k, None)
 
 TABLE_NAME = "cv_visitas"
+TABLE_LEAD = "cv_visitas_lead"
 
 # -----------------------------------------------------------------------------
-# Helpers
-# -----------------------------------------------------------------------------
-DATE_PATTERNS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
-
-def to_datetime_safe(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    for fmt in DATE_PATTERNS:
-        try:
-            return datetime.strptime(s, fmt)
-        except (ValueError, TypeError):
-            continue
-    return None
-
-def to_int_safe(v: Any) -> Optional[int]:
-    if v is None or v == "":
-        return None
-    try:
-        return int(v)
-    except (ValueError, TypeError):
-        return None
-
-def to_bigint_safe(v: Any) -> Optional[int]:
-    return to_int_safe(v)
-
-def to_char_sn(v: Any) -> Optional[str]:
-    """Normaliza flags 'S'/'N' (ou None)."""
-    if v is None or v == "":
-        return None
-    v = str(v).strip().upper()
-    return v if v in ("S", "N") else v[:1]  # mantém 'S'/'N' se vier correto
-
-# -----------------------------------------------------------------------------
-# API
+# Schema — base (cv_visitas)
 # -----------------------------------------------------------------------------
-def fetch_page(page: int, since: Optional[str] = None) -> Dict[str, Any]:
-    """
-    Busca uma página de visitas com retries e backoff simples.
-    """
-    body = {
-        "pagina": page,
-        "registros_por_pagina": PAGE_SIZE,
-    }
-    if since:
-        # Ajuste o nome do parâmetro conforme a API exigir (mantendo padrão dos outros ETLs):
-        body["a_partir_data_cad"] = since
-
-    for attempt in range(1, RETRIES + 1):
-        try:
-            if HTTP_METHOD == "POST":
-                headers = {**HEADERS, "Content-Type": "application/json"}
-                resp = requests.post(URL_VISITAS, json=body, headers=headers, timeout=TIMEOUT)
-            else:
-                resp = requests.get(URL_VISITAS, params=body, headers=HEADERS, timeout=TIMEOUT)
-
-            resp.raise_for_status()
-            return resp.json() or {}
-        except requests.RequestException as e:
-            log.warning(f"Falha ao chamar API (tentativa {attempt}/{RETRIES}) página={page}: {e}")
-            if attempt == RETRIES:
-                break
-            time.sleep(2 * attempt)
-    return {}
+SPEC_VISITAS = TableSpec(TABLE_NAME, pk=["idtarefa"], columns=[
+    # PK
+    Column("idtarefa", nullable=False),
+
+    # Metadados/identificação
+    Column("referencia"),
+    Column("referencia_data", "datetime"),
+    Column("ativo", "sn"),
+
+    # Datas e status
+    Column("data_cad", "datetime", nullable=TABLE_NAME not in PARTITIONED_TABLES),
+    Column("data", "datetime"),
+    Column("situacao"),
+
+    # Responsável principal
+    Column("idresponsavel", "bigint"),
+    Column("tipo_responsavel", "upper"),
+    Column("responsavel"),
+
+    # Lead e interação
+    Column("funcionalidade"),
+    Column("idlead", "text"),
+    Column("idinteracao", "bigint"),
+    Column("tipo_interacao"),
+    Column("data_conclusao", "datetime"),
+
+    # Tipo de visita e flags
+    Column("idtipo_visita", "int"),
+    Column("nome_tipo_visita"),
+    Column("visita_virtual", "sn"),
+
+    # PDV
+    Column("pdv"),
+    Column("painel_pdv", "sn"),
+
+    # Quem criou
+    Column("idresponsavel_por_criar_visita", "bigint"),
+    Column("responsavel_por_criar_visita"),
+
+    # Empreendimento
+    Column("idempreendimento", "bigint"),
+    Column("nome_empreendimento"),
+])
 
 # -----------------------------------------------------------------------------
-# Normalização — base (cv_visitas)
+# Schema — tabela ponte (idtarefa, idlead)
 # -----------------------------------------------------------------------------
-def normalize_rows(dados: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    for it in dados or []:
-        idtarefa = it.get("idtarefa")
-        if not idtarefa:
-            log.error("Registro sem idtarefa: %s", it)
-            continue
-
-        row: Dict[str, Any] = {
-            # PK
-            "idtarefa": idtarefa,
-
-            # Metadados/identificação
-            "referencia": it.get("referencia"),
-            "referencia_data": to_datetime_safe(it.get("referencia_data")),
-            "ativo": to_char_sn(it.get("ativo")),
-
-            # Datas e status
-            "data_cad": to_datetime_safe(it.get("data_cad")),
-            "data": to_datetime_safe(it.get("data")),
-            "situacao": it.get("situacao"),
-
-            # Responsável principal
-            "idresponsavel": to_bigint_safe(it.get("idresponsavel")),
-            "tipo_responsavel": (str(it.get("tipo_responsavel")).strip().upper() if it.get("tipo_responsavel") else None),
-            "responsavel": it.get("responsavel"),
-
-            # Lead e interação
-            "funcionalidade": it.get("funcionalidade"),
-            "idlead": str(it.get("idlead")) if it.get("idlead") is not None else None,
-            "idinteracao": to_bigint_safe(it.get("idinteracao")),
-            "tipo_interacao": it.get("tipo_interacao"),
-            "data_conclusao": to_datetime_safe(it.get("data_conclusao")),
-
-            # Tipo de visita e flags
-            "idtipo_visita": to_int_safe(it.get("idtipo_visita")),
-            "nome_tipo_visita": it.get("nome_tipo_visita"),
-            "visita_virtual": to_char_sn(it.get("visita_virtual")),
-
-            # PDV
-            "pdv": it.get("pdv"),
-            "painel_pdv": to_char_sn(it.get("painel_pdv")),
-
-            # Quem criou
-            "idresponsavel_por_criar_visita": to_bigint_safe(it.get("idresponsavel_por_criar_visita")),
-            "responsavel_por_criar_visita": it.get("responsavel_por_criar_visita"),
-
-            # Empreendimento
-            "idempreendimento": to_bigint_safe(it.get("idempreendimento")),
-            "nome_empreendimento": it.get("nome_empreendimento"),
-        }
-
-        rows.append(row)
-    return rows
+SPEC_LEAD = TableSpec(TABLE_LEAD, pk=["idtarefa", "idlead"], array="idlead", split=",", sync=True, columns=[
+    Column("idtarefa", parent=True),
+    Column("idlead"),
+])
 
 # -----------------------------------------------------------------------------
 # Runner
 # -----------------------------------------------------------------------------
-def run(api_name: str = "cv_visitas") -> None:
-    page = 1
-    total_pages = 1
-    since = SINCE
-
-    total_upserts = 0
-    total_registros_api = 0
-
-    while page <= total_pages:
-        log.info(f"[{api_name}] Processando página {page}/{total_pages} ...")
-
-        data = fetch_page(page, since)
-        if not data:
-            log.error(f"[{api_name}] Página {page}: resposta vazia/erro. Encerrando.")
-            break
-
-        dados_page: List[Dict[str, Any]] = data.get("dados") or []
-        total_pages = int(data.get("total_de_paginas") or data.get("total_pages") or total_pages)
-        total_registros_api += len(dados_page)
-
-        # Base
-        base_rows = normalize_rows(dados_page)
-        if base_rows:
-            total_upserts += upsert_rows(None, TABLE_NAME, base_rows, pk_columns=["idtarefa"])
-
-        log.info(f"[{api_name}] Página {page} concluída. Registros API: {len(dados_page)} | Upserts acumulados: {total_upserts}")
-        page += 1
-
-    log.info(f"[{api_name}] Finalizado. Registros recebidos da API: {total_registros_api} | Upserts totais: {total_upserts}")
+# Pares (id, nome) que vão para as dimensões com CVCRM_DIMENSIONS=1
+DIMENSIONS = [
+    DimensionRef(DIM_RESPONSAVEL, TABLE_NAME, "idresponsavel", "responsavel"),
+    DimensionRef(DIM_EMPREENDIMENTO, TABLE_NAME, "idempreendimento", "nome_empreendimento"),
+]
+
+# Base + ponte de leads, numa passada só por registro
+PAGE_SPECS = SpecGroup([SPEC_VISITAS] + ([SPEC_LEAD] if LOAD_LEADS else []))
+# Só as tabelas habilitadas: índices adiados/conferidos e sync seguem esta lista
+SPECS = {spec.name: spec for spec in PAGE_SPECS.specs}
+
+def transform(dados_page: Iterable[Dict[str, Any]]) -> Dict[str, List[Tuple[Any, ...]]]:
+    """Normaliza uma página (lista ou stream de registros) nas tabelas de destino."""
+    return PAGE_SPECS.normalize(dados_page)
+
+def run(api_name: str = "cv_visitas", resume: Optional[bool] = None, bulk: bool = False,
+        replay: bool = False, pool=None, defer_indexes: Optional[bool] = None) -> UpsertStats:
+    # fetch -> normalização -> upsert em estágios paralelos com filas limitadas
+    return run_paged_load(api_name, ENDPOINT, {"a_partir_data_cad": SINCE}, transform, SPECS,
+                          logger=log, pool=pool,
+                          options=LoadOptions(ordered=FETCH_ORDERED, resume=resume, replay=replay,
+                                              upsert_mode="bulk" if bulk else None,
+                                              watermark=(TABLE_NAME, WATERMARK_COLUMN), dimensions=DIMENSIONS,
+                                              defer_indexes=defer_indexes))
 
 if __name__ == "__main__":
-    run("cv_visitas")
+    args = parse_args("cv_visitas")
+    run("cv_visitas", resume=args.resume, bulk=args.bulk, replay=args.replay, defer_indexes=args.defer_indexes)
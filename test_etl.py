@@ -0,0 +1,132 @@
+"""
+Testes sem banco das partes puras do ETL: normalização compilada, contagem
+do affected-rows, split de idlead, watermark, janelas/faixas do backfill e
+SQL de particionamento.
+
+    python -m pytest -q
+"""
+from datetime import date, datetime
+
+import pytest
+
+from bench import legacy_reservas
+from bench.bench_normalize import synthetic_records
+from etl_partitions import PartitionedTable, partition_sql
+from etl_schema import split_values
+from etl_state import WatermarkTracker
+from etl_utils import _count_affected
+from run_backfill import date_windows, page_ranges
+from run_reservas import SPEC_RESERVAS
+
+
+# -----------------------------------------------------------------------------
+# Normalização
+# -----------------------------------------------------------------------------
+def test_compiled_normalizer_matches_legacy():
+    dados = synthetic_records(500, seed=7)
+    assert SPEC_RESERVAS.as_dicts(SPEC_RESERVAS.normalize(dados)) == legacy_reservas.normalize_rows(dados)
+
+
+def test_compiled_normalizer_empty_page():
+    assert SPEC_RESERVAS.normalize(None) == []
+    assert SPEC_RESERVAS.normalize([]) == legacy_reservas.normalize_rows([])
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("62682,65286", ["62682", "65286"]),
+    (" 62682 , ,65286,62682 ", ["62682", "65286"]),
+    (62682, ["62682"]),
+    (["1", 2, " 1 "], ["1", "2"]),
+    ("", []),
+    (None, []),
+])
+def test_split_values(value, expected):
+    assert split_values(value) == expected
+
+
+# -----------------------------------------------------------------------------
+# Upsert: affected-rows -> inseridos/atualizados/inalterados
+# -----------------------------------------------------------------------------
+# Respostas do MySQL sem CLIENT_FOUND_ROWS: affected = inseridas + 2 x
+# atualizadas e Duplicates só conta as duplicadas que mudaram
+@pytest.mark.parametrize("n_rows, affected, info, expected", [
+    # 1 nova (1), 2 alteradas (2 + 2), 2 iguais (0)
+    (5, 5, b"Records: 5  Duplicates: 2  Warnings: 0", (1, 2, 2)),
+    # lote misto: 2 novas, 1 alterada, 1 igual
+    (4, 4, b"Records: 4  Duplicates: 1  Warnings: 0", (2, 1, 1)),
+    # reexecução com os mesmos dados: nada muda
+    (4, 0, b"Records: 4  Duplicates: 0  Warnings: 0", (0, 0, 4)),
+    # tudo novo
+    (3, 3, b"Records: 3  Duplicates: 0  Warnings: 0", (3, 0, 0)),
+    # linha única: 1 = inserida, 2 = atualizada, 0 = inalterada
+    (1, 1, None, (1, 0, 0)),
+    (1, 2, None, (0, 1, 0)),
+    (1, 0, None, (0, 0, 1)),
+    # sem info, multi-row: assume nenhuma inalterada
+    (3, 5, None, (1, 2, 0)),
+])
+def test_count_affected(n_rows, affected, info, expected):
+    stats = _count_affected(n_rows, affected, info)
+    assert (stats.inserted, stats.updated, stats.unchanged) == expected
+    assert stats.rows == n_rows and stats.statements == 1
+
+
+# -----------------------------------------------------------------------------
+# Watermark
+# -----------------------------------------------------------------------------
+def test_watermark_tracker_keeps_max_regardless_of_page_order():
+    tracker = WatermarkTracker()
+    assert tracker.value is None
+    tracker.page_done(3, datetime(2024, 5, 1))
+    tracker.page_done(1, datetime(2024, 6, 1))
+    tracker.page_done(2, None)
+    tracker.page_done(4, datetime(2024, 4, 1))
+    assert tracker.value == datetime(2024, 6, 1)
+
+
+# -----------------------------------------------------------------------------
+# Backfill
+# -----------------------------------------------------------------------------
+def test_date_windows_are_contiguous_and_open_ended():
+    since, until = datetime(2024, 1, 1), datetime(2024, 1, 20)
+    windows = date_windows(since, until, 7)
+    assert windows == [
+        (datetime(2024, 1, 1), datetime(2024, 1, 7, 23, 59, 59)),
+        (datetime(2024, 1, 8), datetime(2024, 1, 14, 23, 59, 59)),
+        (datetime(2024, 1, 15), None),
+    ]
+
+
+def test_date_windows_single_window():
+    assert date_windows(datetime(2024, 1, 1), datetime(2024, 1, 3), 30) == [(datetime(2024, 1, 1), None)]
+    # days < 1 vira 1
+    assert len(date_windows(datetime(2024, 1, 1), datetime(2024, 1, 3), 0)) == 2
+
+
+@pytest.mark.parametrize("total, shards, expected", [
+    (10, 3, [(1, 4), (5, 8), (9, None)]),
+    (10, 1, [(1, None)]),
+    (2, 5, [(1, 1), (2, None)]),
+    (0, 4, [(1, None)]),
+])
+def test_page_ranges(total, shards, expected):
+    assert page_ranges(total, shards) == expected
+
+
+# -----------------------------------------------------------------------------
+# Particionamento
+# -----------------------------------------------------------------------------
+def test_partition_sql():
+    pt = PartitionedTable("cv_visitas", "idtarefa")
+    sql = partition_sql(pt, date(2024, 10, 15), date(2024, 12, 3), 2)
+    assert sql == (
+        "ALTER TABLE cv_visitas MODIFY `data_cad` DATETIME NOT NULL, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (`idtarefa`, `data_cad`) "
+        "PARTITION BY RANGE COLUMNS(`data_cad`) ("
+        "PARTITION p202410 VALUES LESS THAN ('2024-11-01'), "
+        "PARTITION p202411 VALUES LESS THAN ('2024-12-01'), "
+        "PARTITION p202412 VALUES LESS THAN ('2025-01-01'), "
+        "PARTITION p202501 VALUES LESS THAN ('2025-02-01'), "
+        "PARTITION p202502 VALUES LESS THAN ('2025-03-01'), "
+        "PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+    )